@@ -0,0 +1,178 @@
+import io
+import os
+import tarfile
+import threading
+import zipfile
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+class ChunkWriter(io.RawIOBase):
+    """Unseekable sink that hands written bytes on in chunks of chunk_size"""
+
+    def __init__(self, emit: Callable[[bytes], None], chunk_size: int):
+        self.emit = emit
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            self.emit(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+        return len(data)
+
+    def drain(self):
+        """Emit whatever is buffered, even if less than a chunk"""
+        if self.buffer:
+            self.emit(bytes(self.buffer))
+            self.buffer.clear()
+
+def walk_folder(root: str) -> Iterator[Tuple[str, str]]:
+    """(path, name in archive) for every file and empty directory below root"""
+    base = os.path.basename(os.path.normpath(root)) or 'folder'
+    for directory, dirs, files in os.walk(root):
+        relative = os.path.relpath(directory, root)
+        prefix = base if relative == '.' else os.path.join(base, relative)
+        if not dirs and not files:
+            yield directory, prefix.replace(os.sep, '/') + '/'
+        for name in files:
+            yield os.path.join(directory, name), os.path.join(prefix, name).replace(os.sep, '/')
+
+def iter_zip(entries: Iterable[Tuple[str, str]], chunk_size: int,
+             compression: int = zipfile.ZIP_DEFLATED,
+             skipped: Optional[list] = None) -> Iterator[bytes]:
+    """
+    Build a zip archive on the fly and yield it chunk by chunk.
+
+    Files are copied into the archive a chunk at a time and the output is
+    handed out as it is produced, so memory use stays around chunk_size no
+    matter how large the files are. Files that cannot be read are left out
+    and listed in skipped.
+    """
+    pending = []
+    writer = ChunkWriter(pending.append, chunk_size)
+
+    def take():
+        chunks = list(pending)
+        pending.clear()
+        return chunks
+
+    with zipfile.ZipFile(writer, 'w', compression) as archive:
+        for path, name in entries:
+            if name.endswith('/'):
+                archive.writestr(zipfile.ZipInfo(name), b'')
+                continue
+            try:
+                source = open(path, 'rb')
+            except OSError:
+                if skipped is not None:
+                    skipped.append(path)
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, name)
+                info.compress_type = compression
+                with archive.open(info, 'w', force_zip64=True) as target:
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield from take()
+    writer.drain()
+    yield from take()
+
+class GrowingFile(io.RawIOBase):
+    """Reads a file that is still being written, blocking until data arrives"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.condition = threading.Condition()
+        self.available = 0
+        self.finished = False
+        self.aborted = False
+
+    def readable(self) -> bool:
+        return True
+
+    def update(self, available: int, finished: bool = False):
+        with self.condition:
+            self.available = max(self.available, available)
+            self.finished = self.finished or finished
+            self.condition.notify_all()
+
+    def abort(self):
+        with self.condition:
+            self.aborted = True
+            self.condition.notify_all()
+
+    def readinto(self, buffer) -> int:
+        with self.condition:
+            position = self.file.tell()
+            while position >= self.available and not self.finished and not self.aborted:
+                self.condition.wait()
+            if self.aborted:
+                raise OSError('Extraction aborted')
+            size = min(len(buffer), self.available - position)
+        if size <= 0:
+            return 0
+        data = self.file.read(size)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+class StreamingExtractor(threading.Thread):
+    """
+    Unpacks a tar archive while it is still being received.
+
+    The transfer's part file is followed as it grows and fed to tarfile in
+    stream mode, so entries are written out as soon as their bytes arrive
+    and the archive never has to be complete before unpacking starts.
+    """
+
+    def __init__(self, part_path: str, destination: str):
+        super().__init__(daemon=True)
+        self.source = GrowingFile(part_path)
+        self.destination = destination
+        self.error: Optional[Exception] = None
+
+    def update(self, available: int):
+        self.source.update(available)
+
+    def finish(self, size: int):
+        """Wait until everything up to size is unpacked, raising extraction errors"""
+        self.source.update(size, finished=True)
+        self.join()
+        if self.error:
+            raise self.error
+
+    def abort(self):
+        self.source.abort()
+
+    def run(self):
+        try:
+            os.makedirs(self.destination, exist_ok=True)
+            with tarfile.open(fileobj=self.source, mode='r|*') as archive:
+                data_filter = getattr(tarfile, 'data_filter', None)
+                for member in archive:
+                    if data_filter is None and not self._safe(member):
+                        raise ValueError(f"Refusing to extract {member.name}")
+                    if data_filter is not None:
+                        archive.extract(member, self.destination, filter=data_filter)
+                    else:
+                        archive.extract(member, self.destination)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.source.close()
+
+    def _safe(self, member: tarfile.TarInfo) -> bool:
+        """Stay inside the destination on Pythons without extraction filters"""
+        if member.issym() or member.islnk() or member.isdev():
+            return False
+        target = os.path.realpath(os.path.join(self.destination, member.name))
+        return target.startswith(os.path.realpath(self.destination) + os.sep)
@@ -7,22 +7,108 @@ class Config:
     SERVER_HOST = '127.0.0.1'
     SERVER_PORT = 8080
     WEBSOCKET_PORT = 8081
+    SERVER_MODE = 'threading'  # 'async' serves dashboards and students from one event loop (needs aiohttp)
 
     # Security
     SECRET_KEY = 'your-secret-key-change-in-production'
     AUTH_TOKEN_EXPIRY = 3600  # 1 hour
+    SESSION_TICKET_EXPIRY = 24 * 3600  # seconds a client may resume without registering in full
 
     # Client settings
     CLIENT_HEARTBEAT_INTERVAL = 30  # seconds
+    HEARTBEAT_GRACE = 30  # seconds past a missed heartbeat before a client counts as unresponsive
+    # group name -> {'heartbeat_interval': s, 'grace': s}, the shortest applies to clients in several
+    GROUP_LIVENESS = {}
+    LIVENESS_WHEEL_SLOTS = 1024  # Ticks of DASHBOARD_UPDATE_INTERVAL the liveness wheel spans
+    RECONNECT_BASE_DELAY = 0.5  # seconds, ceiling of the first reconnect delay
+    RECONNECT_MAX_DELAY = 30  # seconds, the ceiling stops doubling here
+    CLIENT_CONFIG_WAIT = 2  # seconds the first frame waits for the server's capture settings
     SCREENSHOT_INTERVAL = 1  # seconds
     REMOTE_CONTROL_SCREENSHOT_INTERVAL = 0.5
     SCREENSHOT_QUALITY = 30
 
+    # Dashboard thumbnails
+    THUMBNAIL_SIZE = (200, 150)
+    LARGE_VIEW_SIZE = (1280, 960)
+    LARGE_VIEW_INTERVAL = 0.5  # seconds
+    THUMBNAIL_WORKERS = None  # Defaults to the number of CPUs
+    DASHBOARD_UPDATE_INTERVAL = 0.25  # seconds between batched grid updates
+
+    # Idle screen suppression
+    IDLE_HASH_SIZE = 64  # Perceptual hash grid is IDLE_HASH_SIZE x IDLE_HASH_SIZE cells
+    IDLE_HASH_TOLERANCE = 2  # Brightness change per cell treated as noise
+    IDLE_HASH_THRESHOLD = 0  # Changed cells still considered unchanged
+    IDLE_REFRESH_INTERVAL = 30  # seconds, send a real frame at least this often
+    ACTIVITY_WINDOW = 300  # seconds of history for activity scores
+
+    # Remote control delta encoding
+    REMOTE_CONTROL_DELTA_INTERVAL = 0.1
+    REMOTE_TILE_SIZE = 64  # pixels
+    REMOTE_KEYFRAME_INTERVAL = 50  # frames
+
+    # Remote control rate adaptation
+    REMOTE_TARGET_LATENCY = 0.15  # seconds
+    REMOTE_RTT_PROBE_INTERVAL = 0.5  # seconds
+    REMOTE_MAX_QUEUE = 64 * 1024  # bytes waiting in the send buffer
+    REMOTE_UPGRADE_SAMPLES = 4  # good probes in a row before stepping up
+    # (JPEG quality, scale, frame interval) from cheapest to best
+    REMOTE_QUALITY_LEVELS = [
+        [20, 0.5, 0.5],
+        [25, 0.6, 0.33],
+        [30, 0.75, 0.25],
+        [40, 0.85, 0.15],
+        [50, 1.0, 0.1],
+        [60, 1.0, 0.066]
+    ]
+    REMOTE_START_LEVEL = 2
+
     # File transfer
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
     UPLOAD_FOLDER = 'uploads'
+    UPLOAD_EXPIRY = 24 * 3600  # seconds an upload is kept after it was last sent
+    TRANSFER_CHUNK_SIZE = 256 * 1024  # bytes read and acknowledged at a time
+    TRANSFER_WINDOW = 4  # unacknowledged chunks per transfer
+    TRANSFER_PROGRESS_INTERVAL = 0.5  # seconds between dashboard progress events
+    TRANSFER_PART_EXPIRY = 24 * 3600  # seconds before an abandoned part file is removed
+    FILE_PAGE_SIZE = 200  # directory entries per page in the file manager
+    FILE_LISTING_CACHE = 8  # listings kept for paging
+    FILE_SEARCH_BATCH = 100  # matches per search update
+    FILE_SEARCH_FLUSH_INTERVAL = 0.5  # seconds, send partial batches at least this often
+    FILE_SEARCH_MAX_RESULTS = 2000
+    ARCHIVE_CHUNK_SIZE = 256 * 1024  # bytes per message of a folder streamed as a zip
+    COLLECTION_FOLDER = os.path.join('uploads', 'collections')  # folders collected from clients
+    COLLECTION_RETENTION = 24 * 3600  # seconds a collection stays after its last activity or download
+    ARTIFACT_CACHE_SIZE = 2 * 1024 * 1024 * 1024  # bytes of programs kept on each client
+
+    # Peer-assisted distribution to the whole classroom
+    SWARM_PORT = 9998  # TCP port students share chunks on
+    SWARM_MIN_SIZE = 16 * 1024 * 1024  # smaller files go to each client directly
+    SWARM_CHUNK_SIZE = 1024 * 1024
+    SWARM_SEEDS = 2  # students the server sends each chunk to
+    SWARM_PARALLEL = 4  # chunks fetched from peers at once
+    SWARM_PEER_SAMPLE = 8  # peers asked for their chunk map each round
+    SWARM_PEER_REFRESH = 5  # seconds between peer list lookups
+    SWARM_PEER_TIMEOUT = 5  # seconds
+    SWARM_RETRY_INTERVAL = 1  # seconds between rounds that found nothing
+    SWARM_STALL_TIMEOUT = 10  # seconds without progress before asking the server
+    SWARM_LINGER = 120  # seconds a finished student keeps sharing
+    SWARM_DEADLINE = 30 * 60  # seconds after which members that dropped out count as failed
+
+    # Commands sent to many clients
+    BROADCAST_TIMEOUT = 5  # seconds to wait for each client's acknowledgement
+    GROUPS_FILE = 'groups.json'
+
+    # Several teacher servers sharing one class
+    CLUSTER_BROKER = None  # 'host:port' of a broker (python -m teacher_server.cluster), None for one server
+    CLUSTER_PORT = 8090
+    CLUSTER_RETRY_INTERVAL = 2  # seconds between broker connection attempts
+    CLUSTER_COMMAND_GRACE = 2  # seconds on top of BROADCAST_TIMEOUT for another node's result
+    CLUSTER_BROKER_BUFFER = 4 * 1024 * 1024  # bytes queued for a slow node before its frames are dropped
+    CLUSTER_READ_TIMEOUT = 10  # seconds to wait for a chunk of an upload stored on another node
 
     # Network
+    INGEST_WORKERS = 0  # Processes accepting student connections, 0 accepts them in the dashboard process
+    SEND_CHUNK_SIZE = 64 * 1024  # Large frames are fragmented to this size
     DISCOVERY_PORT = 9999
     BROADCAST_INTERVAL = 10
 
@@ -1,6 +1,8 @@
 from enum import Enum
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, Optional, Union
+import base64
 import json
+import struct
 import time
 
 class MessageType(Enum):
@@ -11,11 +13,13 @@ class MessageType(Enum):
     # Screen sharing
     SCREENSHOT_REQUEST = "screenshot_request"
     SCREENSHOT_RESPONSE = "screenshot_response"
+    SCREEN_UNCHANGED = "screen_unchanged"
 
     # Remote control
     REMOTE_CONTROL_START = "remote_control_start"
     REMOTE_CONTROL_STOP = "remote_control_stop"
     REMOTE_INPUT = "remote_input"
+    REMOTE_SESSION_STATS = "remote_session_stats"
 
     # File operations
     FILE_UPLOAD = "file_upload"
@@ -24,6 +28,19 @@ class MessageType(Enum):
     FILE_LIST = "file_list"
     FILE_MANAGER = "file_manager"
 
+    # Chunked file transfer
+    TRANSFER_START = "transfer_start"
+    TRANSFER_CHUNK = "transfer_chunk"
+    TRANSFER_ACK = "transfer_ack"
+    TRANSFER_COMPLETE = "transfer_complete"
+
+    # Peer-assisted distribution to many clients
+    SWARM_START = "swarm_start"
+    SWARM_CHUNK = "swarm_chunk"
+    SWARM_HAVE = "swarm_have"
+    SWARM_REQUEST = "swarm_request"
+    SWARM_COMPLETE = "swarm_complete"
+
     # Power management
     POWER_SHUTDOWN = "power_shutdown"
     POWER_RESTART = "power_restart"
@@ -38,24 +55,92 @@ class MessageType(Enum):
     EXECUTE_PROGRAM = "execute_program"
     PROGRAM_RESULT = "program_result"
 
+    # Client configuration pushed by the server
+    CLIENT_CONFIG = "client_config"
+
+    # Acknowledgement of a command that asked for one
+    COMMAND_ACK = "command_ack"
+
     # Status updates
     STATUS_UPDATE = "status_update"
     ERROR = "error"
     SUCCESS = "success"
 
+# Capabilities negotiated at CLIENT_REGISTER
+CAPABILITY_BINARY = "binary"
+CAPABILITY_TILES = "tiles"
+CAPABILITY_THUMBNAIL = "thumbnail"
+CAPABILITY_IDLE = "idle"
+CAPABILITY_ADAPTIVE = "adaptive"
+CAPABILITY_CHUNKED = "chunked"
+CAPABILITY_TRANSFER = "transfer"
+CAPABILITY_SWARM = "swarm"
+CAPABILITY_ACK = "ack"
+CAPABILITY_INPUT = "input"  # Batched pointer and keyboard events in REMOTE_INPUT
+SUPPORTED_CAPABILITIES = {CAPABILITY_BINARY, CAPABILITY_TILES, CAPABILITY_THUMBNAIL,
+                          CAPABILITY_IDLE, CAPABILITY_ADAPTIVE, CAPABILITY_CHUNKED,
+                          CAPABILITY_TRANSFER, CAPABILITY_SWARM, CAPABILITY_ACK,
+                          CAPABILITY_INPUT}
+
+# Binary frame flags
+FLAG_REMOTE_CONTROL = 0x01
+FLAG_DELTA = 0x02  # Payload holds dirty tiles, data holds the tile layout
+FLAG_THUMBNAIL = 0x04  # Screenshot already downscaled by the client
+
+# Capture modes pushed to clients in CLIENT_CONFIG
+CAPTURE_PAUSED = "paused"
+CAPTURE_THUMBNAIL = "thumbnail"
+CAPTURE_FULL = "full"
+
+# JSON messages carry their payload base64-encoded under these keys,
+# which is what clients and servers without binary framing expect.
+LEGACY_PAYLOAD_KEYS = {
+    MessageType.SCREENSHOT_RESPONSE: 'screenshot',
+    MessageType.EXECUTE_PROGRAM: 'data',
+}
+DEFAULT_PAYLOAD_KEY = 'payload'
+# Every other message type has no payload, its data is left as it is
+PAYLOAD_TYPES = set(LEGACY_PAYLOAD_KEYS) | {
+    MessageType.TRANSFER_CHUNK,
+    MessageType.SWARM_CHUNK,
+    MessageType.FILE_DOWNLOAD,
+}
+
+# Binary frame layout: header, type, client_id, JSON data, raw payload.
+# Header fields: magic, version, flags, timestamp, id, len(type),
+# len(client_id), len(data)
+BINARY_MAGIC = b'CC'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('!2sBBdQBBI')
+
+# Large binary frames may be split into fragments so that other frames can
+# be sent in between. Fragment header fields: magic, version, stream id,
+# fragment index, fragment count
+FRAGMENT_MAGIC = b'CF'
+FRAGMENT_HEADER = struct.Struct('!2sBIII')
+
 class Message:
     def __init__(self, msg_type: MessageType, data: Dict[str, Any] = None,
-                 client_id: str = None, timestamp: float = None):
+                 client_id: str = None, timestamp: float = None,
+                 payload: bytes = None, flags: int = 0):
         self.type = msg_type
         self.data = data or {}
         self.client_id = client_id
         self.timestamp = timestamp or time.time()
         self.id = str(int(self.timestamp * 1000000))  # Microsecond precision
+        self.payload = payload
+        self.flags = flags
 
     def to_json(self) -> str:
+        data = self.data
+        if self.payload is not None:
+            if self.type not in PAYLOAD_TYPES:
+                raise ValueError(f"{self.type.value} messages carry no payload")
+            key = LEGACY_PAYLOAD_KEYS.get(self.type, DEFAULT_PAYLOAD_KEY)
+            data = dict(data, **{key: base64.b64encode(self.payload).decode()})
         return json.dumps({
             'type': self.type.value,
-            'data': self.data,
+            'data': data,
             'client_id': self.client_id,
             'timestamp': self.timestamp,
             'id': self.id
@@ -64,9 +149,90 @@ class Message:
     @classmethod
     def from_json(cls, json_str: str) -> 'Message':
         data = json.loads(json_str)
-        return cls(
-            MessageType(data['type']),
-            data.get('data'),
+        msg_type = MessageType(data['type'])
+        msg_data = data.get('data') or {}
+        payload = None
+        key = LEGACY_PAYLOAD_KEYS.get(msg_type, DEFAULT_PAYLOAD_KEY)
+        if msg_type in PAYLOAD_TYPES and isinstance(msg_data.get(key), str):
+            payload = base64.b64decode(msg_data.pop(key))
+        message = cls(
+            msg_type,
+            msg_data,
             data.get('client_id'),
-            data.get('timestamp')
-        )
\ No newline at end of file
+            data.get('timestamp'),
+            payload=payload
+        )
+        message.id = data.get('id', message.id)
+        return message
+
+    def to_binary(self) -> bytes:
+        """Encode message as a binary frame with the payload appended raw"""
+        msg_type = self.type.value.encode()
+        client_id = (self.client_id or '').encode()
+        data = json.dumps(self.data).encode() if self.data else b''
+        header = BINARY_HEADER.pack(
+            BINARY_MAGIC, BINARY_VERSION, self.flags, self.timestamp,
+            int(self.id), len(msg_type), len(client_id), len(data)
+        )
+        return b''.join((header, msg_type, client_id, data, self.payload or b''))
+
+    @classmethod
+    def from_binary(cls, frame: bytes) -> 'Message':
+        (magic, version, flags, timestamp, msg_id,
+         type_len, client_id_len, data_len) = BINARY_HEADER.unpack_from(frame)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f"Unsupported binary frame {magic!r} v{version}")
+
+        offset = BINARY_HEADER.size
+        msg_type = frame[offset:offset + type_len].decode()
+        offset += type_len
+        client_id = frame[offset:offset + client_id_len].decode() or None
+        offset += client_id_len
+        data = json.loads(frame[offset:offset + data_len]) if data_len else {}
+        offset += data_len
+
+        message = cls(MessageType(msg_type), data, client_id, timestamp,
+                      payload=bytes(frame[offset:]) or None, flags=flags)
+        message.id = str(msg_id)
+        return message
+
+    @classmethod
+    def decode(cls, frame: Union[str, bytes]) -> 'Message':
+        """Decode a WebSocket frame, text frames being JSON"""
+        if isinstance(frame, (bytes, bytearray)):
+            return cls.from_binary(frame)
+        return cls.from_json(frame)
+
+def split_frame(frame: bytes, stream_id: int, chunk_size: int) -> Iterator[bytes]:
+    """Split a binary frame into fragments of at most chunk_size payload bytes"""
+    view = memoryview(frame)
+    count = -(-len(frame) // chunk_size)
+    for index in range(count):
+        header = FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, BINARY_VERSION, stream_id, index, count)
+        yield header + view[index * chunk_size:(index + 1) * chunk_size]
+
+class FragmentAssembler:
+    """Reassembles fragmented frames; other frames pass through unchanged"""
+
+    def __init__(self):
+        self.streams: Dict[int, list] = {}
+
+    def feed(self, frame: Union[str, bytes]) -> Optional[Union[str, bytes]]:
+        """Return a complete frame, or None while a fragmented one is incomplete"""
+        if not isinstance(frame, (bytes, bytearray)) or frame[:2] != FRAGMENT_MAGIC:
+            return frame
+
+        _, version, stream_id, index, count = FRAGMENT_HEADER.unpack_from(frame)
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported fragment v{version}")
+
+        parts = self.streams.setdefault(stream_id, [])
+        if index != len(parts):
+            del self.streams[stream_id]
+            raise ValueError(f"Fragment {index} of stream {stream_id} out of order")
+        parts.append(frame[FRAGMENT_HEADER.size:])
+
+        if len(parts) < count:
+            return None
+        del self.streams[stream_id]
+        return b''.join(parts)
@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+from shared.protocol import MessageType, split_frame
+
+# Priority classes, lower is sent first
+PRIORITY_CONTROL = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+MESSAGE_PRIORITIES = {
+    MessageType.CLIENT_HEARTBEAT: PRIORITY_CONTROL,
+    MessageType.CLIENT_CONFIG: PRIORITY_CONTROL,
+    MessageType.REMOTE_CONTROL_START: PRIORITY_CONTROL,
+    MessageType.REMOTE_CONTROL_STOP: PRIORITY_CONTROL,
+    MessageType.REMOTE_INPUT: PRIORITY_CONTROL,
+    MessageType.REMOTE_SESSION_STATS: PRIORITY_CONTROL,
+    MessageType.POWER_SHUTDOWN: PRIORITY_CONTROL,
+    MessageType.POWER_RESTART: PRIORITY_CONTROL,
+    MessageType.POWER_LOGOFF: PRIORITY_CONTROL,
+    MessageType.POWER_HIBERNATE: PRIORITY_CONTROL,
+    MessageType.SUCCESS: PRIORITY_CONTROL,
+    MessageType.ERROR: PRIORITY_CONTROL,
+    MessageType.TRANSFER_ACK: PRIORITY_CONTROL,
+    MessageType.COMMAND_ACK: PRIORITY_CONTROL,
+    MessageType.MESSAGE_SEND: PRIORITY_CONTROL,
+    MessageType.EXECUTE_PROGRAM: PRIORITY_BULK,
+    MessageType.FILE_UPLOAD: PRIORITY_BULK,
+    MessageType.FILE_DOWNLOAD: PRIORITY_BULK,
+    MessageType.TRANSFER_CHUNK: PRIORITY_BULK,
+    MessageType.SWARM_CHUNK: PRIORITY_BULK,
+}
+
+def priority_for(msg_type: MessageType) -> int:
+    """Priority class of a message type, interactive unless listed"""
+    return MESSAGE_PRIORITIES.get(msg_type, PRIORITY_INTERACTIVE)
+
+class SendScheduler:
+    """
+    Per-connection send queue with priority lanes.
+
+    A single writer task always sends from the highest-priority lane that has
+    work. Large binary frames outside the control lane are split into
+    fragments, and the writer re-checks the lanes after every fragment, so a
+    control message waits for at most one fragment of a bulk transfer.
+    """
+
+    LANES = (PRIORITY_CONTROL, PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+    def __init__(self, websocket, chunk_size: Optional[int] = None):
+        self.websocket = websocket
+        self.chunk_size = chunk_size
+        self.lanes: List[Deque[Tuple[Iterator, int, asyncio.Future]]] = [deque() for _ in self.LANES]
+        self.wakeup = asyncio.Event()
+        self.queued_bytes = 0
+        self.next_stream_id = 0
+        self.error: Optional[Exception] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+        self._fail_pending(ConnectionError("Send scheduler stopped"))
+
+    def put(self, frame: Union[str, bytes], priority: int = PRIORITY_INTERACTIVE) -> asyncio.Future:
+        """Queue a frame, the returned future resolves once it is fully sent"""
+        done = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers never look at the result; mark errors as seen
+        done.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self.error:
+            done.set_exception(self.error)
+            return done
+
+        size = len(frame)
+        if (self.chunk_size and isinstance(frame, bytes) and size > self.chunk_size
+                and priority != PRIORITY_CONTROL):
+            self.next_stream_id += 1
+            frames = split_frame(frame, self.next_stream_id, self.chunk_size)
+        else:
+            frames = iter((frame,))
+
+        self.lanes[priority].append((frames, size, done))
+        self.queued_bytes += size
+        self.wakeup.set()
+        return done
+
+    async def send(self, frame: Union[str, bytes], priority: int = PRIORITY_INTERACTIVE):
+        """Queue a frame and wait until it has been written"""
+        await self.put(frame, priority)
+
+    def _next_lane(self):
+        for lane in self.lanes:
+            if lane:
+                return lane
+        return None
+
+    async def _writer(self):
+        try:
+            while True:
+                lane = self._next_lane()
+                if lane is None:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+
+                frames, size, done = lane[0]
+                frame = next(frames, None)
+                if frame is None:
+                    lane.popleft()
+                    self.queued_bytes -= size
+                    if not done.done():
+                        done.set_result(None)
+                    continue
+
+                await self.websocket.send(frame)
+                # send() may complete without suspending; yield so frames
+                # queued from other threads get a chance to jump ahead
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail_pending(e)
+
+    def _fail_pending(self, error: Exception):
+        self.error = error
+        for lane in self.lanes:
+            while lane:
+                _, _, done = lane.popleft()
+                if not done.done():
+                    done.set_exception(error)
+        self.queued_bytes = 0
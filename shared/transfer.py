@@ -0,0 +1,388 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+import zlib
+from typing import Awaitable, Callable, Dict, Optional
+
+from shared.config import Config
+from shared.protocol import Message, MessageType
+
+def file_digest(path: str, length: Optional[int] = None) -> str:
+    """SHA-256 of a file, or of its first length bytes, read chunk by chunk"""
+    digest = hashlib.sha256()
+    remaining = os.path.getsize(path) if length is None else length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(Config.TRANSFER_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def read_chunk(path: str, offset: int, size: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+class OutgoingTransfer:
+    """A file being sent to one peer"""
+
+    def __init__(self, peer: str, path: str, info: dict, sha256: str = None):
+        self.id = uuid.uuid4().hex
+        self.peer = peer
+        self.path = path
+        self.info = info  # purpose, filename and purpose-specific options
+        self.size = os.path.getsize(path)
+        self.sha256 = sha256 or file_digest(path)
+        self.chunk_size = Config.TRANSFER_CHUNK_SIZE
+        self.sent = 0  # Next offset to send
+        self.acked = 0  # Bytes the receiver has written
+        self.status = 'pending'
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.last_progress = 0.0
+        self.cached = False  # Receiver already had the content
+
+    def manifest(self) -> dict:
+        return dict(self.info, transfer_id=self.id, size=self.size,
+                    sha256=self.sha256, chunk_size=self.chunk_size)
+
+    def progress(self) -> dict:
+        return {
+            'transfer_id': self.id,
+            'client_id': self.peer,
+            'filename': self.info.get('filename'),
+            'purpose': self.info.get('purpose'),
+            'size': self.size,
+            'acked': self.acked,
+            'status': self.status,
+            'cached': self.cached
+        }
+
+class TransferSender:
+    """
+    Sends files to peers as a stream of acknowledged chunks.
+
+    The file is read one chunk at a time and at most Config.TRANSFER_WINDOW
+    chunks are unacknowledged per transfer, so memory use depends on the
+    chunk size and not on the file size. Transfers outlive the connection:
+    when the peer comes back the transfer is offered again and continues
+    from the offset the receiver reports.
+
+    All methods must be called on the event loop the sender belongs to.
+    """
+
+    def __init__(self, send: Callable[[str, Message], Awaitable],
+                 on_progress: Callable[[dict], None] = None):
+        self.send = send
+        self.on_progress = on_progress
+        self.transfers: Dict[str, OutgoingTransfer] = {}
+
+    def start(self, peer: str, path: str, info: dict, sha256: str = None) -> OutgoingTransfer:
+        transfer = OutgoingTransfer(peer, path, info, sha256)
+        self.transfers[transfer.id] = transfer
+        self._offer(transfer)
+        return transfer
+
+    def peer_connected(self, peer: str):
+        """Offer unfinished transfers again after a reconnect"""
+        for transfer in list(self.transfers.values()):
+            if transfer.peer == peer:
+                self._offer(transfer)
+
+    def peer_disconnected(self, peer: str):
+        for transfer in list(self.transfers.values()):
+            if transfer.peer == peer:
+                self._stop_pump(transfer)
+                transfer.status = 'interrupted'
+                self._progress(transfer, force=True)
+
+    def handle_ack(self, peer: str, data: dict):
+        transfer = self.transfers.get(data.get('transfer_id'))
+        if not transfer or transfer.peer != peer:
+            return
+
+        offset = data.get('offset', 0)
+        if transfer.status == 'offered' or data.get('resend'):
+            # Receiver reported where to continue from: on (re)start, or
+            # after a chunk failed its checksum
+            transfer.sent = transfer.acked = offset
+        else:
+            transfer.acked = max(transfer.acked, offset)
+        transfer.status = 'sending'
+        transfer.wakeup.set()
+        self._progress(transfer)
+
+        if transfer.sent < transfer.size and (not transfer.task or transfer.task.done()):
+            transfer.task = asyncio.create_task(self._pump(transfer))
+
+    def handle_complete(self, peer: str, data: dict):
+        transfer = self.transfers.get(data.get('transfer_id'))
+        if not transfer or transfer.peer != peer:
+            return
+        del self.transfers[transfer.id]
+        self._stop_pump(transfer)
+        if data.get('status') == 'success':
+            transfer.status = 'complete'
+            transfer.acked = transfer.size
+            transfer.cached = data.get('cached', False)
+        else:
+            transfer.status = 'error'
+            print(f"Transfer {transfer.id} to {peer} failed: {data.get('message')}")
+        self._progress(transfer, force=True)
+
+    def _offer(self, transfer: OutgoingTransfer):
+        self._stop_pump(transfer)
+        transfer.status = 'offered'
+        message = Message(MessageType.TRANSFER_START, transfer.manifest())
+        asyncio.create_task(self._send(transfer, message))
+        self._progress(transfer, force=True)
+
+    def _stop_pump(self, transfer: OutgoingTransfer):
+        if transfer.task:
+            transfer.task.cancel()
+            transfer.task = None
+
+    async def _send(self, transfer: OutgoingTransfer, message: Message) -> bool:
+        try:
+            await self.send(transfer.peer, message)
+            return True
+        except Exception as e:
+            # The peer is gone; the transfer resumes when it reconnects
+            print(f"Transfer {transfer.id} to {transfer.peer} paused: {e}")
+            return False
+
+    async def _pump(self, transfer: OutgoingTransfer):
+        loop = asyncio.get_running_loop()
+        window = Config.TRANSFER_WINDOW * transfer.chunk_size
+
+        while transfer.sent < transfer.size:
+            if transfer.sent - transfer.acked >= window:
+                transfer.wakeup.clear()
+                await transfer.wakeup.wait()
+                continue
+
+            offset = transfer.sent
+            chunk = await loop.run_in_executor(None, read_chunk, transfer.path,
+                                               offset, transfer.chunk_size)
+            if transfer.sent != offset:
+                continue  # Rewound while reading
+            if not chunk:
+                transfer.status = 'error'
+                self._progress(transfer, force=True)
+                return
+
+            transfer.sent = offset + len(chunk)
+            message = Message(MessageType.TRANSFER_CHUNK, {
+                'transfer_id': transfer.id,
+                'offset': offset,
+                'crc32': zlib.crc32(chunk)
+            }, payload=chunk)
+            if not await self._send(transfer, message):
+                return
+
+    def _progress(self, transfer: OutgoingTransfer, force: bool = False):
+        now = time.monotonic()
+        if not self.on_progress:
+            return
+        if not force and now - transfer.last_progress < Config.TRANSFER_PROGRESS_INTERVAL:
+            return
+        transfer.last_progress = now
+        self.on_progress(transfer.progress())
+
+class IncomingTransfer:
+    """A file being received into a part file next to its manifest"""
+
+    def __init__(self, manifest: dict, directory: str):
+        self.id = manifest['transfer_id']
+        self.manifest = manifest
+        self.size = manifest['size']
+        self.part_path = os.path.join(directory, f"{self.id}.part")
+        self.meta_path = os.path.join(directory, f"{self.id}.json")
+        self.digest = hashlib.sha256()
+        self.offset = 0
+        self.file = None
+
+    def open(self) -> int:
+        """Open the part file, keeping data from an earlier attempt, and return the offset"""
+        self.close()
+        resume = False
+        if os.path.exists(self.meta_path) and os.path.exists(self.part_path):
+            with open(self.meta_path) as f:
+                previous = json.load(f)
+            resume = previous.get('sha256') == self.manifest['sha256'] and \
+                previous.get('size') == self.size
+
+        if not resume:
+            with open(self.meta_path, 'w') as f:
+                json.dump(self.manifest, f)
+            open(self.part_path, 'wb').close()
+
+        self.file = open(self.part_path, 'r+b')
+        self.offset = min(os.path.getsize(self.part_path), self.size)
+        self.file.truncate(self.offset)
+
+        # Rebuild the running hash from what is already on disk
+        self.digest = hashlib.sha256()
+        self.file.seek(0)
+        remaining = self.offset
+        while remaining > 0:
+            chunk = self.file.read(min(Config.TRANSFER_CHUNK_SIZE, remaining))
+            self.digest.update(chunk)
+            remaining -= len(chunk)
+        self.file.seek(self.offset)
+        return self.offset
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.file.flush()
+        self.digest.update(data)
+        self.offset += len(data)
+
+    @property
+    def complete(self) -> bool:
+        return self.offset >= self.size
+
+    def verify(self) -> bool:
+        return self.digest.hexdigest() == self.manifest['sha256']
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        self.close()
+        for path in (self.part_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+class TransferReceiver:
+    """
+    Receives chunked transfers and acknowledges each written chunk.
+
+    Part files are kept across reconnects so an interrupted transfer resumes
+    from the last written offset. on_complete gets the manifest and the
+    verified part file and moves it to wherever it belongs.
+
+    lookup may return a local file that already has the manifest's content;
+    the transfer then completes straight away and no data is sent.
+    on_complete must not move such a file, it can tell by the manifest's
+    'cached' flag.
+
+    on_write, when given, is told how far the part file has been written
+    after every chunk so the data can be consumed while it arrives;
+    on_abort is called with the transfer id when such a transfer fails.
+    """
+
+    def __init__(self, directory: str, send: Callable[[Message], Awaitable],
+                 on_complete: Callable[[dict, str], Awaitable],
+                 lookup: Callable[[dict], Optional[str]] = None,
+                 on_write: Callable[[dict, str, int], None] = None,
+                 on_abort: Callable[[str], None] = None):
+        self.directory = directory
+        self.send = send
+        self.on_complete = on_complete
+        self.lookup = lookup
+        self.on_write = on_write
+        self.on_abort = on_abort
+        self.transfers: Dict[str, IncomingTransfer] = {}
+        os.makedirs(directory, exist_ok=True)
+        self.remove_expired()
+
+    def remove_expired(self):
+        """Delete part files of transfers that were never resumed"""
+        cutoff = time.time() - Config.TRANSFER_PART_EXPIRY
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    async def handle_start(self, manifest: dict):
+        cached = self.lookup(manifest) if self.lookup else None
+        if cached:
+            self._discard(manifest['transfer_id'])
+            manifest = dict(manifest, cached=True)
+            await self._complete(manifest, cached)
+            return
+
+        transfer = self.transfers.get(manifest['transfer_id'])
+        if transfer is None:
+            transfer = IncomingTransfer(manifest, self.directory)
+            self.transfers[transfer.id] = transfer
+        try:
+            transfer.open()
+        except OSError as e:
+            await self._finish(transfer, error=str(e))
+            return
+
+        self._written(transfer)
+        await self._ack(transfer)
+        if transfer.complete:
+            await self._finish(transfer)
+
+    async def handle_chunk(self, data: dict, payload: bytes):
+        transfer = self.transfers.get(data.get('transfer_id'))
+        # Chunks sent before a rewind arrive with an old offset; drop them
+        if not transfer or transfer.file is None or data.get('offset') != transfer.offset:
+            return
+        payload = payload or b''
+        if zlib.crc32(payload) != data.get('crc32'):
+            await self._ack(transfer, resend=True)
+            return
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, transfer.write, payload)
+        except OSError as e:
+            await self._finish(transfer, error=str(e))
+            return
+
+        self._written(transfer)
+        await self._ack(transfer)
+        if transfer.complete:
+            await self._finish(transfer)
+
+    def _written(self, transfer: IncomingTransfer):
+        if self.on_write:
+            self.on_write(transfer.manifest, transfer.part_path, transfer.offset)
+
+    async def _ack(self, transfer: IncomingTransfer, resend: bool = False):
+        data = {'transfer_id': transfer.id, 'offset': transfer.offset}
+        if resend:
+            data['resend'] = True
+        await self.send(Message(MessageType.TRANSFER_ACK, data))
+
+    def _discard(self, transfer_id: str):
+        transfer = self.transfers.pop(transfer_id, None)
+        if transfer:
+            transfer.discard()
+
+    async def _finish(self, transfer: IncomingTransfer, error: str = None):
+        self.transfers.pop(transfer.id, None)
+        transfer.close()
+        if error is None and not transfer.verify():
+            error = 'Checksum mismatch'
+        if error is None:
+            await self._complete(transfer.manifest, transfer.part_path)
+        else:
+            if self.on_abort:
+                self.on_abort(transfer.id)
+            await self.send(Message(MessageType.TRANSFER_COMPLETE, {
+                'transfer_id': transfer.id, 'status': 'error', 'message': error
+            }))
+        transfer.discard()
+
+    async def _complete(self, manifest: dict, path: str):
+        result = {'transfer_id': manifest['transfer_id'], 'cached': manifest.get('cached', False)}
+        try:
+            result.update(status='success', path=await self.on_complete(manifest, path))
+        except Exception as e:
+            result.update(status='error', message=str(e))
+        await self.send(Message(MessageType.TRANSFER_COMPLETE, result))
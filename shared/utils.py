@@ -1,7 +1,5 @@
 import socket
 import hashlib
-import base64
-import os
 import platform
 from typing import Optional, Tuple
 
@@ -20,17 +18,6 @@ def generate_client_id() -> str:
     machine_info = f"{platform.node()}-{platform.machine()}-{platform.system()}"
     return hashlib.md5(machine_info.encode()).hexdigest()[:12]
 
-def encode_file(file_path: str) -> str:
-    """Encode file to base64 string"""
-    with open(file_path, 'rb') as f:
-        return base64.b64encode(f.read()).decode()
-
-def decode_file(encoded_data: str, output_path: str) -> None:
-    """Decode base64 string to file"""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'wb') as f:
-        f.write(base64.b64decode(encoded_data))
-
 def is_admin() -> bool:
     """Check if running with admin privileges"""
     try:
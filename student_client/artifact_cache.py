@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from shared.config import Config
+
+class ArtifactCache:
+    """
+    On-disk cache of received programs, keyed by their SHA-256.
+
+    Files are named after their hash, so a transfer whose manifest hash is
+    already cached completes without any data being sent. The cache is
+    bounded in bytes and evicts the least recently used artifacts; access
+    order survives restarts through the files' modification times.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = None):
+        self.directory = directory
+        self.max_bytes = max_bytes or Config.ARTIFACT_CACHE_SIZE
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, int]" = OrderedDict()  # sha256 -> size, oldest first
+        self.total = 0
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total += size
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256)
+
+    def get(self, sha256: str) -> Optional[str]:
+        """Path of a cached artifact, marking it as recently used"""
+        with self.lock:
+            if sha256 not in self.entries:
+                return None
+            path = self.path(sha256)
+            if not os.path.exists(path):
+                self.total -= self.entries.pop(sha256)
+                return None
+            self.entries.move_to_end(sha256)
+        os.utime(path)
+        return path
+
+    def put(self, sha256: str, source: str) -> Optional[str]:
+        """Move a verified file into the cache, None if it is too large to keep"""
+        size = os.path.getsize(source)
+        if size > self.max_bytes:
+            return None
+
+        path = self.path(sha256)
+        with self.lock:
+            if source != path:
+                os.replace(source, path)
+            if sha256 in self.entries:
+                self.total -= self.entries.pop(sha256)
+            self.entries[sha256] = size
+            self.total += size
+            self.evict()
+        os.utime(path)
+        return path
+
+    def evict(self):
+        """Drop least recently used artifacts until the cache fits its bound"""
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            sha256, size = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.remove(self.path(sha256))
+            except OSError:
+                pass
@@ -3,26 +3,66 @@ import websockets
 import json
 import time
 import threading
-import base64
 import os
 import subprocess
-import pyautogui
-from PIL import ImageGrab
-import io
 import shutil
+import tempfile
 import zipfile
 
 from shared.config import Config
-from shared.protocol import Message, MessageType
-from shared.utils import generate_client_id, get_machine_info, encode_file, decode_file
+from shared.protocol import (Message, MessageType, CAPABILITY_BINARY, CAPABILITY_TILES,
+                             CAPABILITY_IDLE, CAPABILITY_ADAPTIVE, CAPABILITY_CHUNKED,
+                             CAPABILITY_SWARM, CAPABILITY_THUMBNAIL, SUPPORTED_CAPABILITIES,
+                             CAPTURE_THUMBNAIL, FragmentAssembler)
+from shared.scheduler import SendScheduler, priority_for
+from shared.transfer import TransferReceiver
+from shared.utils import generate_client_id, get_local_ip, get_machine_info
+from student_client.screen_capture import (CapturePipeline, CaptureStats, FrameBuffer,
+                                           grab_screen, list_monitors, region_bbox)
+from student_client.rate_control import RateController
+from student_client.reconnect import Backoff
+from student_client.remote_control import RemoteInput
+from student_client.artifact_cache import ArtifactCache
+from student_client.swarm import SwarmPeer
+from student_client.file_manager import FileManager
 
 class StudentClient:
     def __init__(self):
         self.client_id = generate_client_id()
         self.server_uri = f"ws://{Config.SERVER_HOST}:{Config.WEBSOCKET_PORT}"
         self.websocket = None
+        self.scheduler = None
         self.is_running = False
         self.remote_control_active = False
+        self.capabilities = set()
+        # Lets the next connection, even to a restarted server, skip full registration
+        self.session_ticket = None
+        self.backoff = Backoff()
+        self.configured = None  # Set once the server sent capture settings on this connection
+        self.heartbeat_interval = Config.CLIENT_HEARTBEAT_INTERVAL  # The server may set it per group
+        self.heartbeat_changed = None
+        # Set by the server through CLIENT_CONFIG, None sends full frames
+        self.thumbnail_size = None
+        self.capture_mode = CAPTURE_THUMBNAIL
+        self.capture_interval = Config.SCREENSHOT_INTERVAL
+        self.capture_bbox = None  # Monitor or rectangle the dashboard zoomed into
+        self.capture_stats = CaptureStats()
+        self.pipeline = None
+        self.rate_controller = RateController()
+        self.remote_input = RemoteInput()
+        self.file_manager = FileManager(self.send_message)
+        self.work_dir = os.path.join(tempfile.gettempdir(), 'claude_classroom')
+        # Programs are kept by content hash so repeat runs skip the transfer
+        self.artifacts = ArtifactCache(os.path.join(self.work_dir, 'artifacts'))
+        # Part files live here until a transfer completes, across reconnects
+        self.transfers = TransferReceiver(os.path.join(self.work_dir, 'transfers'),
+                                          self.send_message, self.transfer_complete,
+                                          lookup=self.cached_artifact,
+                                          on_write=self.transfer_written,
+                                          on_abort=self.file_manager.abort_extract)
+        self.swarm = SwarmPeer(self.client_id, os.path.join(self.work_dir, 'swarm'),
+                               self.send_message, self.transfer_complete,
+                               lookup=self.cached_artifact)
 
     def start(self):
         self.is_running = True
@@ -39,78 +79,224 @@ class StudentClient:
         asyncio.run(self.main_loop())
 
     async def main_loop(self):
+        # Other students fetch swarm chunks from this port
+        await self.swarm.start()
         while self.is_running:
             try:
-                async with websockets.connect(self.server_uri) as websocket:
+                # Servers without fragmenting send whole programs in one frame
+                async with websockets.connect(self.server_uri,
+                                              max_size=Config.MAX_FILE_SIZE * 2) as websocket:
                     self.websocket = websocket
                     await self.register()
-
-                    # Start heartbeat and screenshot tasks
-                    heartbeat_task = asyncio.create_task(self.send_heartbeat())
-                    screenshot_task = asyncio.create_task(self.send_screenshots())
-
-                    await self.listen_for_commands()
-
-            except (websockets.exceptions.ConnectionClosed, OSError):
-                print("Connection lost. Reconnecting...")
-                await asyncio.sleep(5)
+                    self.backoff.reset()
+                    await self.run_connection(websocket)
+
+            except (websockets.exceptions.WebSocketException, OSError, asyncio.TimeoutError):
+                pass
+            if self.is_running:
+                # Jittered, so a restarted server is not hit by every client at once
+                delay = self.backoff.next_delay()
+                print(f"Connection lost. Reconnecting in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+    async def run_connection(self, websocket):
+        """Run the tasks of one connection until it closes, then cancel them"""
+        # A restarted server knows nothing of a remote-control session or a large view
+        self.remote_control_active = False
+        self.remote_input.release_all()
+        self.capture_mode = CAPTURE_THUMBNAIL
+        self.configured = asyncio.Event()
+        self.heartbeat_changed = asyncio.Event()
+
+        chunked = {CAPABILITY_BINARY, CAPABILITY_CHUNKED} <= self.capabilities
+        self.scheduler = SendScheduler(websocket, Config.SEND_CHUNK_SIZE if chunked else None)
+        self.scheduler.start()
+        tasks = [
+            asyncio.create_task(self.send_heartbeat()),
+            asyncio.create_task(self.send_screenshots()),
+            asyncio.create_task(self.monitor_remote_session())
+        ]
+        try:
+            await self.listen_for_commands()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.scheduler.stop()
 
     async def register(self):
-        machine_info = get_machine_info()
-        message = Message(MessageType.CLIENT_REGISTER, data=machine_info, client_id=self.client_id)
-        await self.websocket.send(message.to_json())
-        print("Registered with server.")
+        capabilities = set(SUPPORTED_CAPABILITIES)
+        if not self.swarm.port:
+            capabilities.discard(CAPABILITY_SWARM)
+
+        response = None
+        if self.session_ticket:
+            # The address may have changed since the ticket was issued
+            await self.websocket.send(Message(MessageType.CLIENT_REGISTER, data={
+                'ticket': self.session_ticket,
+                'ip_address': get_local_ip(),
+                'capabilities': sorted(capabilities)
+            }, client_id=self.client_id).to_json())
+            response = Message.decode(await self.websocket.recv())
+            if response.type == MessageType.ERROR:
+                print("Session ticket rejected, registering in full")
+                self.session_ticket = None
+                response = None
+
+        if response is None:
+            machine_info = get_machine_info()
+            machine_info['monitors'] = list_monitors()
+            if self.swarm.port:
+                machine_info['swarm_port'] = self.swarm.port
+            machine_info['capabilities'] = sorted(capabilities)
+            message = Message(MessageType.CLIENT_REGISTER, data=machine_info, client_id=self.client_id)
+            await self.websocket.send(message.to_json())
+            response = Message.decode(await self.websocket.recv())
+
+        # Servers without capability negotiation answer with a plain SUCCESS
+        self.capabilities = set(response.data.get('capabilities', [])) & SUPPORTED_CAPABILITIES
+        self.session_ticket = response.data.get('ticket')
+        print(f"Registered with server. Capabilities: {sorted(self.capabilities)}")
+
+    async def send_message(self, message: Message):
+        """
+        Send message using binary framing when the server supports it.
+
+        Messages go through the priority scheduler, so heartbeats and session
+        stats overtake screenshots and program results.
+        """
+        message.client_id = message.client_id or self.client_id
+        if CAPABILITY_BINARY in self.capabilities:
+            frame = message.to_binary()
+        else:
+            frame = message.to_json()
+        await self.scheduler.send(frame, priority_for(message.type))
 
     async def send_heartbeat(self):
         while self.is_running:
-            message = Message(MessageType.CLIENT_HEARTBEAT, client_id=self.client_id)
-            await self.websocket.send(message.to_json())
-            await asyncio.sleep(Config.CLIENT_HEARTBEAT_INTERVAL)
+            message = Message(MessageType.CLIENT_HEARTBEAT,
+                              data={'capture_stats': self.capture_stats.snapshot()},
+                              client_id=self.client_id)
+            await self.send_message(message)
+            # A new interval takes effect right away, the server already expects it
+            self.heartbeat_changed.clear()
+            try:
+                await asyncio.wait_for(self.heartbeat_changed.wait(), self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
 
     async def send_screenshots(self):
-        """Mengirim screenshot secara berkala dengan interval yang berbeda."""
-        while self.is_running:
+        """
+        Kirim frame yang dihasilkan oleh pipeline capture.
+
+        Grab dan encode berjalan di thread pipeline, loop ini hanya mengambil
+        frame terbaru yang siap dan mengirimkannya.
+        """
+        if CAPABILITY_THUMBNAIL in self.capabilities:
+            # The server sends capture settings right after registering; waiting for
+            # them saves a full-size first frame from every client that reconnects
             try:
-                # Jika remote control aktif, kirim gambar lebih cepat
-                if self.remote_control_active:
-                    screenshot = self.capture_screenshot()
-                    # Tambahkan flag untuk menandakan ini adalah update remote control
-                    message = Message(MessageType.SCREENSHOT_RESPONSE,
-                                      data={'screenshot': screenshot, 'is_remote_control': True},
-                                      client_id=self.client_id)
-                    await self.websocket.send(message.to_json())
-                    # Gunakan interval yang lebih cepat
-                    await asyncio.sleep(Config.REMOTE_CONTROL_SCREENSHOT_INTERVAL)
-                else:
-                    # Jika tidak, kirim pembaruan thumbnail seperti biasa
-                    screenshot = self.capture_screenshot()
-                    message = Message(MessageType.SCREENSHOT_RESPONSE,
-                                      data={'screenshot': screenshot, 'is_remote_control': False},
-                                      client_id=self.client_id)
-                    await self.websocket.send(message.to_json())
-                    # Gunakan interval normal
-                    await asyncio.sleep(Config.SCREENSHOT_INTERVAL)
-            except websockets.exceptions.ConnectionClosed:
-                print("Koneksi ditutup saat mengirim screenshot, akan mencoba lagi.")
-                break # Keluar dari loop ini untuk memulai kembali koneksi utama
-            except Exception as e:
-                print(f"Gagal mengirim screenshot: {e}")
-                await asyncio.sleep(Config.SCREENSHOT_INTERVAL) # Tunggu sebelum mencoba lagi
+                await asyncio.wait_for(self.configured.wait(), Config.CLIENT_CONFIG_WAIT)
+            except asyncio.TimeoutError:
+                pass
+
+        loop = asyncio.get_running_loop()
+        frame_ready = asyncio.Event()
+        buffer = FrameBuffer(self.capture_stats,
+                             on_ready=lambda: loop.call_soon_threadsafe(frame_ready.set))
+        self.pipeline = CapturePipeline(buffer, self.capture_stats)
+        self.update_pipeline()
+        self.pipeline.start()
 
-    def capture_screenshot(self) -> str:
         try:
-            screenshot = ImageGrab.grab()
-            buffer = io.BytesIO()
-            screenshot.save(buffer, format='JPEG', quality=Config.SCREENSHOT_QUALITY)
-            return base64.b64encode(buffer.getvalue()).decode()
-        except Exception as e:
-            print(f"Screenshot error: {e}")
-            return ""
+            while self.is_running:
+                await frame_ready.wait()
+                frame_ready.clear()
+                frame = buffer.take()
+                if frame is None:
+                    continue
+
+                message = Message(frame.msg_type,
+                                  data=frame.data,
+                                  client_id=self.client_id,
+                                  payload=frame.payload,
+                                  flags=frame.flags)
+                started = time.perf_counter()
+                try:
+                    await self.send_message(message)
+                except websockets.exceptions.ConnectionClosed:
+                    raise
+                except Exception as e:
+                    print(f"Gagal mengirim screenshot: {e}")
+                    await asyncio.sleep(Config.SCREENSHOT_INTERVAL)  # Tunggu sebelum mencoba lagi
+                    continue
+                self.capture_stats.record('send', time.perf_counter() - started)
+        except websockets.exceptions.ConnectionClosed:
+            print("Koneksi ditutup saat mengirim screenshot, akan mencoba lagi.")
+        finally:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    async def monitor_remote_session(self):
+        """Probe the connection during remote control and adapt the stream to it"""
+        while self.is_running:
+            await asyncio.sleep(Config.REMOTE_RTT_PROBE_INTERVAL)
+            if not self.remote_control_active:
+                continue
+
+            # Pings queue behind frames already sent, so RTT includes that wait
+            timeout = Config.REMOTE_TARGET_LATENCY * 10
+            started = time.perf_counter()
+            try:
+                pong = await self.websocket.ping()
+                await asyncio.wait_for(pong, timeout)
+                rtt = time.perf_counter() - started
+            except asyncio.TimeoutError:
+                rtt = timeout
+            except websockets.exceptions.ConnectionClosed:
+                break
+            queued = self.websocket.transport.get_write_buffer_size() + self.scheduler.queued_bytes
+
+            if self.rate_controller.update(rtt, queued):
+                self.update_pipeline()
+            if CAPABILITY_ADAPTIVE in self.capabilities:
+                message = Message(MessageType.REMOTE_SESSION_STATS,
+                                  data=self.rate_controller.snapshot(),
+                                  client_id=self.client_id)
+                await self.send_message(message)
+
+    def delta_enabled(self) -> bool:
+        return {CAPABILITY_BINARY, CAPABILITY_TILES} <= self.capabilities
+
+    def update_pipeline(self):
+        """Push the current capture settings to the capture thread"""
+        if self.pipeline:
+            self.pipeline.configure(
+                capture_mode=self.capture_mode,
+                interval=self.capture_interval,
+                thumbnail_size=self.thumbnail_size,
+                remote_control=self.remote_control_active,
+                bbox=self.capture_bbox,
+                delta=self.delta_enabled(),
+                idle_suppression=CAPABILITY_IDLE in self.capabilities,
+                remote_quality=self.rate_controller.quality,
+                remote_scale=self.rate_controller.scale,
+                remote_interval=self.rate_controller.interval
+            )
 
     async def listen_for_commands(self):
-        async for message_json in self.websocket:
+        assembler = FragmentAssembler()
+        async for frame in self.websocket:
             try:
-                message = Message.from_json(message_json)
+                frame = assembler.feed(frame)
+                if frame is None:
+                    continue
+                message = Message.decode(frame)
+                # Acknowledge on receipt; power commands may not leave time afterwards
+                if message.data.pop('ack', False):
+                    await self.send_message(Message(MessageType.COMMAND_ACK,
+                                                    data={'id': message.id},
+                                                    client_id=self.client_id))
                 await self.handle_command(message)
             except Exception as e:
                 print(f"Command handling error: {e}")
@@ -128,17 +314,60 @@ class StudentClient:
 
         elif message.type == MessageType.REMOTE_CONTROL_START:
             self.remote_control_active = True
+            self.rate_controller.reset()
+            if self.pipeline:
+                self.pipeline.request_keyframe()
+            self.update_pipeline()
         elif message.type == MessageType.REMOTE_CONTROL_STOP:
             self.remote_control_active = False
+            self.remote_input.release_all()
+            self.update_pipeline()
 
         elif message.type == MessageType.REMOTE_INPUT:
             self.handle_remote_input(message.data)
 
         elif message.type == MessageType.FILE_MANAGER:
-            await self.handle_file_manager(message.data)
+            await self.file_manager.handle(message.data)
+        elif message.type == MessageType.FILE_DOWNLOAD:
+            self.file_manager.start_download(message.data)
 
         elif message.type == MessageType.EXECUTE_PROGRAM:
-            await self.execute_program(message.data)
+            await self.execute_program(message.data, message.payload)
+
+        elif message.type == MessageType.TRANSFER_START:
+            await self.transfers.handle_start(message.data)
+        elif message.type == MessageType.TRANSFER_CHUNK:
+            await self.transfers.handle_chunk(message.data, message.payload)
+        elif message.type == MessageType.SWARM_START:
+            await self.swarm.handle_start(message.data)
+        elif message.type == MessageType.SWARM_CHUNK:
+            await self.swarm.handle_chunk(message.data, message.payload)
+
+        elif message.type == MessageType.CLIENT_CONFIG:
+            self.apply_config(message.data)
+
+    def apply_config(self, data: dict):
+        if 'thumbnail_size' in data:
+            self.thumbnail_size = data['thumbnail_size']
+        if 'capture_mode' in data:
+            self.capture_mode = data['capture_mode']
+        if 'interval' in data:
+            self.capture_interval = data['interval']
+        if 'region' in data:
+            monitors = list_monitors()
+            if data['region'] and not monitors:
+                # Without a monitor list the primary screen is the only monitor
+                monitors = [(0, 0) + grab_screen().size]
+            self.capture_bbox = region_bbox(data['region'], monitors)
+            # Pointer positions from the dashboard are relative to what it sees
+            self.remote_input.area = self.capture_bbox
+        if data.get('heartbeat_interval', self.heartbeat_interval) != self.heartbeat_interval:
+            self.heartbeat_interval = data['heartbeat_interval']
+            if self.heartbeat_changed:
+                self.heartbeat_changed.set()
+        if self.configured:
+            self.configured.set()
+        self.update_pipeline()
 
     def show_message(self, text: str):
         # This will show a message box on the client's screen
@@ -159,53 +388,73 @@ class StudentClient:
         if not self.remote_control_active:
             return
 
-        input_type = data.get('type')
-        if input_type == 'click':
-            x, y = data.get('x'), data.get('y')
-            screen_width, screen_height = pyautogui.size()
-            pyautogui.moveTo(x * screen_width, y * screen_height)
-            pyautogui.click(button='left' if data.get('button') == 0 else 'right')
-        elif input_type == 'key':
-            key = data.get('key')
-            pyautogui.press(key)
-
-    async def handle_file_manager(self, data: dict):
-        operation = data.get('operation')
-        path = data.get('path')
-        response_data = {}
-
+        events = data.get('events')
+        if events is None:
+            # Single click or key press from older dashboards
+            input_type = data.get('type')
+            if input_type == 'click':
+                x, y, button = data.get('x'), data.get('y'), data.get('button', 0)
+                events = [['d', button, x, y], ['u', button, x, y]]
+            elif input_type == 'key':
+                events = [['k', data.get('key'), True], ['k', data.get('key'), False]]
+        if events:
+            self.remote_input.submit(events)
+
+    def cached_artifact(self, manifest: dict):
+        if manifest.get('purpose') != 'execute':
+            return None
+        return self.artifacts.get(manifest['sha256'])
+
+    def transfer_written(self, manifest: dict, path: str, offset: int):
+        if manifest.get('purpose') == 'extract':
+            self.file_manager.extract_progress(manifest, path, offset)
+
+    async def transfer_complete(self, manifest: dict, path: str) -> str:
+        """Move a verified transfer to its destination and act on it"""
+        filename = os.path.basename(manifest['filename'])
+        if manifest.get('purpose') == 'execute':
+            os.makedirs(self.work_dir, exist_ok=True)
+            exe_path = os.path.join(self.work_dir, filename)
+            artifact = path if manifest.get('cached') else self.artifacts.put(manifest['sha256'], path)
+            if artifact:
+                # The cached copy stays untouched if the program modifies itself
+                shutil.copyfile(artifact, exe_path)
+            else:
+                os.replace(path, exe_path)
+            # Run after TRANSFER_COMPLETE has gone out
+            asyncio.create_task(self.run_program(manifest, exe_path))
+            return exe_path
+        if manifest.get('purpose') == 'extract':
+            return await self.file_manager.finish_extract(manifest, path)
+
+        destination = os.path.join(manifest['path'], filename)
+        os.makedirs(manifest['path'], exist_ok=True)
+        shutil.move(path, destination)
+        return destination
+
+    async def execute_program(self, data: dict, file_data: bytes):
+        """Program sent in a single message by servers without chunked transfers"""
+        filename = os.path.basename(data.get('filename'))
         try:
-            if operation == 'list':
-                files = []
-                for item in os.listdir(path):
-                    item_path = os.path.join(path, item)
-                    files.append({
-                        'name': item,
-                        'is_dir': os.path.isdir(item_path),
-                        'size': os.path.getsize(item_path)
-                    })
-                response_data = {'files': files}
-
-            # ... other file operations ...
-
-            response = Message(MessageType.FILE_MANAGER, data=response_data, client_id=self.client_id)
-            await self.websocket.send(response.to_json())
-
+            # Save the executable
+            os.makedirs(self.work_dir, exist_ok=True)
+            exe_path = os.path.join(self.work_dir, filename)
+            with open(exe_path, 'wb') as f:
+                f.write(file_data)
         except Exception as e:
-            print(f"File manager error: {e}")
+            response = Message(MessageType.PROGRAM_RESULT,
+                               data={'status': 'error', 'message': str(e)},
+                               client_id=self.client_id)
+            await self.send_message(response)
+            return
+
+        await self.run_program(data, exe_path)
 
-    async def execute_program(self, data: dict):
-        filename = data.get('filename')
-        file_data = data.get('data')
+    async def run_program(self, data: dict, exe_path: str):
+        filename = os.path.basename(exe_path)
         silent = data.get('silent', False)
-        
-        try:
-            # Save the executable
-            temp_dir = os.path.join(os.environ['TEMP'], 'claude_classroom')
-            os.makedirs(temp_dir, exist_ok=True)
-            exe_path = os.path.join(temp_dir, filename)
-            decode_file(file_data, exe_path)
 
+        try:
             # Execute it
             if silent:
                 subprocess.Popen([exe_path], creationflags=subprocess.CREATE_NO_WINDOW)
@@ -218,7 +467,7 @@ class StudentClient:
             result = {'status': 'error', 'message': str(e)}
         
         response = Message(MessageType.PROGRAM_RESULT, data=result, client_id=self.client_id)
-        await self.websocket.send(response.to_json())
+        await self.send_message(response)
 
 if __name__ == '__main__':
     client = StudentClient()
@@ -0,0 +1,229 @@
+import asyncio
+import fnmatch
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from shared.archive import StreamingExtractor, iter_zip, walk_folder
+from shared.config import Config
+from shared.protocol import Message, MessageType
+
+SORT_KEYS = {
+    'name': lambda entry: entry['name'].casefold(),
+    'size': lambda entry: entry['size'] or 0,
+    'modified': lambda entry: entry['modified'] or 0,
+}
+
+def scan_entry(entry: os.DirEntry) -> dict:
+    """Name, type, size and mtime of a directory entry without extra lookups where possible"""
+    try:
+        is_dir = entry.is_dir(follow_symlinks=False)
+        stat = entry.stat(follow_symlinks=False)
+        size, modified = (None if is_dir else stat.st_size), stat.st_mtime
+    except OSError:
+        is_dir, size, modified = False, None, None
+    return {'name': entry.name, 'is_dir': is_dir, 'size': size, 'modified': modified}
+
+def name_matcher(pattern: Optional[str]) -> Callable[[str], bool]:
+    """Case-insensitive glob when the pattern has wildcards, substring otherwise"""
+    if not pattern:
+        return lambda name: True
+    pattern = pattern.casefold()
+    if any(c in pattern for c in '*?['):
+        return lambda name: fnmatch.fnmatchcase(name.casefold(), pattern)
+    return lambda name: pattern in name.casefold()
+
+def list_directory(path: str, sort: str = 'name', reverse: bool = False,
+                   pattern: str = None) -> List[dict]:
+    """Filtered and sorted entries of a directory, directories first"""
+    matches = name_matcher(pattern)
+    with os.scandir(path) as it:
+        entries = [scan_entry(entry) for entry in it if matches(entry.name)]
+    entries.sort(key=SORT_KEYS.get(sort, SORT_KEYS['name']), reverse=reverse)
+    entries.sort(key=lambda entry: not entry['is_dir'])
+    return entries
+
+class FileManager:
+    """
+    File manager operations requested from the dashboard.
+
+    Directory scans run in worker threads so a huge directory does not stall
+    the client. Listings are sorted and filtered here and sent a page at a
+    time; the dashboard asks for further pages with the listing's cursor.
+    Searches walk the tree in a thread and stream matches in batches until
+    they finish or are cancelled.
+
+    Folders are downloaded as a zip that is built while it is sent, and
+    uploaded as a tar that is unpacked while it is received, so neither side
+    ever holds the whole archive.
+    """
+
+    def __init__(self, send: Callable[[Message], Awaitable]):
+        self.send_message = send
+        self.listings: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self.searches: Dict[str, threading.Event] = {}
+        self.extractors: Dict[str, StreamingExtractor] = {}
+
+    async def send(self, data: dict):
+        await self.send_message(Message(MessageType.FILE_MANAGER, data=data))
+
+    async def handle(self, data: dict):
+        operation = data.get('operation')
+        try:
+            if operation == 'list':
+                await self.list(data)
+            elif operation == 'list_more':
+                await self.send_page(data.get('cursor'), data.get('offset', 0))
+            elif operation == 'search':
+                self.start_search(data)
+            elif operation == 'cancel_search':
+                self.cancel_search(data.get('search_id'))
+        except Exception as e:
+            await self.send({'operation': operation, 'path': data.get('path'), 'error': str(e)})
+
+    async def list(self, data: dict):
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(
+            None, list_directory, data['path'], data.get('sort', 'name'),
+            data.get('reverse', False), data.get('filter'))
+
+        cursor = uuid.uuid4().hex
+        self.listings[cursor] = entries
+        while len(self.listings) > Config.FILE_LISTING_CACHE:
+            self.listings.popitem(last=False)
+        await self.send_page(cursor, 0, path=data['path'])
+
+    async def send_page(self, cursor: str, offset: int, path: str = None):
+        entries = self.listings.get(cursor)
+        if entries is None:
+            raise ValueError('Listing expired, reload the directory')
+        self.listings.move_to_end(cursor)
+
+        end = offset + Config.FILE_PAGE_SIZE
+        await self.send({
+            'operation': 'list',
+            'path': path,
+            'cursor': cursor,
+            'offset': offset,
+            'total': len(entries),
+            'entries': entries[offset:end],
+            'done': end >= len(entries)
+        })
+
+    def start_search(self, data: dict):
+        search_id = data.get('search_id') or uuid.uuid4().hex
+        cancelled = threading.Event()
+        self.searches[search_id] = cancelled
+        loop = asyncio.get_running_loop()
+        thread = threading.Thread(target=self._search, daemon=True,
+                                  args=(loop, search_id, data['path'], data.get('pattern'), cancelled))
+        thread.start()
+
+    def cancel_search(self, search_id: str):
+        cancelled = self.searches.pop(search_id, None)
+        if cancelled:
+            cancelled.set()
+
+    def _search(self, loop, search_id: str, root: str, pattern: str, cancelled: threading.Event):
+        """Walk the tree depth-first, handing matches to the loop in batches"""
+        matches = name_matcher(pattern)
+        batch = []
+        found = scanned = 0
+        flushed = time.monotonic()
+
+        def flush(done=False):
+            message = {'operation': 'search', 'search_id': search_id, 'path': root,
+                       'matches': list(batch), 'scanned': scanned, 'done': done}
+            if done:
+                message['truncated'] = found >= Config.FILE_SEARCH_MAX_RESULTS
+                message['cancelled'] = cancelled.is_set() and not message['truncated']
+            batch.clear()
+            # Wait for the send, so a slow link slows the walk instead of queueing
+            asyncio.run_coroutine_threadsafe(self.send(message), loop).result()
+
+        stack = [root]
+        try:
+            while stack and not cancelled.is_set():
+                directory = stack.pop()
+                try:
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            if cancelled.is_set() or found >= Config.FILE_SEARCH_MAX_RESULTS:
+                                break
+                            scanned += 1
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            if matches(entry.name):
+                                batch.append(dict(scan_entry(entry), path=entry.path))
+                                found += 1
+
+                            if len(batch) >= Config.FILE_SEARCH_BATCH or \
+                                    (batch and time.monotonic() - flushed >= Config.FILE_SEARCH_FLUSH_INTERVAL):
+                                flush()
+                                flushed = time.monotonic()
+                except OSError:
+                    continue  # Unreadable directories are skipped
+                if found >= Config.FILE_SEARCH_MAX_RESULTS:
+                    break
+            flush(done=True)
+        except Exception as e:
+            print(f"Search {search_id} failed: {e}")
+        finally:
+            self.searches.pop(search_id, None)
+
+    def start_download(self, data: dict):
+        """Zip a folder in a thread and stream it to the server as FILE_DOWNLOAD chunks"""
+        loop = asyncio.get_running_loop()
+        thread = threading.Thread(target=self._download, daemon=True,
+                                  args=(loop, data['download_id'], data['path']))
+        thread.start()
+
+    def _download(self, loop, download_id: str, path: str):
+        offset = 0
+
+        def send(data: dict, payload: bytes = None):
+            message = Message(MessageType.FILE_DOWNLOAD, data=dict(data, download_id=download_id),
+                              payload=payload)
+            # Waiting for each write keeps at most one chunk in memory
+            asyncio.run_coroutine_threadsafe(self.send_message(message), loop).result()
+
+        try:
+            if not os.path.isdir(path):
+                raise NotADirectoryError(f"Not a folder: {path}")
+            skipped = []
+            for chunk in iter_zip(walk_folder(path), Config.ARCHIVE_CHUNK_SIZE, skipped=skipped):
+                send({'offset': offset}, chunk)
+                offset += len(chunk)
+            send({'offset': offset, 'done': True, 'skipped': skipped[:100]})
+        except Exception as e:
+            try:
+                send({'offset': offset, 'done': True, 'error': str(e)})
+            except Exception:
+                print(f"Folder download {download_id} failed: {e}")
+
+    def extract_progress(self, manifest: dict, part_path: str, offset: int):
+        """Unpack an uploaded folder as far as its part file has been received"""
+        extractor = self.extractors.get(manifest['transfer_id'])
+        if extractor is None:
+            extractor = StreamingExtractor(part_path, manifest['path'])
+            self.extractors[manifest['transfer_id']] = extractor
+            extractor.start()
+        extractor.update(offset)
+
+    async def finish_extract(self, manifest: dict, part_path: str) -> str:
+        extractor = self.extractors.pop(manifest['transfer_id'], None)
+        if extractor is None:
+            # Every chunk was already on disk, e.g. after a restart
+            extractor = StreamingExtractor(part_path, manifest['path'])
+            extractor.start()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, extractor.finish, manifest['size'])
+        return manifest['path']
+
+    def abort_extract(self, transfer_id: str):
+        extractor = self.extractors.pop(transfer_id, None)
+        if extractor:
+            extractor.abort()
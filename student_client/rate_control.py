@@ -0,0 +1,70 @@
+from typing import Optional
+
+from shared.config import Config
+
+class RateController:
+    """
+    Picks JPEG quality, scale and frame interval for a remote-control session.
+
+    Settings come from a ladder of levels in Config.REMOTE_QUALITY_LEVELS,
+    ordered from cheapest to best. After each measurement of round-trip time
+    and send-queue depth the controller steps down quickly when the link is
+    congested and climbs back one level at a time once it has had headroom
+    for a few consecutive samples.
+    """
+
+    def __init__(self, target_latency: float = None):
+        self.target_latency = target_latency or Config.REMOTE_TARGET_LATENCY
+        self.levels = Config.REMOTE_QUALITY_LEVELS
+        self.level = Config.REMOTE_START_LEVEL
+        self.good_samples = 0
+        self.rtt: Optional[float] = None
+        self.queued = 0
+
+    @property
+    def quality(self) -> int:
+        return self.levels[self.level][0]
+
+    @property
+    def scale(self) -> float:
+        return self.levels[self.level][1]
+
+    @property
+    def interval(self) -> float:
+        return self.levels[self.level][2]
+
+    def reset(self):
+        self.level = Config.REMOTE_START_LEVEL
+        self.good_samples = 0
+
+    def update(self, rtt: float, queued: int) -> bool:
+        """Feed a measurement, returns True when the settings changed"""
+        self.rtt = rtt
+        self.queued = queued
+        previous = self.level
+
+        if rtt > self.target_latency or queued > Config.REMOTE_MAX_QUEUE:
+            # Far over target: drop two levels at once
+            step = 2 if rtt > 2 * self.target_latency else 1
+            self.level = max(0, self.level - step)
+            self.good_samples = 0
+        elif rtt < self.target_latency / 2 and queued == 0:
+            self.good_samples += 1
+            if self.good_samples >= Config.REMOTE_UPGRADE_SAMPLES:
+                self.level = min(len(self.levels) - 1, self.level + 1)
+                self.good_samples = 0
+        else:
+            self.good_samples = 0
+
+        return self.level != previous
+
+    def snapshot(self) -> dict:
+        return {
+            'quality': self.quality,
+            'scale': self.scale,
+            'interval': self.interval,
+            'level': self.level,
+            'rtt_ms': round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            'queued_bytes': self.queued,
+            'target_ms': round(self.target_latency * 1000)
+        }
@@ -0,0 +1,29 @@
+import random
+
+from shared.config import Config
+
+class Backoff:
+    """
+    Delays between reconnect attempts, growing exponentially with full jitter.
+
+    Each delay is drawn uniformly between zero and the current ceiling, so a
+    classroom of clients that lost the server at the same moment comes back
+    spread over the window instead of in lockstep. The ceiling doubles with
+    every failed attempt up to max_delay and drops back once a connection
+    registers again.
+    """
+
+    def __init__(self, base_delay: float = None, max_delay: float = None):
+        self.base_delay = base_delay or Config.RECONNECT_BASE_DELAY
+        self.max_delay = max_delay or Config.RECONNECT_MAX_DELAY
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.max_delay, self.base_delay * 2 ** self.attempts)
+        # Once at max_delay the ceiling stays there, and the exponent stays small
+        if ceiling < self.max_delay:
+            self.attempts += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempts = 0
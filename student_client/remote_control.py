@@ -0,0 +1,128 @@
+import queue
+import threading
+from typing import List, Optional, Set, Tuple
+
+import pyautogui
+
+# Remote input is paced by the dashboard, not by pyautogui's safety pauses
+pyautogui.PAUSE = 0
+pyautogui.FAILSAFE = False
+
+BUTTONS = {0: 'left', 1: 'middle', 2: 'right'}
+
+# Browser KeyboardEvent.key names that differ from pyautogui's
+KEY_NAMES = {
+    'Control': 'ctrl', 'Alt': 'alt', 'AltGraph': 'altright', 'Shift': 'shift', 'Meta': 'win',
+    'Enter': 'enter', 'Backspace': 'backspace', 'Tab': 'tab', 'Escape': 'esc', ' ': 'space',
+    'Delete': 'delete', 'Insert': 'insert', 'Home': 'home', 'End': 'end',
+    'PageUp': 'pageup', 'PageDown': 'pagedown', 'CapsLock': 'capslock',
+    'ArrowLeft': 'left', 'ArrowRight': 'right', 'ArrowUp': 'up', 'ArrowDown': 'down',
+    'ContextMenu': 'apps', 'PrintScreen': 'printscreen', 'NumLock': 'numlock',
+}
+
+def key_name(key: str) -> str:
+    if key in KEY_NAMES:
+        return KEY_NAMES[key]
+    if len(key) > 1 and key[0] == 'F' and key[1:].isdigit():
+        return key.lower()
+    return key if len(key) == 1 else key.lower()
+
+def coalesce(events: List[list]) -> List[list]:
+    """Drop moves that a later move supersedes before anything else happens"""
+    result = []
+    for event in events:
+        if event[0] == 'm' and result and result[-1][0] == 'm':
+            result[-1] = event
+        elif event[0] == 'w' and result and result[-1][0] == 'w':
+            result[-1] = ['w', result[-1][1] + event[1], result[-1][2] + event[2]]
+        else:
+            result.append(event)
+    return result
+
+class RemoteInput:
+    """
+    Replays batched pointer and keyboard input from the dashboard.
+
+    Events arrive as compact lists: ['m', x, y] to move, ['d'|'u', button,
+    x, y] to press or release a mouse button, ['w', dx, dy] to scroll and
+    ['k', key, down] for keys, with x and y relative to the captured area.
+    They are applied in a worker thread; whatever piled up while the
+    previous batch ran is coalesced first, so a slow desktop skips to the
+    latest pointer position instead of replaying every step. Held buttons and keys are
+    tracked so modifier chords and drags work and can be released when the
+    session ends.
+    """
+
+    def __init__(self):
+        self.queue: "queue.Queue[list]" = queue.Queue()
+        self.held_keys: Set[str] = set()
+        self.held_buttons: Set[str] = set()
+        self.area: Optional[Tuple[int, int, int, int]] = None  # Captured area, None is the primary screen
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, events: List[list]):
+        for event in events:
+            self.queue.put(event)
+
+    def release_all(self):
+        self.queue.put(['release'])
+
+    def _run(self):
+        while True:
+            events = [self.queue.get()]
+            while True:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for event in coalesce(events):
+                try:
+                    self.apply(event)
+                except Exception as e:
+                    print(f"Remote input error: {e}")
+
+    def position(self, x: float, y: float):
+        if self.area:
+            left, top, right, bottom = self.area
+        else:
+            left, top = 0, 0
+            right, bottom = pyautogui.size()
+        x = left + min(max(x, 0.0), 1.0) * (right - left - 1)
+        y = top + min(max(y, 0.0), 1.0) * (bottom - top - 1)
+        return round(x), round(y)
+
+    def apply(self, event: list):
+        kind = event[0]
+        if kind == 'm':
+            pyautogui.moveTo(*self.position(event[1], event[2]))
+        elif kind in ('d', 'u'):
+            button = BUTTONS.get(event[1], 'left')
+            x, y = self.position(event[2], event[3])
+            if kind == 'd':
+                pyautogui.mouseDown(x, y, button=button)
+                self.held_buttons.add(button)
+            else:
+                pyautogui.mouseUp(x, y, button=button)
+                self.held_buttons.discard(button)
+        elif kind == 'w':
+            # Browser deltas are pixels; about 100 per wheel notch
+            if event[2]:
+                pyautogui.scroll(-round(event[2] / 100) or (-1 if event[2] > 0 else 1))
+            if event[1]:
+                pyautogui.hscroll(round(event[1] / 100) or (1 if event[1] > 0 else -1))
+        elif kind == 'k':
+            key = key_name(event[1])
+            if event[2]:
+                pyautogui.keyDown(key)
+                self.held_keys.add(key)
+            else:
+                pyautogui.keyUp(key)
+                self.held_keys.discard(key)
+        elif kind == 'release':
+            for button in list(self.held_buttons):
+                pyautogui.mouseUp(button=button)
+            for key in list(self.held_keys):
+                pyautogui.keyUp(key)
+            self.held_buttons.clear()
+            self.held_keys.clear()
@@ -0,0 +1,368 @@
+import ctypes
+import io
+import sys
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageGrab
+
+from shared.config import Config
+from shared.protocol import (MessageType, FLAG_REMOTE_CONTROL, FLAG_DELTA, FLAG_THUMBNAIL,
+                             CAPTURE_PAUSED, CAPTURE_THUMBNAIL, CAPTURE_FULL)
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in desktop pixels
+
+def list_monitors() -> List[Box]:
+    """Bounds of each monitor on the virtual desktop, empty where they cannot be listed"""
+    if sys.platform != 'win32':
+        return []
+    from ctypes import wintypes
+
+    monitors = []
+    callback_type = ctypes.WINFUNCTYPE(ctypes.c_int, wintypes.HMONITOR, wintypes.HDC,
+                                       ctypes.POINTER(wintypes.RECT), wintypes.LPARAM)
+
+    def callback(monitor, dc, rect, data):
+        r = rect.contents
+        monitors.append((r.left, r.top, r.right, r.bottom))
+        return 1
+
+    try:
+        ctypes.windll.user32.EnumDisplayMonitors(None, None, callback_type(callback), 0)
+    except Exception as e:
+        print(f"Monitor enumeration failed: {e}")
+        return []
+    # Primary monitor first, then left to right
+    monitors.sort(key=lambda m: (m[:2] != (0, 0), m[0], m[1]))
+    return monitors
+
+def region_bbox(region: Optional[dict], monitors: List[Box]) -> Optional[Box]:
+    """
+    Desktop pixels covered by a capture region from the dashboard.
+
+    region is {'monitor': n, 'rect': [x, y, width, height]}; monitor 0 is the
+    whole virtual desktop and 1..n are single monitors, rect is optional and
+    relative to that area. None captures the primary screen as before.
+    """
+    if not region:
+        return None
+    index = region.get('monitor', 0)
+    if 1 <= index <= len(monitors):
+        left, top, right, bottom = monitors[index - 1]
+    elif monitors:
+        left, top = min(m[0] for m in monitors), min(m[1] for m in monitors)
+        right, bottom = max(m[2] for m in monitors), max(m[3] for m in monitors)
+    else:
+        return None
+
+    rect = region.get('rect')
+    if rect:
+        x, y, w, h = rect
+        width, height = right - left, bottom - top
+        left, top, right, bottom = (left + round(x * width), top + round(y * height),
+                                    left + round((x + w) * width), top + round((y + h) * height))
+    if right - left < 16 or bottom - top < 16:
+        return None
+    return left, top, right, bottom
+
+def grab_screen(bbox: Optional[Box] = None) -> Image.Image:
+    """Grab the primary screen, or only bbox of the virtual desktop, as an RGB image"""
+    if bbox:
+        return ImageGrab.grab(bbox=bbox, all_screens=True).convert('RGB')
+    return ImageGrab.grab().convert('RGB')
+
+def downscale(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Shrink image in place to fit within size, keeping the aspect ratio"""
+    image.thumbnail(tuple(size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return image
+
+def perceptual_hash(image: Image.Image, size: int = None) -> np.ndarray:
+    """
+    Average-luma hash of a downsampled frame.
+
+    The frame is box-filtered to a size x size grid of mean brightness values;
+    two frames look the same when no cell moved by more than a small tolerance.
+    """
+    size = size or Config.IDLE_HASH_SIZE
+    return np.asarray(image.resize((size, size), Image.Resampling.BOX).convert('L'))
+
+def hash_distance(a: np.ndarray, b: np.ndarray, tolerance: int = None) -> int:
+    """Number of grid cells whose brightness differs beyond the tolerance"""
+    tolerance = Config.IDLE_HASH_TOLERANCE if tolerance is None else tolerance
+    return int(np.count_nonzero(np.abs(a.astype(np.int16) - b) > tolerance))
+
+def encode_jpeg(image: Image.Image, quality: int = None) -> bytes:
+    """Encode image as JPEG bytes"""
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality or Config.SCREENSHOT_QUALITY)
+    return buffer.getvalue()
+
+class TileEncoder:
+    """
+    Encodes a stream of frames as dirty tiles against the previous frame.
+
+    Each encoded frame is described by a list of [x, y, width, height, length]
+    rectangles and a payload that is the concatenation of one JPEG per
+    rectangle, in the same order. Horizontally adjacent dirty tiles are merged
+    into a single rectangle. Keyframes are a single rectangle covering the
+    whole frame and are sent on the first frame, on resolution changes, on
+    request and every Config.REMOTE_KEYFRAME_INTERVAL frames.
+    """
+
+    def __init__(self, tile_size: int = None, keyframe_interval: int = None):
+        self.tile_size = tile_size or Config.REMOTE_TILE_SIZE
+        self.keyframe_interval = keyframe_interval or Config.REMOTE_KEYFRAME_INTERVAL
+        self.previous: Optional[np.ndarray] = None
+        self.frames_since_keyframe = 0
+
+    def request_keyframe(self):
+        """Force the next encoded frame to be a keyframe"""
+        self.previous = None
+
+    def dirty_tiles(self, frame: np.ndarray) -> np.ndarray:
+        """Return a (rows, cols) boolean grid of tiles that changed"""
+        ts = self.tile_size
+        height, width = frame.shape[:2]
+        rows, cols = -(-height // ts), -(-width // ts)
+
+        changed = np.any(frame != self.previous, axis=2)
+        changed = np.pad(changed, ((0, rows * ts - height), (0, cols * ts - width)))
+        return changed.reshape(rows, ts, cols, ts).any(axis=(1, 3))
+
+    def dirty_rects(self, tiles: np.ndarray, width: int, height: int) -> List[Tuple[int, int, int, int]]:
+        """Merge horizontal runs of dirty tiles into rectangles"""
+        ts = self.tile_size
+        rects = []
+        for row in np.flatnonzero(tiles.any(axis=1)).tolist():
+            # Run boundaries are where the row flips between clean and dirty
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], tiles[row].astype(np.int8), [0])))).tolist()
+            y = row * ts
+            h = min(ts, height - y)
+            for start, end in zip(edges[::2], edges[1::2]):
+                x = start * ts
+                rects.append((x, y, min(end * ts, width) - x, h))
+        return rects
+
+    def encode(self, image: Image.Image, quality: int = None) -> Optional[Tuple[dict, bytes]]:
+        """
+        Encode image against the previous frame.
+
+        Returns (frame_info, payload), or None when nothing changed.
+        """
+        frame = np.asarray(image)
+        height, width = frame.shape[:2]
+
+        keyframe = (self.previous is None
+                    or self.previous.shape != frame.shape
+                    or self.frames_since_keyframe >= self.keyframe_interval)
+
+        if keyframe:
+            rects = [(0, 0, width, height)]
+            self.frames_since_keyframe = 0
+        else:
+            rects = self.dirty_rects(self.dirty_tiles(frame), width, height)
+            self.frames_since_keyframe += 1
+
+        self.previous = frame
+        if not rects:
+            return None
+
+        tiles, chunks = [], []
+        for x, y, w, h in rects:
+            jpeg = encode_jpeg(image.crop((x, y, x + w, y + h)), quality)
+            tiles.append([x, y, w, h, len(jpeg)])
+            chunks.append(jpeg)
+
+        frame_info = {
+            'width': width,
+            'height': height,
+            'keyframe': keyframe,
+            'tiles': tiles
+        }
+        return frame_info, b''.join(chunks)
+
+class CaptureStats:
+    """Exponentially weighted timings of each capture stage, in milliseconds"""
+
+    STAGES = ('grab', 'encode', 'send')
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.timings = {stage: None for stage in self.STAGES}
+        self.frames = 0
+        self.dropped = 0
+
+    def record(self, stage: str, seconds: float):
+        ms = seconds * 1000
+        previous = self.timings[stage]
+        self.timings[stage] = ms if previous is None else previous + self.alpha * (ms - previous)
+
+    def snapshot(self) -> dict:
+        stats = {f'{stage}_ms': round(ms, 1) if ms is not None else None
+                 for stage, ms in self.timings.items()}
+        stats.update(frames=self.frames, dropped=self.dropped)
+        return stats
+
+class CapturedFrame(NamedTuple):
+    data: dict
+    payload: Optional[bytes]
+    flags: int
+    msg_type: MessageType = MessageType.SCREENSHOT_RESPONSE
+
+class FrameBuffer:
+    """
+    Double buffer between the capture thread and the async sender.
+
+    The capture thread builds a frame in its back buffer and publishes it to
+    the front; a front frame the sender has not picked up yet is replaced,
+    so the sender always gets the newest frame and never a backlog.
+    """
+
+    def __init__(self, stats: CaptureStats, on_ready: Callable[[], None] = None):
+        self.lock = threading.Lock()
+        self.front: Optional[CapturedFrame] = None
+        self.stats = stats
+        self.on_ready = on_ready
+
+    def publish(self, frame: CapturedFrame):
+        with self.lock:
+            if self.front is not None:
+                self.stats.dropped += 1
+            self.front = frame
+            self.stats.frames += 1
+        if self.on_ready:
+            self.on_ready()
+
+    def take(self) -> Optional[CapturedFrame]:
+        with self.lock:
+            frame, self.front = self.front, None
+        return frame
+
+class CapturePipeline(threading.Thread):
+    """Grabs and encodes frames on its own thread at the configured cadence"""
+
+    def __init__(self, buffer: FrameBuffer, stats: CaptureStats):
+        super().__init__(daemon=True)
+        self.buffer = buffer
+        self.stats = stats
+        self.tile_encoder = TileEncoder()
+        self.keyframe_requested = False
+        self.last_hash: Optional[np.ndarray] = None  # Hash of the last frame sent
+        self.last_sent = 0.0
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+        # Settings, updated from the client's event loop through configure()
+        self.capture_mode = CAPTURE_THUMBNAIL
+        self.interval = Config.SCREENSHOT_INTERVAL
+        self.thumbnail_size = None
+        self.remote_control = False
+        self.bbox: Optional[Box] = None  # Area the dashboard zoomed into
+        self.delta = False
+        self.idle_suppression = False
+        # Chosen by the rate controller during remote control
+        self.remote_quality = None
+        self.remote_scale = 1.0
+        self.remote_interval = None
+
+    def configure(self, **settings):
+        """Change capture settings, taking effect immediately"""
+        # A new frame size or area must reach the server even if the screen is idle
+        if settings.get('thumbnail_size', self.thumbnail_size) != self.thumbnail_size or \
+                settings.get('bbox', self.bbox) != self.bbox:
+            self.last_hash = None
+        for name, value in settings.items():
+            setattr(self, name, value)
+        self.wakeup.set()
+
+    def request_keyframe(self):
+        self.keyframe_requested = True
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def current_interval(self) -> Optional[float]:
+        """Seconds between captures, None while capture is paused"""
+        if self.remote_control:
+            if self.remote_interval:
+                return self.remote_interval
+            if self.delta:
+                return Config.REMOTE_CONTROL_DELTA_INTERVAL
+            return Config.REMOTE_CONTROL_SCREENSHOT_INTERVAL
+        if self.capture_mode == CAPTURE_PAUSED:
+            return None
+        return self.interval
+
+    def run(self):
+        while not self.stopped.is_set():
+            interval = self.current_interval()
+            if interval is not None:
+                started = time.perf_counter()
+                try:
+                    frame = self.capture()
+                    if frame:
+                        self.buffer.publish(frame)
+                except Exception as e:
+                    print(f"Screenshot error: {e}")
+                # Keep the cadence regardless of how long the capture took
+                interval = max(0, interval - (time.perf_counter() - started))
+
+            self.wakeup.wait(interval)
+            self.wakeup.clear()
+
+    def capture(self) -> Optional[CapturedFrame]:
+        started = time.perf_counter()
+        # Thumbnails always show the whole screen, zoomed views only their area
+        zoomed = self.remote_control or self.capture_mode == CAPTURE_FULL
+        image = grab_screen(self.bbox if zoomed else None)
+        grabbed = time.perf_counter()
+        self.stats.record('grab', grabbed - started)
+
+        if self.remote_control and self.remote_scale < 1:
+            image = image.resize((round(image.width * self.remote_scale),
+                                  round(image.height * self.remote_scale)),
+                                 Image.Resampling.BILINEAR)
+
+        # Delta stream: only the tiles that changed since the last frame
+        if self.remote_control and self.delta:
+            if self.keyframe_requested:
+                self.keyframe_requested = False
+                self.tile_encoder.request_keyframe()
+            encoded = self.tile_encoder.encode(image, self.remote_quality)
+            self.stats.record('encode', time.perf_counter() - grabbed)
+            # Nothing changed on screen, nothing to send
+            if encoded is None:
+                return None
+            frame_info, payload = encoded
+            return CapturedFrame(frame_info, payload, FLAG_REMOTE_CONTROL | FLAG_DELTA)
+
+        if self.remote_control:
+            payload = encode_jpeg(image, self.remote_quality)
+            self.stats.record('encode', time.perf_counter() - grabbed)
+            return CapturedFrame({'is_remote_control': True}, payload, FLAG_REMOTE_CONTROL)
+
+        data = {'is_remote_control': False}
+        if self.idle_suppression:
+            image_hash = perceptual_hash(image)
+            changed = (self.last_hash is None or
+                       hash_distance(image_hash, self.last_hash) > Config.IDLE_HASH_THRESHOLD)
+            now = time.monotonic()
+            # Idle screen: a tiny notice instead of a frame, with a periodic refresh
+            if not changed and now - self.last_sent < Config.IDLE_REFRESH_INTERVAL:
+                self.stats.record('encode', time.perf_counter() - grabbed)
+                return CapturedFrame({}, None, 0, MessageType.SCREEN_UNCHANGED)
+            self.last_hash = image_hash
+            self.last_sent = now
+            data['changed'] = changed
+
+        # Downscale before encoding so the server can forward the bytes as-is
+        thumbnail_size = self.thumbnail_size
+        if thumbnail_size:
+            downscale(image, thumbnail_size)
+        payload = encode_jpeg(image)
+        self.stats.record('encode', time.perf_counter() - grabbed)
+        data['is_thumbnail'] = bool(thumbnail_size)
+        return CapturedFrame(data, payload, FLAG_THUMBNAIL if thumbnail_size else 0)
@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import struct
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from shared.config import Config
+from shared.protocol import Message, MessageType
+
+LENGTH = struct.Struct('!I')
+
+class SwarmDownload:
+    """Chunks of one swarm file, stored in a part file at their offsets"""
+
+    def __init__(self, manifest: dict, directory: str):
+        self.id = manifest['swarm_id']
+        self.manifest = manifest
+        self.size = manifest['size']
+        self.chunk_size = manifest['chunk_size']
+        self.hashes: List[str] = manifest['hashes']
+        self.path = os.path.join(directory, f"{self.id}.swarm")
+        self.have: Set[int] = set()
+        self.lock = threading.Lock()
+        self.finished = False
+        self.result: Optional[dict] = None
+        self.task: Optional[asyncio.Task] = None
+        self.peers: List[dict] = []
+        self.peers_updated = 0.0
+        with open(self.path, 'wb') as f:
+            f.truncate(self.size)
+
+    @property
+    def complete(self) -> bool:
+        return len(self.have) == len(self.hashes)
+
+    def adopt(self, path: str):
+        """Serve from a file that already holds every chunk"""
+        if os.path.exists(self.path) and self.path != path:
+            os.remove(self.path)
+        self.path = path
+        self.have = set(range(len(self.hashes)))
+
+    def bitmap(self) -> bytes:
+        bits = bytearray((len(self.hashes) + 7) // 8)
+        for index in self.have:
+            bits[index // 8] |= 0x80 >> (index % 8)
+        return bytes(bits)
+
+    def parse_bitmap(self, bits: bytes) -> Set[int]:
+        return {index for index in range(min(len(self.hashes), len(bits) * 8))
+                if bits[index // 8] & (0x80 >> (index % 8))}
+
+    def verify(self, index: int, data: bytes) -> bool:
+        return hashlib.sha256(data).hexdigest() == self.hashes[index]
+
+    def read(self, index: int) -> bytes:
+        with self.lock, open(self.path, 'rb') as f:
+            f.seek(index * self.chunk_size)
+            return f.read(self.chunk_size)
+
+    def write(self, index: int, data: bytes):
+        with self.lock, open(self.path, 'r+b') as f:
+            f.seek(index * self.chunk_size)
+            f.write(data)
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, response: asyncio.Future):
+        self.response = response
+
+    def datagram_received(self, data, addr):
+        if not self.response.done():
+            self.response.set_result(data)
+
+class SwarmPeer:
+    """
+    Takes part in swarm distributions started by the server.
+
+    Chunks arrive from the server (the seeds) and from other students. A
+    small TCP server shares the chunks this student already holds; peer
+    addresses come from the server's discovery service. Each round the
+    student asks a random sample of peers which chunks they hold and
+    fetches the rarest ones first, so chunks spread through the room
+    instead of everyone waiting on the same few.
+    """
+
+    def __init__(self, client_id: str, directory: str, send: Callable[[Message], Awaitable],
+                 on_complete: Callable[[dict, str], Awaitable],
+                 lookup: Callable[[dict], Optional[str]] = None):
+        self.client_id = client_id
+        self.directory = directory
+        self.send = send
+        self.on_complete = on_complete
+        self.lookup = lookup
+        self.downloads: Dict[str, SwarmDownload] = {}
+        self.server = None
+        os.makedirs(directory, exist_ok=True)
+        # Chunk maps are not persisted, so leftovers from a previous run are useless
+        for name in os.listdir(directory):
+            if name.endswith('.swarm'):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    @property
+    def port(self) -> Optional[int]:
+        if not self.server:
+            return None
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        """Start sharing chunks, False if the port is unavailable"""
+        try:
+            self.server = await asyncio.start_server(self.handle_peer, '0.0.0.0', Config.SWARM_PORT)
+            return True
+        except OSError as e:
+            print(f"Swarm sharing disabled: {e}")
+            return False
+
+    async def handle_start(self, manifest: dict):
+        download = self.downloads.get(manifest['swarm_id'])
+        if download is None:
+            download = SwarmDownload(manifest, self.directory)
+            self.downloads[download.id] = download
+            cached = self.lookup(manifest) if self.lookup else None
+            if cached:
+                download.adopt(cached)
+                await self._finish(download, cached=True)
+                return
+
+        if download.finished:
+            # Completion report was lost in a reconnect
+            await self._report_complete(download)
+            return
+        if not download.task or download.task.done():
+            download.task = asyncio.create_task(self._fetch(download))
+
+    async def handle_chunk(self, data: dict, payload: bytes):
+        """Chunk seeded or resent by the server"""
+        download = self.downloads.get(data.get('swarm_id'))
+        if download:
+            await self._store(download, data.get('index'), payload or b'')
+
+    async def _store(self, download: SwarmDownload, index: int, data: bytes) -> bool:
+        if download.finished or index in download.have or not download.verify(index, data):
+            return False
+        await asyncio.get_running_loop().run_in_executor(None, download.write, index, data)
+        download.have.add(index)
+        await self.send(Message(MessageType.SWARM_HAVE, {'swarm_id': download.id, 'index': index}))
+        if download.complete and not download.finished:
+            await self._finish(download)
+        return True
+
+    async def _finish(self, download: SwarmDownload, cached: bool = False):
+        download.finished = True
+        manifest = dict(download.manifest, cached=cached)
+        result = {'cached': cached}
+        try:
+            path = await self.on_complete(manifest, download.path)
+            # Share from the artifact cache when the file went there
+            source = (self.lookup(manifest) if self.lookup else None) or path
+            if source and os.path.exists(source):
+                download.adopt(source)
+            result.update(status='success', path=path)
+        except Exception as e:
+            result.update(status='error', message=str(e))
+        download.result = result
+        await self._report_complete(download)
+
+        # Keep sharing for a while so later peers can still fetch from us
+        asyncio.get_running_loop().call_later(Config.SWARM_LINGER, self.downloads.pop,
+                                              download.id, None)
+
+    async def _report_complete(self, download: SwarmDownload):
+        await self.send(Message(MessageType.SWARM_COMPLETE, dict(download.result, swarm_id=download.id)))
+
+    async def _fetch(self, download: SwarmDownload):
+        try:
+            await self._fetch_rounds(download)
+        except ConnectionError as e:
+            # Restarted when the server offers the swarm again after reconnecting
+            print(f"Swarm {download.id} paused: {e}")
+
+    async def _fetch_rounds(self, download: SwarmDownload):
+        last_progress = time.monotonic()
+        while not download.finished:
+            peers = await self._discover(download)
+            fetched = 0
+            if peers:
+                sample = random.sample(peers, min(len(peers), Config.SWARM_PEER_SAMPLE))
+                bitmaps = await asyncio.gather(*(self._peer_chunks(peer, download) for peer in sample))
+
+                # Rarest first among what the sampled peers hold
+                sources: Dict[int, list] = {}
+                for peer, chunks in zip(sample, bitmaps):
+                    for index in chunks - download.have:
+                        sources.setdefault(index, []).append(peer)
+                wanted = sorted(sources, key=lambda i: (len(sources[i]), random.random()))
+                results = await asyncio.gather(*(
+                    self._fetch_chunk(download, index, random.choice(sources[index]))
+                    for index in wanted[:Config.SWARM_PARALLEL]
+                ))
+                fetched = sum(results)
+
+            now = time.monotonic()
+            if fetched:
+                last_progress = now
+                continue
+            if now - last_progress > Config.SWARM_STALL_TIMEOUT and not download.finished:
+                # Nobody we can reach has what we miss, fall back to the server
+                missing = [i for i in range(len(download.hashes)) if i not in download.have]
+                await self.send(Message(MessageType.SWARM_REQUEST, {
+                    'swarm_id': download.id,
+                    'indexes': missing[:Config.SWARM_PARALLEL]
+                }))
+                last_progress = now
+            await asyncio.sleep(Config.SWARM_RETRY_INTERVAL)
+
+    async def _discover(self, download: SwarmDownload) -> List[dict]:
+        """Ask the discovery service which students take part in the swarm"""
+        if time.monotonic() - download.peers_updated < Config.SWARM_PEER_REFRESH:
+            return download.peers
+
+        loop = asyncio.get_running_loop()
+        response = loop.create_future()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DiscoveryProtocol(response),
+                remote_addr=(Config.SERVER_HOST, Config.DISCOVERY_PORT))
+        except OSError:
+            return download.peers
+        try:
+            transport.sendto(json.dumps({'type': 'swarm_discovery', 'swarm_id': download.id}).encode())
+            data = json.loads(await asyncio.wait_for(response, Config.SWARM_PEER_TIMEOUT))
+            download.peers = [peer for peer in data.get('peers', [])
+                              if peer.get('client_id') != self.client_id]
+            download.peers_updated = time.monotonic()
+        except (asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            transport.close()
+        return download.peers
+
+    async def _request(self, peer: dict, line: str) -> Optional[bytes]:
+        """Send one request line to a peer and read its length-prefixed reply"""
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(peer['host'], peer['port']), Config.SWARM_PEER_TIMEOUT)
+            writer.write(f"{line}\n".encode())
+            await writer.drain()
+            header = await asyncio.wait_for(reader.readexactly(LENGTH.size), Config.SWARM_PEER_TIMEOUT)
+            (length,) = LENGTH.unpack(header)
+            return await asyncio.wait_for(reader.readexactly(length), Config.SWARM_PEER_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return None
+        finally:
+            if writer:
+                writer.close()
+
+    async def _peer_chunks(self, peer: dict, download: SwarmDownload) -> Set[int]:
+        bits = await self._request(peer, f"HAVE {download.id}")
+        return download.parse_bitmap(bits) if bits else set()
+
+    async def _fetch_chunk(self, download: SwarmDownload, index: int, peer: dict) -> bool:
+        data = await self._request(peer, f"GET {download.id} {index}")
+        if not data:
+            return False
+        return await self._store(download, index, data)
+
+    async def handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer HAVE <swarm> with a chunk bitmap and GET <swarm> <index> with the chunk"""
+        try:
+            line = await asyncio.wait_for(reader.readline(), Config.SWARM_PEER_TIMEOUT)
+            parts = line.decode().split()
+            download = self.downloads.get(parts[1]) if len(parts) >= 2 else None
+            reply = b''
+            if download and parts[0] == 'HAVE':
+                reply = download.bitmap()
+            elif download and parts[0] == 'GET' and len(parts) == 3:
+                index = int(parts[2])
+                if index in download.have:
+                    loop = asyncio.get_running_loop()
+                    reply = await loop.run_in_executor(None, download.read, index)
+            writer.write(LENGTH.pack(len(reply)) + reply)
+            await writer.drain()
+        except (OSError, ValueError, UnicodeDecodeError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
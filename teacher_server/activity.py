@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from shared.config import Config
+
+class ActivityTracker:
+    """
+    Per-client screen activity index built from change notifications.
+
+    Clients report whether each frame differs from the previous one, so the
+    index is maintained without looking at any image data.
+    """
+
+    def __init__(self, window: float = None):
+        self.window = window or Config.ACTIVITY_WINDOW
+        self.lock = threading.Lock()
+        self.last_change: Dict[str, float] = {}
+        self.changes: Dict[str, Deque[float]] = {}
+
+    def record(self, client_id: str, changed: bool):
+        """Record a capture from a client, changed or not"""
+        now = time.time()
+        with self.lock:
+            changes = self.changes.setdefault(client_id, deque())
+            if changed:
+                self.last_change[client_id] = now
+                changes.append(now)
+            while changes and changes[0] < now - self.window:
+                changes.popleft()
+
+    def remove(self, client_id: str):
+        """Forget a client that went offline, it starts over when it comes back"""
+        with self.lock:
+            self.last_change.pop(client_id, None)
+            self.changes.pop(client_id, None)
+
+    def snapshot(self, client_id: str) -> Optional[dict]:
+        """Activity of a client: idle time, change rate and a combined score"""
+        now = time.time()
+        with self.lock:
+            if client_id not in self.changes:
+                return None
+            last_change = self.last_change.get(client_id)
+            changes = sum(1 for t in self.changes[client_id] if t >= now - self.window)
+
+        idle_seconds = now - last_change if last_change else None
+        change_rate = changes * 60 / self.window  # changes per minute
+        # Recent and frequent changes rank highest
+        score = change_rate / (1 + (idle_seconds if idle_seconds is not None else self.window) / 60)
+        return {
+            'last_change': last_change,
+            'idle_seconds': round(idle_seconds, 1) if idle_seconds is not None else None,
+            'change_rate': round(change_rate, 2),
+            'score': round(score, 3)
+        }
@@ -1,5 +1,5 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
+from flask_socketio import SocketIO, join_room, leave_room
 import json
 import os
 import threading
@@ -7,19 +7,33 @@ import time
 from datetime import datetime
 import base64
 import io
-from PIL import Image
 import uuid
+import hashlib
+import zipfile
+from concurrent.futures import Future
+from werkzeug.utils import secure_filename
 
 from teacher_server.websocket_handler import WebSocketHandler
 from teacher_server.auth import AuthManager
+from teacher_server.thumbnailer import Thumbnailer
+from teacher_server.viewers import ViewerRegistry, capture_region, room
+from teacher_server.activity import ActivityTracker
+from teacher_server.groups import GroupRegistry
+from teacher_server.grid import GridBatcher
+from teacher_server.registry import ClientRegistry
+from teacher_server.liveness import LivenessTracker
+from teacher_server.cluster import Cluster, empty_result
+from shared.archive import iter_zip
 from shared.config import Config
-from shared.protocol import Message, MessageType
+from shared.protocol import (Message, MessageType, CAPABILITY_THUMBNAIL, CAPABILITY_TRANSFER,
+                             CAPABILITY_SWARM, CAPABILITY_INPUT, CAPTURE_FULL)
 from shared.utils import get_local_ip
 # from .websocket_handler import WebSocketHandler
 # from .auth import AuthManager
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = Config.SECRET_KEY
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_FILE_SIZE
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Global state
@@ -27,11 +41,45 @@ connected_clients = {}
 websocket_handler = None
 auth_manager = AuthManager()
 
+class SocketIODashboards:
+    """Dashboard connections served by Flask-SocketIO, in its own threads"""
+
+    def emit(self, event, data, to=None):
+        socketio.emit(event, data, to=to)
+
+    def join(self, sid, name):
+        join_room(name, sid=sid, namespace='/')
+
+    def leave(self, sid, name):
+        leave_room(name, sid=sid, namespace='/')
+
+def folder_name(path):
+    """Last component of a client path, which may use Windows separators"""
+    return os.path.basename(os.path.normpath(path.replace('\\', '/'))) or 'folder'
+
 class TeacherServer:
     def __init__(self):
-        self.clients = {}
+        self.clients = ClientRegistry()
+        self.capture_stats = {}  # client_id -> last grab/encode/send timings
         self.screenshots = {}
         self.remote_sessions = {}
+        self.viewers = ViewerRegistry()
+        self.dashboards = SocketIODashboards()  # Replaced in async mode
+        self.client_configs = {}  # Last config pushed to each client
+        self.grid_refreshed = {}  # client_id -> when a large frame last refreshed the grid
+        # Clients that stop sending heartbeats without disconnecting
+        self.liveness = LivenessTracker()
+        # Thumbnails and client changes reach the dashboards in one batch per tick
+        self.grid = GridBatcher(self.viewers, self.clients, self.emit_local,
+                                before_flush=self.check_liveness)
+        self.activity = ActivityTracker()
+        self.thumbnailer = None
+        self.uploads = {}  # upload_id -> file stored in UPLOAD_FOLDER
+        self.stored_uploads = {}  # sha256 -> path, one stored copy per content
+        self.uploads_lock = threading.Lock()
+        self.groups = GroupRegistry()
+        # Other teacher servers sharing the class, see Config.CLUSTER_BROKER
+        self.cluster = Cluster(self)
 
     def start(self):
         """Start the teacher server"""
@@ -39,19 +87,35 @@ class TeacherServer:
 
         # Create upload directory
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        self.remove_expired_uploads()
 
-        # Start WebSocket handler for client communication
-        global websocket_handler
-        websocket_handler = WebSocketHandler(self)
-        websocket_handler.start_in_thread()
+        # Thumbnails are decoded and resized in worker processes
+        self.thumbnailer = Thumbnailer(self.store_thumbnail)
 
         # Start client discovery
         discovery_thread = threading.Thread(target=self.start_discovery)
         discovery_thread.daemon = True
         discovery_thread.start()
 
-        print(f"Teacher server starting on {get_local_ip()}:{Config.SERVER_PORT}")
-        socketio.run(app, host=Config.SERVER_HOST, port=Config.SERVER_PORT, debug=False)
+        websocket_handler = WebSocketHandler(self)
+        try:
+            if Config.SERVER_MODE == 'async':
+                # Dashboards and students share one event loop
+                from teacher_server.async_server import run_async
+                run_async(self, websocket_handler, app, dashboard_events)
+                return
+
+            # Start WebSocket handler for client communication
+            websocket_handler.start_in_thread()
+
+            self.cluster.start()
+            socketio.start_background_task(self.grid.run)
+
+            print(f"Teacher server starting on {get_local_ip()}:{Config.SERVER_PORT}")
+            socketio.run(app, host=Config.SERVER_HOST, port=Config.SERVER_PORT, debug=False,
+                         allow_unsafe_werkzeug=True)
+        finally:
+            self.thumbnailer.shutdown()
 
     def start_discovery(self):
         """Start client discovery service"""
@@ -75,93 +139,528 @@ class TeacherServer:
                     }
                     sock.sendto(json.dumps(response).encode(), addr)
 
+                elif message.get('type') == 'swarm_discovery' and websocket_handler:
+                    # Students look up who else takes part in a swarm
+                    response = {
+                        'type': 'swarm_peers',
+                        'swarm_id': message.get('swarm_id'),
+                        'peers': websocket_handler.swarms.peers(message.get('swarm_id'))
+                    }
+                    sock.sendto(json.dumps(response).encode(), addr)
+
             except Exception as e:
                 print(f"Discovery error: {e}")
                 time.sleep(1)
 
     def register_client(self, client_id, client_info):
         """Register a new client"""
-        self.clients[client_id] = {
-            'id': client_id,
-            'info': client_info,
-            'last_seen': time.time(),
-            'status': 'online',
-            'websocket': None
-        }
+        # Dashboards get the new record with their next grid batch
+        self.clients.register(client_id, client_info)
+        self.liveness.touch(client_id, self.heartbeat_timeout(client_id))
+        self.cluster.client_registered(client_id, client_info, self.local_capabilities(client_id))
 
-        # Notify web dashboard
-        socketio.emit('client_connected', {
-            'client_id': client_id,
-            'client_info': client_info
-        })
+        self.push_client_config(client_id, force=True)
 
         print(f"Client registered: {client_id}")
 
+    def apply_presence(self, client_id, client_info, status):
+        """A client connected to another node registered or changed status"""
+        if client_info is not None and self.clients.get(client_id, {}).get('info') != client_info:
+            self.clients.register(client_id, client_info)
+        self.clients.update(client_id, status=status)
+        if status == 'offline':
+            self.grid.remove_client(client_id)
+
+    def local_clients(self):
+        """Clients connected to this node, with their records"""
+        connected = set(websocket_handler.clients) if websocket_handler else set()
+        return [(client_id, self.clients[client_id]) for client_id in self.clients
+                if client_id in connected]
+
+    def local_capabilities(self, client_id):
+        return websocket_handler.capabilities.get(client_id, set()) if websocket_handler else set()
+
+    def has_capability(self, client_id, capability):
+        """Whether a client supports something, wherever in the cluster it is connected"""
+        if websocket_handler and websocket_handler.has_capability(client_id, capability):
+            return True
+        return self.cluster.has_capability(client_id, capability)
+
+    def emit_local(self, event, data, to=None):
+        """Emit to the dashboards connected to this node"""
+        self.dashboards.emit(event, data, to)
+
+    def emit_dashboard(self, event, data, to=None):
+        """Emit to dashboards across the cluster; a dashboard's sid only exists on its own node"""
+        self.emit_local(event, data, to)
+        if to is None or not self.viewers.connected(to):
+            self.cluster.emit(event, data, to)
+
+    def join_room(self, sid, name):
+        """Put a dashboard in a room, other nodes only send room events where someone listens"""
+        self.dashboards.join(sid, name)
+        self.cluster.joined(sid, name)
+
+    def leave_room(self, sid, name):
+        self.dashboards.leave(sid, name)
+        self.cluster.left(sid, name)
+
+    def client_config(self, client_id):
+        """Capture settings the client should use right now"""
+        capture_mode = self.viewers.capture_mode(client_id)
+        if capture_mode == CAPTURE_FULL:
+            size, interval = Config.LARGE_VIEW_SIZE, Config.LARGE_VIEW_INTERVAL
+        else:
+            size, interval = Config.THUMBNAIL_SIZE, Config.SCREENSHOT_INTERVAL
+        return {
+            'capture_mode': capture_mode,
+            'interval': interval,
+            'thumbnail_size': list(size),
+            'region': self.viewers.region(client_id),
+            'heartbeat_interval': self.heartbeat_settings(client_id)[0]
+        }
+
+    def set_capture_region(self, client_id, region):
+        """Zoom the large view and remote control of a client into a monitor or rectangle"""
+        self.viewers.set_region(client_id, capture_region(region))
+        self.push_client_config(client_id)
+
+    def stop_remote_control(self, sid, client_id):
+        """End a dashboard's remote-control session, and the client's once nobody is left"""
+        if self.viewers.stop_control(sid, client_id):
+            self.send_message_to_client(client_id, MessageType.REMOTE_CONTROL_STOP, {})
+            self.apply_remote_session(client_id, None)
+            self.cluster.remote_session(client_id, None)
+            self.release_capture_region(client_id)
+            self.push_client_config(client_id)
+
+    def release_capture_region(self, client_id):
+        """Back to the whole screen once nobody looks at the zoomed area"""
+        if not self.viewers.is_viewed(client_id) and client_id not in self.remote_sessions:
+            self.viewers.set_region(client_id, None)
+
+    def push_client_config(self, client_id, force=False):
+        """Send capture settings to a client that can adapt, if they changed"""
+        if self.cluster.is_remote(client_id):
+            # Its own node decides, together with what it needs itself
+            self.cluster.demand(client_id, self.client_config(client_id))
+            return
+        if not websocket_handler or not websocket_handler.has_capability(client_id, CAPABILITY_THUMBNAIL):
+            return
+        config = self.cluster.merge_demands(client_id, self.client_config(client_id))
+        if not force and self.client_configs.get(client_id) == config:
+            return
+        self.client_configs[client_id] = config
+        self.send_message_to_client(client_id, MessageType.CLIENT_CONFIG, config)
+
+    def refresh_client_configs(self):
+        """Re-evaluate capture settings after dashboards or their views changed"""
+        for client_id in list(self.clients):
+            self.push_client_config(client_id)
+
     def update_client_status(self, client_id, status):
         """Update client status"""
         if client_id in self.clients:
-            self.clients[client_id]['status'] = status
-            self.clients[client_id]['last_seen'] = time.time()
-
-            socketio.emit('client_status_update', {
+            if status == 'offline' and self.cluster.is_remote(client_id):
+                return  # Already reconnected to another node
+            if status == 'offline':
+                self.liveness.remove(client_id)
+                # A frame still waiting would only refresh a thumbnail of an offline client
+                if self.thumbnailer:
+                    self.thumbnailer.discard(client_id)
+                self.activity.remove(client_id)
+                self.grid.remove_client(client_id)
+            else:
+                self.liveness.touch(client_id, self.heartbeat_timeout(client_id))
+            if self.clients.update(client_id, status=status):
+                self.cluster.client_status(client_id, status)
+            self.clients.seen(client_id)
+
+    def heartbeat_settings(self, client_id):
+        """Heartbeat interval and grace period for a client, the shortest of its groups"""
+        settings = (Config.CLIENT_HEARTBEAT_INTERVAL, Config.HEARTBEAT_GRACE)
+        for name, group in Config.GROUP_LIVENESS.items():
+            if client_id in self.groups.members(name):
+                interval = group.get('heartbeat_interval', Config.CLIENT_HEARTBEAT_INTERVAL)
+                grace = group.get('grace', Config.HEARTBEAT_GRACE)
+                settings = min(settings, (interval, grace), key=sum)
+        return settings
+
+    def heartbeat_timeout(self, client_id):
+        return sum(self.heartbeat_settings(client_id))
+
+    def check_liveness(self):
+        """Mark clients that missed their heartbeat, all in the grid batch of this tick"""
+        expired = self.liveness.expired()
+        changed = {client_id: 'unresponsive' for client_id in expired
+                   if self.clients.update(client_id, status='unresponsive')}
+        if changed:
+            self.cluster.client_statuses(changed)
+            print(f"No heartbeat from {len(changed)} client(s): {', '.join(sorted(changed))}")
+
+    def update_capture_stats(self, client_id, stats):
+        """Store the client's grab/encode/send timings, shown in /api/clients?include=activity"""
+        if client_id in self.clients:
+            self.capture_stats[client_id] = stats
+
+    def client_activity(self):
+        """Activity scores and heartbeat details, which change too often for the registry"""
+        return {client_id: {
+            'activity': self.activity.snapshot(client_id),
+            'last_seen': self.clients.last_seen.get(client_id),
+            'capture_stats': self.capture_stats.get(client_id)
+        } for client_id in self.clients}
+
+    def sync_clients(self, sid, data):
+        """Registry changes a dashboard is missing, from then on it gets them per grid batch"""
+        version = data.get('version')
+        sync = self.clients.changes_since(data.get('epoch'), version if isinstance(version, int) else None)
+        self.grid.synced(sid, sync['version'])
+        return sync
+
+    def update_remote_session(self, client_id, stats):
+        """Store the rate controller state of a remote-control session"""
+        if client_id in self.remote_sessions:
+            self.remote_sessions[client_id] = stats
+            self.cluster.remote_session(client_id, stats)
+            self.emit_dashboard('remote_session_stats', {
                 'client_id': client_id,
-                'status': status
-            })
+                'stats': stats
+            }, to=room('remote', client_id))
+
+    def start_remote_session(self, client_id):
+        if client_id not in self.remote_sessions:
+            self.apply_remote_session(client_id, {})
+            self.cluster.remote_session(client_id, {})
+
+    def apply_remote_session(self, client_id, stats):
+        """Session started or measured, or ended when stats is None"""
+        if stats is None:
+            self.remote_sessions.pop(client_id, None)
+        else:
+            self.remote_sessions[client_id] = stats
+
+    def handle_screen_unchanged(self, client_id):
+        """Client's screen is idle, it skipped sending a frame"""
+        self.activity.record(client_id, changed=False)
+        if client_id in self.clients:
+            self.clients.seen(client_id)
 
-    def handle_screenshot(self, client_id, data):
+    def handle_screenshot(self, client_id, image_data, is_remote_control=False, frame_info=None,
+                          is_thumbnail=False, changed=True):
         """Menangani screenshot dari klien dan membedakan antara thumbnail dan remote control."""
         try:
-            is_remote_control = data.get('is_remote_control', False)
-            screenshot_b64 = data.get('screenshot')
-
-            if not screenshot_b64:
+            if not image_data:
                 return
 
             # Jika ini adalah stream untuk remote control
             if is_remote_control:
-                # Langsung kirim data gambar resolusi penuh ke dasbor web
-                socketio.emit('remote_screen_update', {
+                # Langsung kirim data gambar resolusi penuh ke dasbor web.
+                # Delta frames carry their tile layout, the dashboard composites them.
+                update = {
                     'client_id': client_id,
-                    'image': screenshot_b64
-                })
-            # Jika ini untuk pembaruan thumbnail di dasbor utama
-            else:
-                image_data = base64.b64decode(screenshot_b64)
-                image = Image.open(io.BytesIO(image_data))
-
-                # Buat thumbnail
-                thumbnail = image.copy()
-                thumbnail.thumbnail((200, 150), Image.Resampling.LANCZOS)
-
-                buffer = io.BytesIO()
-                thumbnail.save(buffer, format='JPEG', quality=Config.SCREENSHOT_QUALITY)
-                thumbnail_b64 = base64.b64encode(buffer.getvalue()).decode()
-
-                # Simpan thumbnail
-                if client_id in self.clients:
-                    self.screenshots[client_id] = {
-                        'thumbnail': thumbnail_b64,
-                        'timestamp': time.time()
-                    }
-
-                # Kirim pembaruan thumbnail ke dasbor web
-                socketio.emit('screenshot_update', {
+                    'image': image_data
+                }
+                if frame_info:
+                    update.update(frame_info)
+                # Encoded once, sent only to the dashboards controlling this client
+                self.emit_dashboard('remote_screen_update', update, to=room('remote', client_id))
+            # Large-view frame: full size for the viewers, a small copy for the grid
+            elif is_thumbnail and self.client_configs.get(client_id, {}).get('capture_mode') == CAPTURE_FULL:
+                self.activity.record(client_id, changed)
+                self.emit_dashboard('screen_view_update', {
                     'client_id': client_id,
-                    'thumbnail': thumbnail_b64
-                })
+                    'image': image_data
+                }, to=room('view', client_id))
+                now = time.monotonic()
+                if now - self.grid_refreshed.get(client_id, 0) >= Config.SCREENSHOT_INTERVAL:
+                    self.grid_refreshed[client_id] = now
+                    self.thumbnailer.submit(client_id, image_data)
+            # Klien sudah mengecilkan gambar, cukup diteruskan
+            elif is_thumbnail:
+                self.activity.record(client_id, changed)
+                self.store_thumbnail(client_id, image_data)
+            # Jika ini untuk pembaruan thumbnail di dasbor utama.
+            # Thumbnail dibuat di worker pool, bukan di event loop.
+            else:
+                self.activity.record(client_id, changed)
+                self.thumbnailer.submit(client_id, image_data)
 
         except Exception as e:
             print(f"Gagal memproses screenshot dari {client_id}: {e}")
 
-    def send_message_to_client(self, client_id, message_type, data):
+    def store_thumbnail(self, client_id, thumbnail_data):
+        """Store a finished thumbnail and push it to the dashboard"""
+        self.apply_thumbnail(client_id, thumbnail_data)
+        self.cluster.thumbnail(client_id, thumbnail_data)
+
+    def apply_thumbnail(self, client_id, thumbnail_data):
+        # Simpan thumbnail
+        if client_id in self.clients:
+            self.screenshots[client_id] = {
+                'thumbnail': thumbnail_data,
+                'timestamp': time.time()
+            }
+
+        # Dikirim ke dasbor web pada batch berikutnya
+        self.grid.thumbnail(client_id, thumbnail_data)
+
+    def save_upload(self, filename, stream):
+        """Store an uploaded file chunk by chunk, hashing it on the way"""
+        self.remove_expired_uploads()
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(Config.UPLOAD_FOLDER, upload_id)
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'wb') as f:
+            while True:
+                chunk = stream.read(Config.TRANSFER_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        # The same content uploaded again reuses the stored copy, under its new name
+        sha256 = digest.hexdigest()
+        with self.uploads_lock:
+            stored = self.stored_uploads.get(sha256)
+            if stored and os.path.exists(stored):
+                os.remove(path)
+                path = stored
+            else:
+                self.stored_uploads[sha256] = path
+            return self.add_upload(upload_id, filename, path, size, sha256)
+
+    def stored_upload(self, filename, sha256):
+        """A new upload of content stored already, None when there is no copy"""
+        with self.uploads_lock:
+            path = self.stored_uploads.get(sha256)
+            if not path or not os.path.exists(path):
+                return None
+            return self.add_upload(uuid.uuid4().hex, filename, path, os.path.getsize(path), sha256)
+
+    def add_upload(self, upload_id, filename, path, size, sha256):
+        """Record an upload, with uploads_lock held"""
+        upload = self.uploads[upload_id] = {
+            'upload_id': upload_id,
+            'filename': secure_filename(filename) or upload_id,
+            'path': path,
+            'size': size,
+            'sha256': sha256,
+            'used': time.time()
+        }
+        return upload
+
+    def read_upload(self, upload_id, offset, size):
+        """A chunk of an upload, for another node fetching its own copy"""
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise IOError('Upload not found')
+        upload['used'] = time.time()
+        with open(upload['path'], 'rb') as f:
+            f.seek(offset)
+            return f.read(min(size, Config.TRANSFER_CHUNK_SIZE))
+
+    def receive_transfer(self, node, source, client_ids, info):
+        """Send clients here a file uploaded on another node, fetched from there unless stored already"""
+        try:
+            upload = self.stored_upload(source['filename'], source['sha256'])
+            if upload is None:
+                upload = self.save_upload(source['filename'], self.cluster.upload_reader(node, source))
+                if upload['sha256'] != source['sha256']:
+                    raise IOError('Checksum mismatch')
+        except Exception as e:
+            print(f"Fetching {source['filename']} from node {node} failed: {e}")
+            for client_id in client_ids:
+                self.transfer_failed(client_id, source, info, f"Fetching the file failed: {e}")
+            return
+        self.distribute_file(client_ids, upload, info)
+
+    def transfer_failed(self, client_id, upload, info, error):
+        """Tell the dashboards a file could not be sent to a client"""
+        self.emit_dashboard('transfer_progress', {
+            'transfer_id': None,
+            'client_id': client_id,
+            'filename': upload['filename'],
+            'purpose': info.get('purpose'),
+            'size': upload['size'],
+            'acked': 0,
+            'status': 'error',
+            'error': error
+        })
+
+    def remove_expired_uploads(self):
+        """Forget uploads unused for UPLOAD_EXPIRY and delete files no upload refers to"""
+        cutoff = time.time() - Config.UPLOAD_EXPIRY
+        with self.uploads_lock:
+            for upload_id, upload in list(self.uploads.items()):
+                if upload['used'] < cutoff:
+                    del self.uploads[upload_id]
+            referenced = {upload['path'] for upload in self.uploads.values()}
+            for sha256, path in list(self.stored_uploads.items()):
+                if path not in referenced:
+                    del self.stored_uploads[sha256]
+            # Also catches files left behind by an earlier run
+            for name in os.listdir(Config.UPLOAD_FOLDER):
+                path = os.path.join(Config.UPLOAD_FOLDER, name)
+                try:
+                    if (path not in referenced and os.path.isfile(path)
+                            and os.path.getmtime(path) < cutoff):
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def send_file_to_client(self, client_id, upload, info):
+        """Stream an uploaded file to a client, every client reads it from disk"""
+        upload['used'] = time.time()
+        if self.cluster.is_remote(client_id):
+            # Its node streams the file from a copy of its own
+            self.cluster.transfer(self.cluster.owner(client_id), [client_id], upload, info)
+            return
+        info = dict(info, filename=upload['filename'])
+        if websocket_handler and websocket_handler.has_capability(client_id, CAPABILITY_TRANSFER):
+            websocket_handler.start_transfer(client_id, upload['path'], info, upload['sha256'])
+        elif info.get('purpose') == 'execute':
+            # Older clients only understand the program in a single message
+            with open(upload['path'], 'rb') as f:
+                payload = f.read()
+            info.pop('purpose')
+            self.send_message_to_client(client_id, MessageType.EXECUTE_PROGRAM, info, payload)
+        else:
+            self.transfer_failed(client_id, upload, info, 'Client does not support file transfers')
+
+    def distribute_file(self, client_ids, upload, info):
+        """Send a file to many clients, letting them share it when it is large"""
+        upload['used'] = time.time()
+        # Clients on other nodes get it from their node, which may swarm it among them
+        client_ids, remote = self.cluster.split(client_ids)
+        for node, ids in remote.items():
+            self.cluster.transfer(node, ids, upload, info)
+        swarm_ids = []
+        if websocket_handler and upload['size'] >= Config.SWARM_MIN_SIZE:
+            swarm_ids = [client_id for client_id in client_ids
+                         if websocket_handler.has_capability(client_id, CAPABILITY_SWARM)]
+        if len(swarm_ids) < 2:
+            swarm_ids = []
+        else:
+            websocket_handler.start_swarm(swarm_ids, upload['path'],
+                                          dict(info, filename=upload['filename']), upload['sha256'])
+
+        for client_id in client_ids:
+            if client_id not in swarm_ids:
+                self.send_file_to_client(client_id, upload, info)
+
+    def swarm_address(self, client_id):
+        """Where a client shares swarm chunks, from its registration"""
+        info = self.clients.get(client_id, {}).get('info', {})
+        if info.get('swarm_port'):
+            return info.get('ip_address'), info['swarm_port']
+        return None
+
+    def file_manager_response(self, client_id, data):
+        """Forward a directory page or search batch to the dashboards browsing that client"""
+        self.emit_dashboard('file_manager', dict(data, client_id=client_id), to=room('files', client_id))
+
+    def transfer_progress(self, progress):
+        """Forward transfer progress to the dashboard"""
+        self.emit_dashboard('transfer_progress', progress)
+
+    def collection_progress(self, progress):
+        """Forward folder collection progress to the dashboard"""
+        self.emit_dashboard('collection_progress', progress)
+
+    def receive_collected(self, client_id, data, payload):
+        """A folder chunk relayed by the node of the client sending it"""
+        if websocket_handler and websocket_handler.loop:
+            websocket_handler.call(websocket_handler.collector.handle_chunk, client_id, data, payload)
+
+    def clients_lost(self, client_ids):
+        """Clients whose node left the cluster, with the folders they were sending"""
+        if websocket_handler and websocket_handler.loop:
+            for client_id in client_ids:
+                websocket_handler.call(websocket_handler.collector.peer_disconnected, client_id)
+
+    def collect_folder(self, target, path, sid=None):
+        """Ask one client, a group or everyone to send a folder back, all at once"""
+        client_ids = self.resolve_targets(target)
+        if not websocket_handler or not client_ids:
+            self.emit_dashboard('collection_started', {'error': 'No clients to collect from'}, to=sid)
+            return
+        collection, _ = websocket_handler.collect_folder(client_ids, path)
+        self.emit_dashboard('collection_started', dict(collection.summary(), target=target), to=sid)
+
+    def archive_name(self, client_id, path):
+        """Download name of a collected folder, e.g. PC-12-project.zip"""
+        hostname = self.clients.get(client_id, {}).get('info', {}).get('hostname') or client_id
+        return secure_filename(f"{hostname}-{folder_name(path)}.zip") or f"{client_id}.zip"
+
+    def resolve_targets(self, target):
+        """Client ids for 'all', 'group:<name>' or a single client id"""
+        if target == 'all':
+            return list(self.clients)
+        if isinstance(target, str) and target.startswith('group:'):
+            return self.groups.members(target[len('group:'):])
+        return [target]
+
+    def send_command(self, target, message_type, data, sid=None):
+        """Send a command to one client, a group or everyone and report the outcome to the dashboard"""
+        client_ids = self.resolve_targets(target)
+        if not websocket_handler or not client_ids:
+            self.emit_dashboard('command_result', dict(
+                empty_result(message_type, failed={client_id: 'offline' for client_id in client_ids}),
+                target=target), to=sid)
+            return
+
+        # Clients connected to other nodes get it through their node
+        future = self.cluster.command(client_ids, message_type, data)
+
+        def report(future):
+            try:
+                result = dict(future.result(), target=target)
+            except Exception as e:
+                print(f"Command {message_type.value} to {target} failed: {e}")
+                return
+            self.emit_dashboard('command_result', result, to=sid)
+
+        future.add_done_callback(report)
+
+    def send_remote_input(self, client_id, events):
+        """Forward a batch of input events, as single clicks and key presses for older clients"""
+        if not websocket_handler:
+            return
+        if self.has_capability(client_id, CAPABILITY_INPUT):
+            self.send_message_to_client(client_id, MessageType.REMOTE_INPUT, {'events': events})
+            return
+        for event in events:
+            if event[0] == 'd':
+                self.send_message_to_client(client_id, MessageType.REMOTE_INPUT, {
+                    'type': 'click', 'button': event[1], 'x': event[2], 'y': event[3]
+                })
+            elif event[0] == 'k' and event[2]:
+                self.send_message_to_client(client_id, MessageType.REMOTE_INPUT, {
+                    'type': 'key', 'key': event[1]
+                })
+
+    def send_message_to_client(self, client_id, message_type, data, payload=None):
         """Send message to specific client"""
+        if self.cluster.is_remote(client_id):
+            self.cluster.send(client_id, message_type, data, payload)
+        elif websocket_handler:
+            websocket_handler.send_to_client(client_id, message_type, data, payload)
+
+    def deliver_command(self, client_ids, message_type, data, payload=None):
+        """Send a command to clients connected to this node, returns a future of the outcome"""
         if websocket_handler:
-            websocket_handler.send_to_client(client_id, message_type, data)
+            return websocket_handler.send_command(client_ids, message_type, data, payload)
+        future = Future()
+        future.set_result(empty_result(message_type, failed={client_id: 'offline' for client_id in client_ids}))
+        return future
 
-    def broadcast_message(self, message_type, data):
+    def broadcast_message(self, message_type, data, payload=None):
         """Broadcast message to all clients"""
         if websocket_handler:
-            websocket_handler.broadcast_message(message_type, data)
+            return self.cluster.command(list(self.clients), message_type, data, payload)
 
 # Initialize server
 teacher_server = TeacherServer()
@@ -173,36 +672,176 @@ def dashboard():
 
 @app.route('/api/clients')
 def get_clients():
-    """Get all connected clients"""
-    return jsonify(list(teacher_server.clients.values()))
+    """
+    Get all connected clients.
+
+    ?epoch=<epoch>&since=<version> returns only the records changed after
+    that version. The full list carries the registry version as its ETag
+    and is answered with 304 while nothing changed.
+
+    ?include=activity adds each client's activity score, last heartbeat
+    and capture timings. These change all the time, so that list has no ETag.
+    """
+    if request.args.get('include') == 'activity':
+        activity = teacher_server.client_activity()
+        _, clients = teacher_server.clients.snapshot()
+        return jsonify([dict(client, **activity.get(client['id'], {})) for client in clients])
+
+    if 'since' in request.args:
+        return jsonify(teacher_server.clients.changes_since(
+            request.args.get('epoch'), request.args.get('since', type=int)))
+
+    etag, clients = teacher_server.clients.snapshot()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(clients)
+    response.set_etag(etag)
+    response.headers['X-Registry-Version'] = etag
+    return response
+
+@app.route('/api/remote_sessions')
+def get_remote_sessions():
+    """Current settings and measurements of each remote-control session"""
+    return jsonify(teacher_server.remote_sessions)
 
 @app.route('/api/screenshot/<client_id>')
 def get_screenshot(client_id):
-    """Get full screenshot for client"""
+    """Get latest screenshot for client"""
     if client_id in teacher_server.screenshots:
-        screenshot_data = teacher_server.screenshots[client_id]['full']
-        return jsonify({'screenshot': screenshot_data})
+        screenshot_data = teacher_server.screenshots[client_id]['thumbnail']
+        return send_file(io.BytesIO(screenshot_data), mimetype='image/jpeg')
     return jsonify({'error': 'Screenshot not found'}), 404
 
+@app.route('/api/upload', methods=['POST'])
+def upload_file():
+    """Store a file from the dashboard so it can be streamed to clients"""
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'error': 'No file'}), 400
+    upload = teacher_server.save_upload(file.filename, file.stream)
+    return jsonify({key: upload[key] for key in ('upload_id', 'filename', 'size')})
+
+@app.route('/api/collections/<collection_id>')
+def get_collection(collection_id):
+    """Progress of a folder collection"""
+    collection = websocket_handler.collector.get(collection_id) if websocket_handler else None
+    if collection is None:
+        return jsonify({'error': 'Collection not found'}), 404
+    return jsonify(collection.summary())
+
+@app.route('/api/collections/<collection_id>/all')
+def download_collection(collection_id):
+    """Every collected archive in one zip, streamed as it is built"""
+    collection = websocket_handler.collector.get(collection_id) if websocket_handler else None
+    if collection is None:
+        return jsonify({'error': 'Collection not found'}), 404
+    websocket_handler.collector.downloaded(collection_id)
+    entries = [(path, teacher_server.archive_name(client_id, collection.path))
+               for client_id, path in websocket_handler.collector.archives(collection_id)]
+    # The archives are compressed already, store them as they are
+    stream = iter_zip(entries, Config.ARCHIVE_CHUNK_SIZE, zipfile.ZIP_STORED)
+    name = secure_filename(f"{folder_name(collection.path)}-class.zip")
+    return Response(stream_with_context(stream), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
+@app.route('/api/collections/<collection_id>/<client_id>')
+def download_collected(collection_id, client_id):
+    """A single client's collected folder"""
+    collection = websocket_handler.collector.get(collection_id) if websocket_handler else None
+    if collection is None or collection.clients.get(client_id, {}).get('status') != 'complete':
+        return jsonify({'error': 'Archive not available'}), 404
+    websocket_handler.collector.downloaded(collection_id)
+    return send_file(os.path.abspath(collection.archive_path(client_id)), mimetype='application/zip',
+                     as_attachment=True, download_name=teacher_server.archive_name(client_id, collection.path))
+
+@app.route('/api/groups')
+def get_groups():
+    """Named groups of clients"""
+    return jsonify(teacher_server.groups.all())
+
+@app.route('/api/groups/<name>', methods=['PUT', 'DELETE'])
+def update_group(name):
+    """Create, replace or delete a group"""
+    if request.method == 'DELETE':
+        teacher_server.groups.delete(name)
+    else:
+        teacher_server.groups.set(name, (request.get_json() or {}).get('client_ids', []))
+    # Members may have moved to a group with other heartbeat settings
+    teacher_server.refresh_client_configs()
+    return jsonify(teacher_server.groups.all())
+
 # WebSocket Events
-@socketio.on('connect')
-def handle_connect():
+# Handlers take the dashboard's sid, so they serve both server modes
+dashboard_events = {}
+
+def dashboard_event(event):
+    """Register a dashboard Socket.IO handler(sid, data) with Flask-SocketIO and for async mode"""
+    def register(handler):
+        dashboard_events[event] = handler
+        socketio.on_event(event, lambda data=None: handler(
+            request.sid, data if isinstance(data, dict) else {}))
+        return handler
+    return register
+
+@dashboard_event('connect')
+def handle_connect(sid, data):
     print('Web client connected')
-    emit('client_list', list(teacher_server.clients.values()))
-
-@socketio.on('send_message')
-def handle_send_message(data):
+    teacher_server.viewers.add(sid)
+    teacher_server.refresh_client_configs()
+
+@dashboard_event('sync_clients')
+def handle_sync_clients(sid, data):
+    """Dashboard asks for the client records changed since the version it holds"""
+    teacher_server.emit_local('client_sync', teacher_server.sync_clients(sid, data), to=sid)
+
+@dashboard_event('disconnect')
+def handle_disconnect(sid, data):
+    # Socket.IO takes the dashboard out of its rooms by itself
+    teacher_server.cluster.left(sid)
+    viewed, controlled = teacher_server.viewers.remove(sid)
+    teacher_server.grid.remove_dashboard(sid)
+    for client_id in viewed:
+        teacher_server.release_capture_region(client_id)
+    for client_id in controlled:
+        teacher_server.stop_remote_control(sid, client_id)
+    teacher_server.refresh_client_configs()
+
+@dashboard_event('visible_clients')
+def handle_visible_clients(sid, data):
+    """Dashboard reports which clients are on screen in its grid"""
+    teacher_server.viewers.set_visible(sid, data.get('client_ids', []))
+    teacher_server.refresh_client_configs()
+
+@dashboard_event('view_client')
+def handle_view_client(sid, data):
+    """Dashboard opened or closed the large view of a client"""
+    client_id = data.get('client_id')
+    if data.get('action') == 'open':
+        teacher_server.join_room(sid, room('view', client_id))
+        teacher_server.viewers.open_view(sid, client_id)
+    else:
+        teacher_server.leave_room(sid, room('view', client_id))
+        teacher_server.viewers.close_view(sid, client_id)
+        teacher_server.release_capture_region(client_id)
+    teacher_server.refresh_client_configs()
+
+@dashboard_event('view_region')
+def handle_view_region(sid, data):
+    """Dashboard picked a monitor or dragged a rectangle to zoom into"""
+    teacher_server.set_capture_region(data.get('client_id'), data.get('region'))
+
+@dashboard_event('send_message')
+def handle_send_message(sid, data):
     """Send message to client(s)"""
     client_id = data.get('client_id')
     message = data.get('message')
 
-    if client_id == 'all':
-        teacher_server.broadcast_message(MessageType.MESSAGE_SEND, {'message': message})
-    else:
-        teacher_server.send_message_to_client(client_id, MessageType.MESSAGE_SEND, {'message': message})
+    teacher_server.send_command(client_id, MessageType.MESSAGE_SEND, {'message': message},
+                                sid=sid)
 
-@socketio.on('power_control')
-def handle_power_control(data):
+@dashboard_event('power_control')
+def handle_power_control(sid, data):
     """Handle power control commands"""
     client_id = data.get('client_id')
     action = data.get('action')
@@ -215,46 +854,85 @@ def handle_power_control(data):
     }.get(action)
 
     if message_type:
-        if client_id == 'all':
-            teacher_server.broadcast_message(message_type, {'force': True})
-        else:
-            teacher_server.send_message_to_client(client_id, message_type, {'force': True})
+        teacher_server.send_command(client_id, message_type, {'force': True}, sid=sid)
 
-@socketio.on('remote_control')
-def handle_remote_control(data):
+@dashboard_event('remote_control')
+def handle_remote_control(sid, data):
     """Handle remote control commands"""
     client_id = data.get('client_id')
     action = data.get('action')
 
     if action == 'start':
+        teacher_server.join_room(sid, room('remote', client_id))
+        teacher_server.viewers.start_control(sid, client_id)
+        # Also asks for a keyframe, which a dashboard joining a running session needs
         teacher_server.send_message_to_client(client_id, MessageType.REMOTE_CONTROL_START, {})
-        teacher_server.remote_sessions[client_id] = True
+        teacher_server.start_remote_session(client_id)
     elif action == 'stop':
-        teacher_server.send_message_to_client(client_id, MessageType.REMOTE_CONTROL_STOP, {})
-        teacher_server.remote_sessions.pop(client_id, None)
+        teacher_server.leave_room(sid, room('remote', client_id))
+        teacher_server.stop_remote_control(sid, client_id)
 
-@socketio.on('remote_input')
-def handle_remote_input(data):
+@dashboard_event('remote_input')
+def handle_remote_input(sid, data):
     """Handle remote input events"""
     client_id = data.get('client_id')
-    if client_id in teacher_server.remote_sessions:
+    if client_id not in teacher_server.remote_sessions:
+        return
+    if 'events' in data:
+        teacher_server.send_remote_input(client_id, data['events'])
+    else:
         teacher_server.send_message_to_client(client_id, MessageType.REMOTE_INPUT, data)
 
-@socketio.on('file_operation')
-def handle_file_operation(data):
+@dashboard_event('file_operation')
+def handle_file_operation(sid, data):
     """Handle file operations"""
     client_id = data.get('client_id')
     operation = data.get('operation')
 
+    # Replies go to the dashboards browsing this client, not to everyone
+    teacher_server.join_room(sid, room('files', client_id))
     teacher_server.send_message_to_client(client_id, MessageType.FILE_MANAGER, data)
 
-@socketio.on('execute_program')
-def handle_execute_program(data):
+@dashboard_event('file_manager_closed')
+def handle_file_manager_closed(sid, data):
+    """Dashboard closed the file manager, stop sending it that client's replies"""
+    teacher_server.leave_room(sid, room('files', data.get('client_id')))
+
+@dashboard_event('execute_program')
+def handle_execute_program(sid, data):
     """Handle program execution"""
     client_id = data.get('client_id')
-    program_data = data.get('program_data')
-
-    teacher_server.send_message_to_client(client_id, MessageType.EXECUTE_PROGRAM, program_data)
+    program_data = dict(data.get('program_data'))
+
+    # The dashboard uploads the file to /api/upload first; older dashboards
+    # send it inline as binary or base64
+    upload = teacher_server.uploads.get(program_data.pop('upload_id', None))
+    if upload is None:
+        payload = program_data.pop('data')
+        if isinstance(payload, str):
+            payload = base64.b64decode(payload)
+        upload = teacher_server.save_upload(program_data.get('filename', ''), io.BytesIO(payload))
+
+    client_ids = list(teacher_server.clients) if client_id == 'all' else [client_id]
+    info = {'purpose': 'execute', 'silent': program_data.get('silent', False)}
+    teacher_server.distribute_file(client_ids, upload, info)
+
+@dashboard_event('upload_file')
+def handle_upload_file(sid, data):
+    """Copy an uploaded file into a folder on a client, or unpack an uploaded folder there"""
+    upload = teacher_server.uploads.get(data.get('upload_id'))
+    if upload is None:
+        teacher_server.emit_local('transfer_progress', {'client_id': data.get('client_id'), 'status': 'error'},
+                                  to=sid)
+        return
+    purpose = 'extract' if data.get('extract') else 'upload'
+    teacher_server.send_file_to_client(data.get('client_id'), upload,
+                                       {'purpose': purpose, 'path': data.get('path')})
+
+@dashboard_event('collect_folder')
+def handle_collect_folder(sid, data):
+    """Download a folder from one client, or the same folder from a group or the whole class"""
+    teacher_server.collect_folder(data.get('target'), data.get('path'), sid=sid)
 
 if __name__ == '__main__':
     teacher_server.start()
\ No newline at end of file
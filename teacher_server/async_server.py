@@ -0,0 +1,238 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+from aiohttp import web
+
+from shared.config import Config
+from shared.utils import get_local_ip
+
+class AsyncDashboards:
+    """
+    Dashboard connections served by a python-socketio AsyncServer.
+
+    Emits made on the loop are started there as tasks; only emits from
+    other threads, like the cluster backend's reader, hop over to it.
+    """
+
+    def __init__(self, sio: socketio.AsyncServer, loop: asyncio.AbstractEventLoop):
+        self.sio = sio
+        self.loop = loop
+
+    def emit(self, event, data, to=None):
+        coroutine = self.sio.emit(event, data, to=to)
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.loop.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def join(self, sid, name):
+        self.sio.manager.basic_enter_room(sid, '/', name)
+
+    def leave(self, sid, name):
+        self.sio.manager.basic_leave_room(sid, '/', name)
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input of a request whose body is still arriving on the loop"""
+
+    def __init__(self, content, loop: asyncio.AbstractEventLoop):
+        self.content = content
+        self.loop = loop
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = asyncio.run_coroutine_threadsafe(self.content.read(len(buffer)), self.loop).result()
+        buffer[:len(data)] = data
+        return len(data)
+
+class FileWrapper:
+    """wsgi.file_wrapper reading files in large blocks instead of werkzeug's 8 KB"""
+
+    def __init__(self, file, block_size: int = None):
+        self.file = file
+        self.block_size = block_size or Config.ARCHIVE_CHUNK_SIZE
+
+    def __iter__(self):
+        return iter(lambda: self.file.read(self.block_size), b'')
+
+    def close(self):
+        self.file.close()
+
+class ResponseAborted(Exception):
+    """The response ended before the app finished writing it"""
+
+class WSGIBridge:
+    """
+    Serves the Flask routes from aiohttp.
+
+    Each request runs the WSGI app in one worker thread from start to end,
+    since Flask keeps request state per thread, and its output is handed to
+    the loop through a small queue so slow downloads hold back the app.
+    Only page loads and the REST API take this path; dashboard events and
+    student messages stay on the loop.
+    """
+
+    def __init__(self, wsgi_app, loop: asyncio.AbstractEventLoop, workers: int = 16):
+        self.wsgi_app = wsgi_app
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi')
+
+    def environ(self, request: web.Request) -> dict:
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': request.path.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': Config.SERVER_HOST,
+            'SERVER_PORT': str(Config.SERVER_PORT),
+            'SERVER_PROTOCOL': f"HTTP/{request.version.major}.{request.version.minor}",
+            'REMOTE_ADDR': request.remote or '',
+            'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': request.headers.get('Content-Length', ''),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BufferedReader(RequestBody(request.content, self.loop), Config.ARCHIVE_CHUNK_SIZE),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+        for name, value in request.headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                continue
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def run_app(self, environ: dict, queue: asyncio.Queue, aborted: list):
+        """Worker thread: run the app and queue ('headers', ...), body chunks, then None"""
+        def put(item):
+            if aborted:
+                raise ResponseAborted()
+            asyncio.run_coroutine_threadsafe(queue.put(item), self.loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return lambda data: None
+
+        try:
+            try:
+                result = self.wsgi_app(environ, start_response)
+                try:
+                    sent_headers = False
+                    for chunk in result:
+                        if not sent_headers:
+                            put(('headers', *started))
+                            sent_headers = True
+                        if chunk:
+                            put(chunk)
+                    if not sent_headers:
+                        put(('headers', *started))
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+            except ResponseAborted:
+                raise
+            except Exception as e:
+                put(e)
+            put(None)
+        except ResponseAborted:
+            pass
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        queue = asyncio.Queue(maxsize=4)
+        aborted = []
+        self.loop.run_in_executor(self.executor, self.run_app, self.environ(request), queue, aborted)
+        try:
+            return await self.respond(request, queue)
+        finally:
+            # Unblock the worker if the response ended early, it stops at its next chunk
+            aborted.append(True)
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def respond(self, request: web.Request, queue: asyncio.Queue) -> web.StreamResponse:
+        first = await queue.get()
+        if not isinstance(first, tuple):
+            print(f"HTTP error for {request.path}: {first}")
+            return web.Response(status=500, text='Internal Server Error')
+
+        _, status, headers = first
+        code, _, reason = status.partition(' ')
+        response = web.StreamResponse(status=int(code), reason=reason or None)
+        for name, value in headers:
+            response.headers.add(name, value)
+        await response.prepare(request)
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                # Headers are out already, all that is left is cutting the body short
+                print(f"HTTP error for {request.path}: {chunk}")
+                break
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+def dashboard_handler(event, handler):
+    """Adapt a handler(sid, data) to the argument list python-socketio passes for event"""
+    if event == 'connect':
+        def on_event(sid, environ, auth=None):
+            handler(sid, {})
+    elif event == 'disconnect':
+        def on_event(sid, *args):
+            handler(sid, {})
+    else:
+        def on_event(sid, data=None):
+            handler(sid, data if isinstance(data, dict) else {})
+    return on_event
+
+async def serve(server, websocket_handler, wsgi_app, dashboard_events):
+    loop = asyncio.get_running_loop()
+    sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+    for event, handler in dashboard_events.items():
+        sio.on(event, dashboard_handler(event, handler))
+    server.dashboards = AsyncDashboards(sio, loop)
+
+    web_app = web.Application(client_max_size=Config.MAX_FILE_SIZE)
+    sio.attach(web_app)
+    web_app.router.add_route('*', '/{path:.*}', WSGIBridge(wsgi_app, loop).handle)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, Config.SERVER_HOST, Config.SERVER_PORT).start()
+
+    async def grid_ticks():
+        while True:
+            await asyncio.sleep(server.grid.interval)
+            try:
+                server.grid.flush()
+            except Exception as e:
+                print(f"Grid update error: {e}")
+
+    grid_task = loop.create_task(grid_ticks())
+    server.cluster.start()
+    print(f"Teacher server starting on {get_local_ip()}:{Config.SERVER_PORT} (async mode)")
+    try:
+        await websocket_handler.serve()
+    finally:
+        grid_task.cancel()
+        await runner.cleanup()
+
+def run_async(server, websocket_handler, wsgi_app, dashboard_events):
+    """Serve the web app, dashboards and students from a single event loop"""
+    try:
+        asyncio.run(serve(server, websocket_handler, wsgi_app, dashboard_events))
+    except KeyboardInterrupt:
+        pass
@@ -30,6 +30,26 @@ class AuthManager:
         except jwt.InvalidTokenError:
             return None
 
+    def generate_session_ticket(self, client_id: str, info: dict) -> str:
+        """Signed copy of a client's registration, so it can resume after a reconnect or restart"""
+        payload = {
+            'client_id': client_id,
+            'info': info,
+            'iat': time.time(),
+            'exp': time.time() + Config.SESSION_TICKET_EXPIRY
+        }
+        return jwt.encode(payload, self.secret_key, algorithm='HS256')
+
+    def verify_session_ticket(self, ticket: str, client_id: str) -> Optional[dict]:
+        """Verify a session ticket and return the registration it carries"""
+        try:
+            payload = jwt.decode(ticket, self.secret_key, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return None
+        if payload.get('client_id') != client_id or not isinstance(payload.get('info'), dict):
+            return None
+        return payload['info']
+
     def generate_client_hash(self, client_id: str, timestamp: float) -> str:
         """Generate hash for client authentication"""
         message = f"{client_id}:{timestamp}"
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Dict, Iterable, Tuple
+
+from shared.config import Config
+from shared.protocol import Message, MessageType, CAPABILITY_BINARY, CAPABILITY_ACK
+from shared.scheduler import priority_for
+
+class Broadcaster:
+    """
+    Sends one command to many clients and collects the outcome per client.
+
+    The message is encoded once per framing and queued to every client at
+    the same time, so a command to the whole room completes in about one
+    round trip. Clients that support acknowledgements answer with
+    COMMAND_ACK; for older clients a completed write counts as delivered.
+    Runs on the WebSocket event loop.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.pending: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def send(self, client_ids: Iterable[str], message_type: MessageType, data: dict,
+                   payload: bytes = None, timeout: float = None) -> dict:
+        client_ids = list(dict.fromkeys(client_ids))
+        timeout = timeout or Config.BROADCAST_TIMEOUT
+        message = Message(message_type, dict(data, ack=True), payload=payload)
+        frames = {}  # binary framing or not -> encoded message
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        outcomes = await asyncio.gather(*(
+            self._deliver(client_id, message, frames, timeout) for client_id in client_ids
+        ))
+
+        result = {
+            'command': message_type.value,
+            'delivered': [],
+            'failed': {},
+            'timed_out': [],
+            'elapsed_ms': round((loop.time() - started) * 1000, 1)
+        }
+        for client_id, (status, reason) in zip(client_ids, outcomes):
+            if status == 'delivered':
+                result['delivered'].append(client_id)
+            elif status == 'timed_out':
+                result['timed_out'].append(client_id)
+            else:
+                result['failed'][client_id] = reason
+        return result
+
+    def handle_ack(self, client_id: str, data: dict):
+        future = self.pending.get((client_id, data.get('id')))
+        if future and not future.done():
+            future.set_result(data)
+
+    async def _deliver(self, client_id: str, message: Message, frames: dict, timeout: float):
+        scheduler = self.handler.schedulers.get(client_id)
+        if not scheduler:
+            return 'failed', 'offline'
+
+        binary = self.handler.has_capability(client_id, CAPABILITY_BINARY)
+        if binary not in frames:
+            frames[binary] = message.to_binary() if binary else message.to_json()
+
+        ack = None
+        key = (client_id, message.id)
+        if self.handler.has_capability(client_id, CAPABILITY_ACK):
+            ack = self.pending[key] = asyncio.get_running_loop().create_future()
+
+        async def deliver():
+            await scheduler.put(frames[binary], priority_for(message.type))
+            if ack:
+                await ack
+
+        try:
+            await asyncio.wait_for(deliver(), timeout)
+            return 'delivered', None
+        except asyncio.TimeoutError:
+            return 'timed_out', None
+        except Exception as e:
+            return 'failed', str(e)
+        finally:
+            self.pending.pop(key, None)
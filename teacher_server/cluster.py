@@ -0,0 +1,709 @@
+import asyncio
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from shared.config import Config
+from shared.protocol import MessageType, CAPTURE_PAUSED, CAPTURE_THUMBNAIL, CAPTURE_FULL
+
+HEADER = struct.Struct('!I')
+CAPTURE_RANK = {CAPTURE_PAUSED: 0, CAPTURE_THUMBNAIL: 1, CAPTURE_FULL: 2}
+# Frames a slow node can miss; the next thumbnail or frame replaces them
+DROPPABLE = {'thumbnail', 'emit'}
+
+def pack(message: dict) -> bytes:
+    """
+    Length-prefixed frame of a message: a JSON header followed by the raw
+    bytes of every bytes value in it, so images and files need no base64.
+    """
+    blobs = []
+
+    def strip(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            blobs.append(bytes(value))
+            return {'__blob__': len(blobs) - 1}
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [strip(item) for item in value]
+        return value
+
+    header = json.dumps({'message': strip(message), 'blobs': [len(blob) for blob in blobs]}).encode()
+    body = HEADER.pack(len(header)) + header + b''.join(blobs)
+    return HEADER.pack(len(body)) + body
+
+def unpack(body: bytes) -> dict:
+    """Message of a frame without its length prefix"""
+    size = HEADER.unpack_from(body)[0]
+    header = json.loads(body[HEADER.size:HEADER.size + size])
+    blobs, offset = [], HEADER.size + size
+    for length in header['blobs']:
+        blobs.append(body[offset:offset + length])
+        offset += length
+
+    def restore(value):
+        if isinstance(value, dict):
+            if '__blob__' in value and len(value) == 1:
+                return blobs[value['__blob__']]
+            return {key: restore(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [restore(item) for item in value]
+        return value
+
+    return restore(header['message'])
+
+def peek(body: bytes) -> dict:
+    """Message of a frame with its blobs left out, enough to route it"""
+    size = HEADER.unpack_from(body)[0]
+    return json.loads(body[HEADER.size:HEADER.size + size])['message']
+
+def read_frame(sock: socket.socket) -> Optional[bytes]:
+    """Next frame body from a blocking socket, None once it is closed"""
+    def read(count):
+        data = bytearray()
+        while len(data) < count:
+            chunk = sock.recv(count - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return bytes(data)
+
+    header = read(HEADER.size)
+    return header and read(HEADER.unpack(header)[0])
+
+class MemoryBackend:
+    """
+    Delivers messages to the other nodes in this process.
+
+    The default for a single server, where there is nobody to deliver to,
+    and handy for running several TeacherServers side by side in tests.
+    Messages still go through pack() so every backend behaves the same.
+    """
+
+    hubs: Dict[str, list] = {}
+    hubs_lock = threading.Lock()
+
+    def __init__(self, hub: str = 'default'):
+        self.hub = hub
+        self.deliver: Optional[Callable[[dict], None]] = None
+
+    def start(self, deliver: Callable[[dict], None], connected: Callable[[], None]):
+        self.deliver = deliver
+        with self.hubs_lock:
+            self.hubs.setdefault(self.hub, []).append(self)
+        connected()
+
+    def stop(self, node: str):
+        with self.hubs_lock:
+            self.hubs.get(self.hub, []).remove(self)
+        self.publish({'kind': 'node_left', 'node': node, 'to': None})
+
+    def publish(self, message: dict):
+        with self.hubs_lock:
+            others = [backend for backend in self.hubs.get(self.hub, []) if backend is not self]
+        if not others:
+            return
+        frame = pack(message)[HEADER.size:]
+        for backend in others:
+            backend.deliver(unpack(frame))
+
+class BrokerBackend:
+    """
+    Exchanges messages with the other nodes through a Broker over TCP.
+
+    A reader thread delivers incoming messages and reconnects when the
+    broker goes away; whatever is published while disconnected is dropped,
+    and the cluster re-announces its clients once the connection is back.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.address = (host, port)
+        self.sock: Optional[socket.socket] = None
+        self.send_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self, deliver: Callable[[dict], None], connected: Callable[[], None]):
+        thread = threading.Thread(target=self._run, args=(deliver, connected), daemon=True)
+        thread.start()
+
+    def stop(self, node: str):
+        self.stopped.set()
+        if self.sock:
+            self.sock.close()
+
+    def publish(self, message: dict):
+        frame = pack(message)
+        with self.send_lock:
+            if self.sock is None:
+                return
+            try:
+                self.sock.sendall(frame)
+            except OSError as e:
+                print(f"Cluster broker send failed: {e}")
+
+    def _run(self, deliver, connected):
+        while not self.stopped.is_set():
+            try:
+                sock = socket.create_connection(self.address)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError as e:
+                print(f"Cluster broker unreachable: {e}")
+                self.stopped.wait(Config.CLUSTER_RETRY_INTERVAL)
+                continue
+
+            with self.send_lock:
+                self.sock = sock
+            connected()
+            try:
+                while True:
+                    body = read_frame(sock)
+                    if body is None:
+                        break
+                    try:
+                        deliver(unpack(body))
+                    except Exception as e:
+                        print(f"Cluster message error: {e}")
+            except OSError:
+                pass
+            finally:
+                with self.send_lock:
+                    self.sock = None
+                sock.close()
+            print("Cluster broker connection lost")
+
+class Broker:
+    """
+    Relays the frames a node sends to the other connected nodes.
+
+    Only the JSON header of a frame is read, never its blobs: a frame
+    addressed to one node goes to that node alone, others to everyone.
+    A node that falls more than Config.CLUSTER_BROKER_BUFFER behind misses
+    thumbnails and dashboard events until it catches up, rather than the
+    broker buffering them without bound; everything else is still queued.
+    """
+
+    def __init__(self):
+        self.writers: Set[asyncio.StreamWriter] = set()
+        self.nodes: Dict[str, asyncio.StreamWriter] = {}
+
+    async def handle_node(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        node = None
+        self.writers.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                body = await reader.readexactly(HEADER.unpack(header)[0])
+                message = peek(body)
+                if node is None:
+                    node = message.get('node')
+                    self.nodes[node] = writer
+                    print(f"Cluster node joined: {node}")
+                self.relay(writer, header + body, message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            if node and self.nodes.get(node) is writer:
+                del self.nodes[node]
+            writer.close()
+            if node:
+                print(f"Cluster node left: {node}")
+                message = {'kind': 'node_left', 'node': node, 'to': None}
+                self.relay(writer, pack(message), message)
+
+    def relay(self, sender: asyncio.StreamWriter, frame: bytes, message: dict):
+        to = message.get('to')
+        if to is None:
+            targets = [writer for writer in self.writers if writer is not sender]
+        else:
+            targets = [self.nodes[to]] if to in self.nodes else []
+        for writer in targets:
+            if writer.is_closing():
+                continue
+            if message.get('kind') in DROPPABLE and \
+                    writer.transport.get_write_buffer_size() > Config.CLUSTER_BROKER_BUFFER:
+                continue
+            writer.write(frame)
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_node, host, port)
+        print(f"Cluster broker listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+def make_backend():
+    """Backend for Config.CLUSTER_BROKER, in-memory when it is not set"""
+    if Config.CLUSTER_BROKER:
+        host, _, port = Config.CLUSTER_BROKER.rpartition(':')
+        return BrokerBackend(host or '127.0.0.1', int(port))
+    return MemoryBackend()
+
+class Cluster:
+    """
+    Shares clients between teacher servers behind one school network.
+
+    Every node keeps the full client registry: a node announces the
+    clients connected to it, with their capabilities and status, and the
+    others copy them and remember which node owns each client. Messages
+    for a client owned elsewhere are forwarded to its owner, acknowledged
+    commands are split by owner and their results merged, and dashboard
+    events, thumbnails and remote-session stats are fanned out so any
+    node's dashboards see the whole class. Events for a room, like the
+    full-size frames of a large view, only go to the nodes that said they
+    have a dashboard in it. Capture settings wanted by other nodes'
+    dashboards are sent to the owner, which combines them with its own.
+
+    Files go to a client through its owner as well: the owner fetches the
+    upload from the node that has it one chunk at a time, stores its own
+    copy and streams or swarms it from there. A folder collected from a
+    client is requested through the owner, which relays the client's
+    archive chunks to the node that asked, so neither ever holds a whole
+    file in memory.
+
+    Nothing but the hello is published while no other node is known, so a
+    single server pays nothing for being a cluster of one.
+    """
+
+    def __init__(self, server, backend=None):
+        self.server = server
+        self.backend = backend or make_backend()
+        self.node = uuid.uuid4().hex[:8]
+        self.lock = threading.Lock()
+        self.owners: Dict[str, str] = {}  # client_id -> node holding its connection
+        self.capabilities: Dict[str, Set[str]] = {}  # client_id -> capabilities, remote clients
+        self.demands: Dict[str, Dict[str, dict]] = {}  # client_id -> node -> capture settings wanted
+        self.sent_demands: Dict[str, dict] = {}  # client_id -> capture settings last sent to its owner
+        self.pending: Dict[str, Future] = {}  # request id -> future of another node's answer
+        self.relays: Dict[str, Tuple[str, Set[str]]] = {}  # collection id -> node that asked, clients here
+        self.peers: Set[str] = set()  # Other nodes heard from
+        self.subscribers: Dict[str, Set[str]] = {}  # room -> other nodes with dashboards in it
+        self.rooms: Dict[str, Set[str]] = {}  # room -> sids of this node's dashboards in it
+        # Held while publishing room changes, so a node being introduced gets them in order
+        self.rooms_lock = threading.RLock()
+
+    def start(self):
+        self.backend.start(self.receive, self.connected)
+
+    def stop(self):
+        self.backend.stop(self.node)
+
+    def publish(self, kind: str, to: Optional[str] = None, **fields):
+        # Nobody to hear it; nodes joining later say hello and get introduced
+        if kind != 'hello' and not self.peers:
+            return
+        self.backend.publish(dict(fields, kind=kind, node=self.node, to=to))
+
+    def connected(self):
+        """Joined or rejoined the cluster, the others answer with what they have"""
+        self.publish('hello')
+        self.announce()
+
+    def introduce(self, node: str):
+        """Tell a node that joined which rooms this node's dashboards are in and its clients"""
+        with self.rooms_lock:
+            self.publish('rooms', to=node, rooms=sorted(self.rooms))
+        self.announce(to=node)
+
+    def announce(self, to: Optional[str] = None):
+        for client_id, client in self.server.local_clients():
+            self.publish('presence', to=to, client_id=client_id, info=client['info'],
+                         status=client['status'],
+                         capabilities=sorted(self.server.local_capabilities(client_id)))
+
+    def owner(self, client_id: str) -> Optional[str]:
+        return self.owners.get(client_id)
+
+    def is_remote(self, client_id: str) -> bool:
+        owner = self.owners.get(client_id)
+        return owner is not None and owner != self.node
+
+    def has_capability(self, client_id: str, capability: str) -> bool:
+        return capability in self.capabilities.get(client_id, ())
+
+    def split(self, client_ids) -> Tuple[List[str], Dict[str, List[str]]]:
+        """Clients connected here or unknown, and the others by the node holding their connection"""
+        local, remote = [], {}
+        for client_id in client_ids:
+            owner = self.owners.get(client_id)
+            if owner in (None, self.node):
+                local.append(client_id)
+            else:
+                remote.setdefault(owner, []).append(client_id)
+        return local, remote
+
+    # Changes on this node, announced to the others
+
+    def client_registered(self, client_id: str, info: dict, capabilities: Set[str]):
+        with self.lock:
+            self.owners[client_id] = self.node
+            self.capabilities.pop(client_id, None)
+            self.sent_demands.pop(client_id, None)
+        self.publish('presence', client_id=client_id, info=info, status='online',
+                     capabilities=sorted(capabilities))
+
+    def client_status(self, client_id: str, status: str):
+        self.client_statuses({client_id: status})
+
+    def client_statuses(self, statuses: Dict[str, str]):
+        """Several status changes, e.g. from one liveness tick, in one message"""
+        self.publish('status', statuses=statuses)
+
+    def thumbnail(self, client_id: str, image: bytes):
+        self.publish('thumbnail', client_id=client_id, image=image)
+
+    def remote_session(self, client_id: str, stats: Optional[dict]):
+        """Session started or measured (stats) or ended (None)"""
+        self.publish('session', client_id=client_id, stats=stats)
+
+    def emit(self, event: str, data, to: Optional[str] = None):
+        """A dashboard event for everyone or a room, for the other nodes' dashboards"""
+        if to is None:
+            self.publish('emit', event=event, data=data, room=None)
+            return
+        with self.lock:
+            nodes = list(self.subscribers.get(to, ()))
+        for node in nodes:
+            self.publish('emit', to=node, event=event, data=data, room=to)
+
+    def joined(self, sid: str, room: str):
+        """A dashboard here joined a room, the others hear of it if it is the first"""
+        with self.rooms_lock:
+            members = self.rooms.setdefault(room, set())
+            if not members:
+                self.publish('subscribe', room=room, subscribed=True)
+            members.add(sid)
+
+    def left(self, sid: str, room: Optional[str] = None):
+        """A dashboard here left a room, or every room when it disconnected"""
+        with self.rooms_lock:
+            for name in [room] if room else list(self.rooms):
+                members = self.rooms.get(name)
+                if not members or sid not in members:
+                    continue
+                members.discard(sid)
+                if not members:
+                    del self.rooms[name]
+                    self.publish('subscribe', room=name, subscribed=False)
+
+    def send(self, client_id: str, message_type: MessageType, data: dict, payload: bytes = None):
+        self.publish('send', to=self.owners.get(client_id), client_id=client_id,
+                     message_type=message_type.value, data=data, payload=payload)
+
+    def demand(self, client_id: str, config: dict):
+        """Capture settings this node's dashboards need from a client owned elsewhere"""
+        with self.lock:
+            if self.sent_demands.get(client_id) == config:
+                return
+            self.sent_demands[client_id] = config
+        self.publish('demand', to=self.owners.get(client_id), client_id=client_id, config=config)
+
+    def merge_demands(self, client_id: str, config: dict) -> dict:
+        """The most demanding of the local settings and those other nodes asked for"""
+        with self.lock:
+            wanted = list(self.demands.get(client_id, {}).values())
+        for other in wanted:
+            if CAPTURE_RANK.get(other.get('capture_mode'), 0) > CAPTURE_RANK.get(config['capture_mode'], 0):
+                config = other
+        return config
+
+    def command(self, client_ids: List[str], message_type: MessageType, data: dict,
+                payload: bytes = None) -> Future:
+        """
+        Send a command wherever its clients are connected.
+
+        Returns a future resolving to the merged delivered, failed and timed
+        out clients, like WebSocketHandler.send_command.
+        """
+        local, remote = self.split(client_ids)
+        futures = [self.server.deliver_command(local, message_type, data, payload)] if local else []
+        for node, ids in remote.items():
+            futures.append(self._request_command(node, ids, message_type, data, payload))
+        return merge_results(futures, message_type)
+
+    def _request_command(self, node: str, client_ids: List[str], message_type: MessageType,
+                         data: dict, payload: bytes = None) -> Future:
+        request_id = uuid.uuid4().hex
+        future = self.pending[request_id] = Future()
+
+        def expire():
+            if self.pending.pop(request_id, None) is future and not future.done():
+                future.set_result(empty_result(message_type, timed_out=client_ids))
+
+        timer = threading.Timer(Config.BROADCAST_TIMEOUT + Config.CLUSTER_COMMAND_GRACE, expire)
+        timer.daemon = True
+        timer.start()
+        future.add_done_callback(lambda _: timer.cancel())
+        self.publish('command', to=node, request_id=request_id, client_ids=client_ids,
+                     message_type=message_type.value, data=data, payload=payload)
+        return future
+
+    def transfer(self, node: str, client_ids: List[str], upload: dict, info: dict):
+        """Have a node send an upload stored here to its clients"""
+        self.publish('transfer', to=node, client_ids=client_ids, info=info,
+                     upload={key: upload[key] for key in ('upload_id', 'filename', 'size', 'sha256')})
+
+    def upload_reader(self, node: str, upload: dict) -> 'UploadReader':
+        return UploadReader(self, node, upload['upload_id'], upload['size'])
+
+    def read_upload(self, node: str, upload_id: str, offset: int, size: int) -> bytes:
+        """One chunk of an upload stored on another node, waits for the answer"""
+        request_id = uuid.uuid4().hex
+        future = self.pending[request_id] = Future()
+        self.publish('upload_read', to=node, request_id=request_id, upload_id=upload_id,
+                     offset=offset, size=size)
+        try:
+            answer = future.result(timeout=Config.CLUSTER_READ_TIMEOUT)
+        except FutureTimeoutError:
+            raise IOError(f"No answer from node {node}")
+        finally:
+            self.pending.pop(request_id, None)
+        if answer.get('error'):
+            raise IOError(answer['error'])
+        return answer['data']
+
+    def relay_chunk(self, client_id: str, data: dict, payload: bytes = None) -> bool:
+        """Pass a collected folder chunk on to the node that asked for it, False if none did"""
+        collection_id = data.get('download_id')
+        with self.lock:
+            relay = self.relays.get(collection_id)
+            if relay is None or client_id not in relay[1]:
+                return False
+            node, clients = relay
+            if data.get('done') or data.get('error'):
+                clients.discard(client_id)
+                if not clients:
+                    del self.relays[collection_id]
+        self.publish('collected', to=node, client_id=client_id, data=data, payload=payload)
+        return True
+
+    def relay_failed(self, client_id: str, error: str):
+        """A client here dropped before sending the folders other nodes asked for"""
+        with self.lock:
+            collection_ids = [collection_id for collection_id, (_, clients) in self.relays.items()
+                              if client_id in clients]
+        for collection_id in collection_ids:
+            self.relay_chunk(client_id, {'download_id': collection_id, 'error': error})
+
+    # Messages from the other nodes
+
+    def receive(self, message: dict):
+        node = message.get('node')
+        if node == self.node or message.get('to') not in (None, self.node):
+            return
+        if node not in self.peers:
+            self.peers.add(node)
+            if message.get('kind') != 'hello':
+                self.introduce(node)
+        handler = getattr(self, f"on_{message.get('kind')}", None)
+        if handler:
+            handler(message)
+
+    def on_hello(self, message):
+        # Also when the node is known already, it may have restarted
+        self.introduce(message['node'])
+
+    def on_rooms(self, message):
+        node, rooms = message['node'], set(message['rooms'])
+        with self.lock:
+            for room in set(self.subscribers) | rooms:
+                nodes = self.subscribers.setdefault(room, set())
+                if room in rooms:
+                    nodes.add(node)
+                else:
+                    nodes.discard(node)
+                if not nodes:
+                    del self.subscribers[room]
+
+    def on_subscribe(self, message):
+        node, room = message['node'], message['room']
+        with self.lock:
+            nodes = self.subscribers.setdefault(room, set())
+            if message['subscribed']:
+                nodes.add(node)
+            else:
+                nodes.discard(node)
+            if not nodes:
+                del self.subscribers[room]
+
+    def on_presence(self, message):
+        client_id = message['client_id']
+        with self.lock:
+            moved = self.owners.get(client_id) != message['node']
+            self.owners[client_id] = message['node']
+            self.capabilities[client_id] = set(message.get('capabilities', []))
+            if moved:
+                # Tell the new owner what this node's dashboards need
+                self.sent_demands.pop(client_id, None)
+                self.demands.pop(client_id, None)
+        self.server.apply_presence(client_id, message['info'], message['status'])
+        if moved:
+            self.server.push_client_config(client_id)
+
+    def on_status(self, message):
+        for client_id, status in message['statuses'].items():
+            if self.owners.get(client_id) == message['node']:
+                self.server.apply_presence(client_id, None, status)
+
+    def on_node_left(self, message):
+        node = message['node']
+        self.peers.discard(node)
+        with self.lock:
+            for room in list(self.subscribers):
+                self.subscribers[room].discard(node)
+                if not self.subscribers[room]:
+                    del self.subscribers[room]
+            orphans = [client_id for client_id, owner in self.owners.items() if owner == node]
+            relaxed = [client_id for client_id, demands in self.demands.items()
+                       if demands.pop(node, None) is not None]
+            for collection_id in [collection_id for collection_id, (asked, _) in self.relays.items()
+                                  if asked == node]:
+                del self.relays[collection_id]
+        for client_id in orphans:
+            self.server.apply_presence(client_id, None, 'offline')
+        self.server.clients_lost(orphans)
+        for client_id in relaxed:
+            self.server.push_client_config(client_id)
+
+    def on_thumbnail(self, message):
+        self.server.apply_thumbnail(message['client_id'], message['image'])
+
+    def on_session(self, message):
+        self.server.apply_remote_session(message['client_id'], message['stats'])
+
+    def on_emit(self, message):
+        self.server.emit_local(message['event'], message['data'], message.get('room'))
+
+    def on_send(self, message):
+        client_id = message['client_id']
+        if self.owners.get(client_id) == self.node:
+            self.server.send_message_to_client(client_id, MessageType(message['message_type']),
+                                               message['data'], message.get('payload'))
+
+    def on_demand(self, message):
+        client_id = message['client_id']
+        with self.lock:
+            self.demands.setdefault(client_id, {})[message['node']] = message['config']
+        self.server.push_client_config(client_id)
+
+    def on_command(self, message):
+        message_type = MessageType(message['message_type'])
+        collection_id = None
+        if message_type == MessageType.FILE_DOWNLOAD:
+            # The archive chunks go back to the node that asked for the folder
+            collection_id = message['data']['download_id']
+            with self.lock:
+                self.relays[collection_id] = (message['node'], set(message['client_ids']))
+        future = self.server.deliver_command(message['client_ids'], message_type, message['data'],
+                                             message.get('payload'))
+
+        def reply(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = empty_result(message_type, failed={client_id: str(e)
+                                                             for client_id in message['client_ids']})
+            if collection_id:
+                # The node that asked fails these from the result itself
+                with self.lock:
+                    relay = self.relays.get(collection_id)
+                    if relay:
+                        relay[1].difference_update(result['failed'], result['timed_out'])
+            self.publish('command_result', to=message['node'],
+                         request_id=message['request_id'], result=result)
+
+        future.add_done_callback(reply)
+
+    def on_command_result(self, message):
+        future = self.pending.pop(message['request_id'], None)
+        if future and not future.done():
+            future.set_result(message['result'])
+
+    def on_transfer(self, message):
+        # Fetching the file waits for answers this thread delivers
+        thread = threading.Thread(target=self.server.receive_transfer, daemon=True,
+                                  args=(message['node'], message['upload'], message['client_ids'],
+                                        message['info']))
+        thread.start()
+
+    def on_upload_read(self, message):
+        try:
+            data, error = self.server.read_upload(message['upload_id'], message['offset'], message['size']), None
+        except OSError as e:
+            data, error = None, str(e)
+        self.publish('upload_data', to=message['node'], request_id=message['request_id'],
+                     data=data, error=error)
+
+    def on_upload_data(self, message):
+        future = self.pending.get(message['request_id'])
+        if future and not future.done():
+            future.set_result(message)
+
+    def on_collected(self, message):
+        self.server.receive_collected(message['client_id'], message['data'], message.get('payload'))
+
+class UploadReader:
+    """File-like view of an upload stored on another node, for TeacherServer.save_upload"""
+
+    def __init__(self, cluster: Cluster, node: str, upload_id: str, size: int):
+        self.cluster = cluster
+        self.node = node
+        self.upload_id = upload_id
+        self.size = size
+        self.offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self.offset >= self.size:
+            return b''
+        if size < 0:
+            size = Config.TRANSFER_CHUNK_SIZE
+        data = self.cluster.read_upload(self.node, self.upload_id, self.offset, size)
+        self.offset += len(data)
+        return data
+
+def empty_result(message_type: MessageType, failed: Dict[str, str] = None,
+                 timed_out: List[str] = None) -> dict:
+    return {'command': message_type.value, 'delivered': [], 'failed': failed or {},
+            'timed_out': list(timed_out or []), 'elapsed_ms': 0}
+
+def merge_results(futures: List[Future], message_type: MessageType) -> Future:
+    """One future for several command results, resolved when the last one is"""
+    merged = Future()
+    remaining = [len(futures)]
+    result = empty_result(message_type)
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    def done(future):
+        try:
+            part = future.result()
+        except Exception as e:
+            print(f"Command {message_type.value} failed on a node: {e}")
+            part = {}
+        with lock:
+            result['delivered'] += part.get('delivered', [])
+            result['failed'].update(part.get('failed', {}))
+            result['timed_out'] += part.get('timed_out', [])
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        result['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+        merged.set_result(result)
+
+    if not futures:
+        merged.set_result(result)
+    for future in futures:
+        future.add_done_callback(done)
+    return merged
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else Config.CLUSTER_PORT
+    try:
+        asyncio.run(Broker().serve('0.0.0.0', port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,168 @@
+import os
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from shared.config import Config
+
+class Collection:
+    """One folder requested from a set of clients, each stored as its own zip"""
+
+    def __init__(self, path: str, client_ids: Iterable[str], directory: str):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.directory = os.path.join(directory, self.id)
+        self.created = time.time()
+        self.used = self.created  # Last chunk, status change or download
+        self.clients: Dict[str, dict] = {
+            client_id: {'status': 'pending', 'bytes': 0, 'skipped': [], 'error': None}
+            for client_id in client_ids
+        }
+        self.files = {}  # client_id -> open archive while it is being received
+        self.reported: Dict[str, float] = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def archive_path(self, client_id: str) -> str:
+        return os.path.join(self.directory, f"{client_id}.zip")
+
+    @property
+    def finished(self) -> bool:
+        return all(state['status'] in ('complete', 'error') for state in self.clients.values())
+
+    def summary(self) -> dict:
+        return {
+            'collection_id': self.id,
+            'path': self.path,
+            'finished': self.finished,
+            'clients': {client_id: dict(state) for client_id, state in self.clients.items()}
+        }
+
+class FolderCollector:
+    """
+    Stores folders that clients stream back as zip archives.
+
+    Each client sends its archive in FILE_DOWNLOAD chunks while it builds
+    it, and every chunk is appended to that client's file as it arrives, so
+    collecting from the whole room at once needs no more server memory than
+    the chunks in flight. Runs on the WebSocket event loop.
+    """
+
+    def __init__(self, on_progress: Callable[[dict], None], directory: str = None):
+        self.on_progress = on_progress
+        self.directory = directory or Config.COLLECTION_FOLDER
+        self.collections: Dict[str, Collection] = {}
+        os.makedirs(self.directory, exist_ok=True)
+        self.remove_expired()
+
+    def start(self, path: str, client_ids: Iterable[str]) -> Collection:
+        self.remove_expired()
+        collection = Collection(path, client_ids, self.directory)
+        self.collections[collection.id] = collection
+        return collection
+
+    def get(self, collection_id: str) -> Optional[Collection]:
+        return self.collections.get(collection_id)
+
+    def downloaded(self, collection_id: str):
+        """Keep a collection that is being downloaded for another retention period"""
+        collection = self.collections.get(collection_id)
+        if collection:
+            collection.used = time.time()
+
+    def remove_expired(self):
+        """Delete collections idle for COLLECTION_RETENTION, and folders of earlier runs"""
+        cutoff = time.time() - Config.COLLECTION_RETENTION
+        for collection in list(self.collections.values()):
+            if collection.used < cutoff:
+                for archive in collection.files.values():
+                    archive.close()
+                del self.collections[collection.id]
+                shutil.rmtree(collection.directory, ignore_errors=True)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name not in self.collections and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def handle_chunk(self, client_id: str, data: dict, payload: bytes):
+        collection = self.collections.get(data.get('download_id'))
+        state = collection.clients.get(client_id) if collection else None
+        if state is None or state['status'] in ('complete', 'error'):
+            return
+
+        if data.get('error'):
+            self._fail(collection, client_id, data['error'])
+            return
+        if data.get('offset') != state['bytes']:
+            self._fail(collection, client_id, 'Archive stream was interrupted')
+            return
+
+        try:
+            if payload:
+                archive = collection.files.get(client_id)
+                if archive is None:
+                    archive = collection.files[client_id] = open(collection.archive_path(client_id), 'wb')
+                archive.write(payload)
+                state['bytes'] += len(payload)
+            state['status'] = 'receiving'
+            if data.get('done'):
+                self._close(collection, client_id)
+                state['status'] = 'complete'
+                state['skipped'] = data.get('skipped', [])
+        except OSError as e:
+            self._fail(collection, client_id, str(e))
+            return
+        self._report(collection, client_id)
+
+    def fail_clients(self, collection_id: str, failures: Dict[str, str]):
+        """Clients the request never reached"""
+        collection = self.collections.get(collection_id)
+        if collection:
+            for client_id, reason in failures.items():
+                if collection.clients.get(client_id, {}).get('status') == 'pending':
+                    self._fail(collection, client_id, reason)
+
+    def peer_disconnected(self, client_id: str):
+        for collection in list(self.collections.values()):
+            state = collection.clients.get(client_id)
+            if state and state['status'] in ('pending', 'receiving'):
+                self._fail(collection, client_id, 'Client disconnected')
+
+    def archives(self, collection_id: str) -> List[Tuple[str, str]]:
+        """(client_id, path) of every archive that arrived completely"""
+        collection = self.collections.get(collection_id)
+        if not collection:
+            return []
+        return [(client_id, collection.archive_path(client_id))
+                for client_id, state in collection.clients.items() if state['status'] == 'complete']
+
+    def _close(self, collection: Collection, client_id: str):
+        archive = collection.files.pop(client_id, None)
+        if archive:
+            archive.close()
+        elif not os.path.exists(collection.archive_path(client_id)):
+            open(collection.archive_path(client_id), 'wb').close()
+
+    def _fail(self, collection: Collection, client_id: str, reason: str):
+        archive = collection.files.pop(client_id, None)
+        if archive:
+            archive.close()
+        path = collection.archive_path(client_id)
+        if os.path.exists(path):
+            os.remove(path)
+        collection.clients[client_id].update(status='error', error=reason)
+        self._report(collection, client_id)
+
+    def _report(self, collection: Collection, client_id: str):
+        state = collection.clients[client_id]
+        collection.used = time.time()
+        now = time.monotonic()
+        if state['status'] == 'receiving' and \
+                now - collection.reported.get(client_id, 0) < Config.TRANSFER_PROGRESS_INTERVAL:
+            return
+        collection.reported[client_id] = now
+        self.on_progress(dict(state, collection_id=collection.id, client_id=client_id,
+                              finished=collection.finished))
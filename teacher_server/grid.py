@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from shared.config import Config
+
+class GridBatcher:
+    """
+    Collects grid changes and sends each dashboard one batch per tick.
+
+    Thumbnails are only marked dirty when they arrive; every
+    Config.DASHBOARD_UPDATE_INTERVAL the latest thumbnails of the clients
+    visible in a dashboard's grid, and changed since that dashboard last got
+    them, go out in a single 'grid_update' event together with the client
+    registry changes since the registry version it holds. Clients scrolled
+    into view get their current thumbnail on the next tick, and a burst of
+    frames from one client only ever sends the newest.
+    """
+
+    def __init__(self, viewers, registry, emit: Callable[[str, dict, str], None], interval: float = None,
+                 before_flush: Optional[Callable[[], None]] = None):
+        self.viewers = viewers
+        self.registry = registry
+        self.emit = emit
+        # Runs at the start of each tick, registry changes it makes go out in the same batch
+        self.before_flush = before_flush
+        self.interval = interval or Config.DASHBOARD_UPDATE_INTERVAL
+        self.lock = threading.Lock()
+        self.version = 0
+        self.thumbnails: Dict[str, Tuple[int, bytes]] = {}  # client_id -> (version, image)
+        self.sent: Dict[str, Dict[str, int]] = {}  # sid -> client_id -> thumbnail version last sent
+        # sid -> registry version the dashboard holds; missing until it synced
+        self.registry_versions: Dict[str, int] = {}
+        self.stopped = threading.Event()
+
+    def thumbnail(self, client_id: str, image: bytes):
+        with self.lock:
+            self.version += 1
+            self.thumbnails[client_id] = (self.version, image)
+
+    def remove_client(self, client_id: str):
+        """Forget the thumbnail of a client that went offline"""
+        with self.lock:
+            self.thumbnails.pop(client_id, None)
+            for sent in self.sent.values():
+                sent.pop(client_id, None)
+
+    def synced(self, sid: str, version: int):
+        """Dashboard received the registry up to version"""
+        with self.lock:
+            self.registry_versions[sid] = version
+
+    def remove_dashboard(self, sid: str):
+        with self.lock:
+            self.sent.pop(sid, None)
+            self.registry_versions.pop(sid, None)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Grid update error: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+    def flush(self):
+        if self.before_flush:
+            self.before_flush()
+        for sid, visible in self.viewers.dashboards().items():
+            batch = self.batch(sid, visible)
+            if batch:
+                self.emit('grid_update', batch, sid)
+
+    def batch(self, sid: str, visible: Optional[Set[str]]) -> Optional[dict]:
+        """Changes a dashboard has not seen yet for the clients in its grid"""
+        thumbnails, clients = [], None
+        with self.lock:
+            sent = self.sent.setdefault(sid, {})
+            client_ids = set(self.thumbnails)
+            if visible is not None:
+                client_ids &= visible
+            for client_id in client_ids:
+                version, image = self.thumbnails[client_id]
+                if version > sent.get(client_id, 0):
+                    thumbnails.append({'client_id': client_id, 'thumbnail': image})
+                    sent[client_id] = version
+            held = self.registry_versions.get(sid)
+            if held is not None and held < self.registry.version:
+                clients = self.registry.changes_since(self.registry.epoch, held)
+                self.registry_versions[sid] = clients['version']
+        if not thumbnails and not clients:
+            return None
+        return {'thumbnails': thumbnails, 'clients': clients, 'time': time.time()}
@@ -0,0 +1,39 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, List
+
+from shared.config import Config
+
+class GroupRegistry:
+    """Named groups of clients (rows, labs, classes), saved to a JSON file"""
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.GROUPS_FILE
+        self.lock = threading.Lock()
+        self.groups: Dict[str, List[str]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.groups = json.load(f)
+
+    def all(self) -> Dict[str, List[str]]:
+        with self.lock:
+            return {name: list(members) for name, members in self.groups.items()}
+
+    def members(self, name: str) -> List[str]:
+        with self.lock:
+            return list(self.groups.get(name, []))
+
+    def set(self, name: str, client_ids: Iterable[str]):
+        with self.lock:
+            self.groups[name] = sorted(set(client_ids))
+            self._save()
+
+    def delete(self, name: str):
+        with self.lock:
+            if self.groups.pop(name, None) is not None:
+                self._save()
+
+    def _save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.groups, f, indent=2)
@@ -0,0 +1,331 @@
+import asyncio
+import multiprocessing
+import pickle
+import socket
+import struct
+from typing import Dict, Optional, Set, Tuple
+
+import websockets
+
+from shared.config import Config
+from shared.protocol import (Message, MessageType, CAPABILITY_BINARY, CAPABILITY_CHUNKED,
+                             SUPPORTED_CAPABILITIES, FragmentAssembler)
+from shared.scheduler import SendScheduler, PRIORITY_CONTROL, PRIORITY_INTERACTIVE
+from shared.utils import get_local_ip
+from teacher_server.auth import AuthManager
+
+HEADER = struct.Struct('!I')
+
+async def receive_registration(websocket) -> Optional[Message]:
+    """
+    Wait for a client's registration, None if it sent something else.
+
+    A client that registered before, with this server or one sharing its
+    secret, may send just its session ticket; the machine info comes from
+    the ticket and the fields sent alongside it. When the ticket is not
+    accepted the client is told so and registers in full on the same
+    connection.
+    """
+    msg = Message.from_json(await websocket.recv())
+    if msg.type != MessageType.CLIENT_REGISTER:
+        return None
+    ticket = msg.data.pop('ticket', None)
+    if ticket is None:
+        return msg
+
+    info = AuthManager().verify_session_ticket(ticket, msg.client_id)
+    if info is not None:
+        msg.data = dict(info, **msg.data)
+        return msg
+
+    await websocket.send(Message(MessageType.ERROR, {
+        'error': 'Session ticket rejected', 'resume': False
+    }).to_json())
+    msg = Message.from_json(await websocket.recv())
+    if msg.type != MessageType.CLIENT_REGISTER or 'ticket' in msg.data:
+        return None
+    return msg
+
+def accept_registration(websocket, msg: Message) -> Tuple[Set[str], SendScheduler]:
+    """
+    Negotiate capabilities with a registering client and start its sender.
+
+    The success response is queued before anything else, so it reaches the
+    client ahead of whatever registering the client triggers. It carries a
+    fresh session ticket for the client's next connection.
+    """
+    capabilities = set(msg.data.pop('capabilities', [])) & SUPPORTED_CAPABILITIES
+    # Fragmented frames need binary framing on both ends
+    chunked = {CAPABILITY_BINARY, CAPABILITY_CHUNKED} <= capabilities
+    scheduler = SendScheduler(websocket, Config.SEND_CHUNK_SIZE if chunked else None)
+    scheduler.start()
+    response = Message(MessageType.SUCCESS, {
+        'message': 'Registration successful',
+        'capabilities': sorted(capabilities),
+        'ticket': AuthManager().generate_session_ticket(msg.client_id, msg.data)
+    })
+    scheduler.put(response.to_json(), PRIORITY_CONTROL)
+    return capabilities, scheduler
+
+class Channel:
+    """
+    Pickled tuples over the socket pair between the dashboard process and an
+    ingest worker, each prefixed with its length.
+
+    Items posted in the same loop iteration are written with one call.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.outbox = []
+
+    def post(self, *item):
+        if not self.outbox:
+            asyncio.get_running_loop().call_soon(self._flush)
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        self.outbox.append(HEADER.pack(len(data)))
+        self.outbox.append(data)
+
+    async def send(self, *item):
+        """Post an item, waiting while the other side is behind"""
+        self.post(*item)
+        await self.writer.drain()
+
+    async def receive(self) -> tuple:
+        header = await self.reader.readexactly(HEADER.size)
+        return pickle.loads(await self.reader.readexactly(HEADER.unpack(header)[0]))
+
+    def close(self):
+        self.writer.close()
+
+    def _flush(self):
+        if not self.writer.is_closing():
+            self.writer.writelines(self.outbox)
+        self.outbox.clear()
+
+class IngestWorker:
+    """
+    Accepts student connections in a process of its own.
+
+    Every worker listens on the WebSocket port with SO_REUSEPORT, and the
+    kernel spreads new connections across them. The worker does the work
+    that grows with the number of students: WebSocket framing, reassembling
+    fragments, decoding messages and pacing each client's sends through its
+    SendScheduler. Decoded messages go to the dashboard process over the
+    channel, frames to send come back the same way.
+    """
+
+    def __init__(self, index: int, sock: socket.socket):
+        self.index = index
+        self.sock = sock
+        self.channel: Optional[Channel] = None
+        self.schedulers: Dict[int, SendScheduler] = {}
+        self.next_id = 0
+
+    async def run(self):
+        reader, writer = await asyncio.open_unix_connection(sock=self.sock)
+        self.channel = Channel(reader, writer)
+        async with websockets.serve(
+            self.handle_client,
+            Config.SERVER_HOST,
+            Config.WEBSOCKET_PORT,
+            max_size=Config.MAX_FILE_SIZE,
+            reuse_port=True
+        ):
+            print(f"Ingest worker {self.index} listening on {get_local_ip()}:{Config.WEBSOCKET_PORT}")
+            while True:
+                try:
+                    item = await self.channel.receive()
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    # The dashboard process is gone
+                    return
+                self.handle_command(item)
+
+    def handle_command(self, item: tuple):
+        if item[0] == 'send':
+            _, connection_id, seq, frame, priority = item
+            scheduler = self.schedulers.get(connection_id)
+            if scheduler is None:
+                self.channel.post('sent', connection_id, seq, 'Client is not connected')
+                return
+            scheduler.put(frame, priority).add_done_callback(
+                lambda future: self._sent(connection_id, seq, future))
+
+    def _sent(self, connection_id: int, seq: int, future: asyncio.Future):
+        error = None
+        if future.cancelled():
+            error = 'Send cancelled'
+        elif future.exception():
+            error = str(future.exception()) or 'Send failed'
+        self.channel.post('sent', connection_id, seq, error)
+
+    async def handle_client(self, websocket):
+        self.next_id += 1
+        connection_id = self.next_id
+        scheduler = None
+        try:
+            msg = await receive_registration(websocket)
+            if msg is None:
+                print("Connection closed: First message was not a registration.")
+                return
+
+            capabilities, scheduler = accept_registration(websocket, msg)
+            self.schedulers[connection_id] = scheduler
+            await self.channel.send('register', connection_id, msg.client_id, msg.data, capabilities)
+
+            assembler = FragmentAssembler()
+            async for message in websocket:
+                message = assembler.feed(message)
+                if message is None:
+                    continue
+                try:
+                    msg = Message.decode(message)
+                except ValueError as e:
+                    print(f"Ingest worker {self.index} dropping malformed message: {e}")
+                    continue
+                # Waiting here pushes back on the client when the dashboard process is busy
+                await self.channel.send('message', connection_id, msg)
+
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            print(f"Ingest worker {self.index} connection error: {e}")
+        finally:
+            if scheduler:
+                scheduler.stop()
+                del self.schedulers[connection_id]
+                self.channel.post('closed', connection_id)
+
+def run_worker(index: int, sock: socket.socket, settings: dict):
+    """Process entry point of an ingest worker"""
+    # A spawned process starts from the defaults, carry over what was changed at runtime
+    for key, value in settings.items():
+        setattr(Config, key, value)
+    try:
+        asyncio.run(IngestWorker(index, sock).run())
+    except KeyboardInterrupt:
+        pass
+
+class RemoteConnection:
+    """
+    A client connected to an ingest worker.
+
+    Stands in for the client's SendScheduler in the WebSocketHandler: put()
+    forwards the frame to the worker and its future resolves once the
+    worker's scheduler has written it, so callers keep their backpressure.
+    """
+
+    def __init__(self, channel: Channel, connection_id: int, client_id: str):
+        self.channel = channel
+        self.connection_id = connection_id
+        self.client_id = client_id
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.next_seq = 0
+        self.error: Optional[Exception] = None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.error = ConnectionError("Client disconnected")
+        for done in self.pending.values():
+            if not done.done():
+                done.set_exception(self.error)
+        self.pending.clear()
+
+    def put(self, frame, priority: int = PRIORITY_INTERACTIVE) -> asyncio.Future:
+        done = asyncio.get_running_loop().create_future()
+        # Fire-and-forget callers never look at the result; mark errors as seen
+        done.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self.error:
+            done.set_exception(self.error)
+            return done
+        self.next_seq += 1
+        self.pending[self.next_seq] = done
+        self.channel.post('send', self.connection_id, self.next_seq, frame, priority)
+        return done
+
+    async def send(self, frame, priority: int = PRIORITY_INTERACTIVE):
+        await self.put(frame, priority)
+
+    def sent(self, seq: int, error: Optional[str]):
+        done = self.pending.pop(seq, None)
+        if done is None or done.done():
+            return
+        if error:
+            done.set_exception(ConnectionError(error))
+        else:
+            done.set_result(None)
+
+class IngestPool:
+    """
+    Runs the ingest workers and feeds their clients into the WebSocketHandler.
+
+    Registrations, messages and disconnects from the workers are handled
+    on the handler's loop exactly as for clients connected in-process, so
+    everything above the connection works unchanged. A worker that dies is
+    restarted; its clients reconnect to whichever worker the kernel picks.
+    """
+
+    def __init__(self, handler, workers: int):
+        self.handler = handler
+        self.workers = workers
+        self.context = multiprocessing.get_context('spawn')
+
+    @staticmethod
+    def settings() -> dict:
+        return {attr: getattr(Config, attr) for attr in dir(Config)
+                if not attr.startswith('_') and not callable(getattr(Config, attr))}
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(socket, 'SO_REUSEPORT') and hasattr(socket, 'AF_UNIX')
+
+    async def run(self):
+        await asyncio.gather(*(self._supervise(index) for index in range(self.workers)))
+
+    async def _supervise(self, index: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            parent, child = socket.socketpair()
+            process = self.context.Process(target=run_worker, args=(index, child, self.settings()),
+                                           name=f"ingest-{index}", daemon=True)
+            process.start()
+            child.close()
+
+            reader, writer = await asyncio.open_unix_connection(sock=parent)
+            channel = Channel(reader, writer)
+            connections: Dict[int, RemoteConnection] = {}
+            try:
+                while True:
+                    self._dispatch(channel, connections, await channel.receive())
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                channel.close()
+                for connection in connections.values():
+                    connection.stop()
+                    self.handler.client_disconnected(connection.client_id, connection)
+
+            await loop.run_in_executor(None, process.join, 5)
+            print(f"Ingest worker {index} exited ({process.exitcode}), restarting")
+            await asyncio.sleep(1)
+
+    def _dispatch(self, channel: Channel, connections: Dict[int, RemoteConnection], item: tuple):
+        kind, connection_id = item[0], item[1]
+        if kind == 'message':
+            self.handler.handle_message(item[2])
+        elif kind == 'sent':
+            connection = connections.get(connection_id)
+            if connection:
+                connection.sent(item[2], item[3])
+        elif kind == 'register':
+            _, _, client_id, data, capabilities = item
+            connection = connections[connection_id] = RemoteConnection(channel, connection_id, client_id)
+            self.handler.client_connected(client_id, data, capabilities, connection, connection)
+        elif kind == 'closed':
+            connection = connections.pop(connection_id, None)
+            if connection:
+                connection.stop()
+                self.handler.client_disconnected(connection.client_id, connection)
@@ -0,0 +1,145 @@
+"""
+Measures how long a student message takes to reach a dashboard.
+
+Starts the teacher server in the given mode on spare ports, connects a
+dashboard and a number of simulated students, and has every student send
+message replies (timestamped) and thumbnail-sized frames for a while. The
+time from a student sending a reply until the dashboard receives the
+'message_reply' event is reported per mode.
+
+    python -m teacher_server.latency_benchmark threading async --students 40
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import socketio
+import websockets
+
+from shared.protocol import Message, MessageType, CAPABILITY_BINARY, FLAG_THUMBNAIL
+
+SERVER_SCRIPT = """
+from shared.config import Config
+Config.SERVER_MODE = {mode!r}
+Config.SERVER_HOST = '127.0.0.1'
+Config.SERVER_PORT = {http_port}
+Config.WEBSOCKET_PORT = {ws_port}
+Config.DISCOVERY_PORT = {discovery_port}
+from teacher_server.app import teacher_server
+teacher_server.start()
+"""
+
+def free_port(kind=socket.SOCK_STREAM) -> int:
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def wait_for_port(port: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Server did not open port {port}")
+
+async def student(index: int, ws_port: int, duration: float, rate: float, frame_size: int,
+                  sent: dict):
+    client_id = f"bench-{index}"
+    async with websockets.connect(f"ws://127.0.0.1:{ws_port}", max_size=None) as ws:
+        await ws.send(Message(MessageType.CLIENT_REGISTER, {
+            'hostname': client_id, 'capabilities': [CAPABILITY_BINARY]
+        }, client_id=client_id).to_json())
+        await ws.recv()
+
+        async def drain():
+            async for _ in ws:
+                pass
+
+        reader = asyncio.create_task(drain())
+        frame = os.urandom(frame_size)
+        # Spread students over the interval instead of sending in lockstep
+        await asyncio.sleep(random.random() / rate)
+        end = time.monotonic() + duration
+        count = 0
+        while time.monotonic() < end:
+            count += 1
+            key = f"{client_id}:{count}"
+            sent[key] = time.perf_counter()
+            await ws.send(Message(MessageType.MESSAGE_REPLY, {'message': key},
+                                  client_id=client_id).to_binary())
+            await ws.send(Message(MessageType.SCREENSHOT_RESPONSE, {'changed': True}, client_id=client_id,
+                                  payload=frame, flags=FLAG_THUMBNAIL).to_binary())
+            await asyncio.sleep(1 / rate)
+        reader.cancel()
+
+async def measure(mode: str, students: int, duration: float, rate: float, frame_size: int) -> dict:
+    http_port, ws_port = free_port(), free_port()
+    script = SERVER_SCRIPT.format(mode=mode, http_port=http_port, ws_port=ws_port,
+                                  discovery_port=free_port(socket.SOCK_DGRAM))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server = subprocess.Popen([sys.executable, '-c', script], cwd=root,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_port(http_port)
+        await wait_for_port(ws_port)
+
+        sent, latencies = {}, []
+        dashboard = socketio.AsyncClient()
+
+        @dashboard.on('message_reply')
+        def on_reply(data):
+            started = sent.pop(data.get('message'), None)
+            if started is not None:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        await dashboard.connect(f"http://127.0.0.1:{http_port}", transports=['websocket'])
+        await asyncio.gather(*(student(index, ws_port, duration, rate, frame_size, sent)
+                               for index in range(students)))
+        await asyncio.sleep(1)
+        await dashboard.disconnect()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    if not latencies:
+        return {'mode': mode, 'received': 0, 'lost': len(sent)}
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        'mode': mode,
+        'received': len(latencies),
+        'lost': len(sent),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'p50_ms': round(percentile(0.5), 2),
+        'p95_ms': round(percentile(0.95), 2),
+        'p99_ms': round(percentile(0.99), 2),
+        'max_ms': round(latencies[-1], 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('modes', nargs='*', default=['threading', 'async'])
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per mode')
+    parser.add_argument('--rate', type=float, default=5, help='messages per second per student')
+    parser.add_argument('--frame-size', type=int, default=8 * 1024, help='bytes per thumbnail frame')
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        result = asyncio.run(measure(mode, args.students, args.duration, args.rate, args.frame_size))
+        print(' '.join(f"{key}={value}" for key, value in result.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from shared.config import Config
+
+class LivenessTracker:
+    """
+    Deadlines by which each client has to be heard from again, on a timer wheel.
+
+    The wheel has one slot per tick of resolution seconds. A client touched
+    with a timeout goes into the slot of the tick its deadline falls in,
+    and leaves its previous slot, so a heartbeat costs the same whatever the
+    number of clients. expired() only looks at the slots of the ticks that
+    passed since the last call. Deadlines further away than the wheel is
+    long wrap around and stay in their slot until their own round comes.
+    """
+
+    def __init__(self, resolution: float = None, slots: int = None):
+        self.resolution = resolution or Config.DASHBOARD_UPDATE_INTERVAL
+        self.slots: List[Set[str]] = [set() for _ in range(slots or Config.LIVENESS_WHEEL_SLOTS)]
+        self.lock = threading.Lock()
+        self.deadlines: Dict[str, float] = {}
+        self.slot_of: Dict[str, int] = {}
+        self.position = int(time.time() / self.resolution)  # Last tick looked at
+
+    def touch(self, client_id: str, timeout: float, now: Optional[float] = None):
+        """Client was heard from, it times out unless touched again within timeout"""
+        deadline = (now or time.time()) + timeout
+        with self.lock:
+            tick = max(math.ceil(deadline / self.resolution), self.position + 1)
+            slot = tick % len(self.slots)
+            previous = self.slot_of.get(client_id)
+            if previous != slot:
+                if previous is not None:
+                    self.slots[previous].discard(client_id)
+                self.slots[slot].add(client_id)
+                self.slot_of[client_id] = slot
+            self.deadlines[client_id] = deadline
+
+    def remove(self, client_id: str):
+        with self.lock:
+            slot = self.slot_of.pop(client_id, None)
+            if slot is not None:
+                self.slots[slot].discard(client_id)
+            self.deadlines.pop(client_id, None)
+
+    def expired(self, now: Optional[float] = None) -> List[str]:
+        """Clients whose deadline passed since the last call, no longer tracked afterwards"""
+        now = now or time.time()
+        target = int(now / self.resolution)
+        expired = []
+        with self.lock:
+            # After a long stall every slot is due, but each only needs one look
+            ticks = min(target - self.position, len(self.slots))
+            for tick in range(target - ticks + 1, target + 1):
+                slot = self.slots[tick % len(self.slots)]
+                for client_id in [client_id for client_id in slot if self.deadlines[client_id] <= now]:
+                    slot.discard(client_id)
+                    del self.slot_of[client_id]
+                    del self.deadlines[client_id]
+                    expired.append(client_id)
+            self.position = max(self.position, target)
+        return expired
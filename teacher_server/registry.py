@@ -0,0 +1,86 @@
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Tuple
+
+class ClientRegistry(Mapping):
+    """
+    Client records with a version number that every change bumps.
+
+    Each record remembers the version of its last change, so a dashboard
+    that already holds version N only needs the records changed since N.
+    The epoch changes whenever the server starts, which tells dashboards
+    that their version belongs to an earlier run and a full snapshot is
+    needed; epoch and version together serve as the snapshot's ETag.
+
+    Records are read-only for callers, changes go through register() and
+    update(). last_seen is kept apart from the records since heartbeats
+    would otherwise change every record every few seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.records: Dict[str, dict] = {}
+        self.changed: Dict[str, int] = {}  # client_id -> version of its last change
+        self.last_seen: Dict[str, float] = {}
+
+    def __getitem__(self, client_id: str) -> dict:
+        return self.records[client_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.records))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def register(self, client_id: str, info: dict):
+        with self.lock:
+            self.records[client_id] = {'id': client_id, 'info': info, 'status': 'online'}
+            self._bump(client_id)
+        self.seen(client_id)
+
+    def update(self, client_id: str, **fields) -> bool:
+        """Change fields of a record, True if anything actually changed"""
+        with self.lock:
+            record = self.records.get(client_id)
+            if record is None or all(record.get(key) == value for key, value in fields.items()):
+                return False
+            # Replaced rather than mutated so snapshots handed out stay consistent
+            self.records[client_id] = dict(record, **fields)
+            self._bump(client_id)
+            return True
+
+    def seen(self, client_id: str):
+        self.last_seen[client_id] = time.time()
+
+    def etag(self) -> str:
+        return f"{self.epoch}-{self.version}"
+
+    def snapshot(self) -> Tuple[str, list]:
+        """ETag and every record, taken at the same moment"""
+        with self.lock:
+            return self.etag(), list(self.records.values())
+
+    def changes_since(self, epoch: Optional[str], version: Optional[int]) -> dict:
+        """Records changed after version, or everything when version is from another epoch"""
+        with self.lock:
+            full = epoch != self.epoch or version is None or not 0 <= version <= self.version
+            if full:
+                clients = list(self.records.values())
+            else:
+                clients = [self.records[client_id] for client_id, changed in self.changed.items()
+                           if changed > version]
+            return {
+                'epoch': self.epoch,
+                'since': None if full else version,
+                'version': self.version,
+                'full': full,
+                'clients': clients
+            }
+
+    def _bump(self, client_id: str):
+        self.version += 1
+        self.changed[client_id] = self.version
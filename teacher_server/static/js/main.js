@@ -2,11 +2,44 @@ class ClassroomManager {
     constructor() {
         this.socket = io();
         this.clients = new Map();
+        this.registry = { epoch: null, version: 0 };  // Client registry version we hold
         this.selectedClient = null;
         this.remoteControlActive = false;
+        this.remoteDrawChain = Promise.resolve();
+        // Input is batched per animation frame, moves reduced to the latest position
+        this.remoteEvents = [];
+        this.remoteMove = null;
+        this.remoteWheel = null;
+        this.remoteHeld = new Map();
+        this.remoteFlushPending = false;
+        this.viewedClient = null;
+        this.viewFrame = null;
+        this.viewRegion = null;
+        this.zoomStart = null;
         this.fileManagerActive = false;
+        this.fileSort = 'name';
+        this.searchId = null;
+        this.collections = new Map();
+        this.sortMode = 'name';
+        this.activityTimer = null;
+
+        // Clients whose card is on screen; the server pauses capture for the rest
+        this.visibleClients = new Set();
+        this.visibilityTimer = null;
+        this.visibilityObserver = new IntersectionObserver((entries) => {
+            entries.forEach(entry => {
+                const clientId = entry.target.dataset.clientId;
+                if (entry.isIntersecting) {
+                    this.visibleClients.add(clientId);
+                } else {
+                    this.visibleClients.delete(clientId);
+                }
+            });
+            this.reportVisibleClients();
+        });
 
         this.initializeEventListeners();
+        this.loadGroups();
         this.startTimeUpdate();
     }
 
@@ -14,25 +47,17 @@ class ClassroomManager {
         // Socket events
         this.socket.on('connect', () => {
             console.log('Connected to server');
+            this.syncClients();
         });
 
-        this.socket.on('client_connected', (data) => {
-            this.addClient(data.client_id, data.client_info);
+        // Client records changed since the registry version we hold
+        this.socket.on('client_sync', (sync) => {
+            this.applyClientSync(sync);
         });
 
-        this.socket.on('client_status_update', (data) => {
-            this.updateClientStatus(data.client_id, data.status);
-        });
-
-        this.socket.on('screenshot_update', (data) => {
-            this.updateScreenshot(data.client_id, data.thumbnail);
-        });
-
-        this.socket.on('client_list', (clients) => {
-            this.clients.clear();
-            clients.forEach(client => {
-                this.addClient(client.id, client.info);
-            });
+        // Client changes and thumbnails of the clients in view, batched by the server
+        this.socket.on('grid_update', (batch) => {
+            this.applyGridUpdate(batch);
         });
 
         this.socket.on('message_reply', (data) => {
@@ -44,8 +69,40 @@ class ClassroomManager {
         });
 
         // <<< LISTENER BARU UNTUK REMOTE CONTROL >>>
+        this.socket.on('file_manager', (data) => {
+            this.handleFileManager(data);
+        });
+
+        this.socket.on('command_result', (data) => {
+            this.showCommandResult(data);
+        });
+
+        this.socket.on('transfer_progress', (data) => {
+            this.updateTransferProgress(data);
+        });
+
+        this.socket.on('collection_started', (data) => {
+            this.startCollection(data);
+        });
+
+        this.socket.on('collection_progress', (data) => {
+            this.updateCollection(data);
+        });
+
+        this.socket.on('screen_view_update', (data) => {
+            this.updateScreenView(data);
+        });
+
         this.socket.on('remote_screen_update', (data) => {
-            this.updateRemoteScreen(data.client_id, data.image);
+            this.updateRemoteScreen(data);
+        });
+
+        this.socket.on('remote_session_stats', (data) => {
+            this.updateRemoteStats(data.client_id, data.stats);
+        });
+
+        document.addEventListener('visibilitychange', () => {
+            this.reportVisibleClients();
         });
 
         // UI event listeners
@@ -54,7 +111,11 @@ class ClassroomManager {
         });
 
         document.getElementById('broadcastBtn').addEventListener('click', () => {
-            this.showMessageModal('all');
+            this.showMessageModal(this.commandTarget());
+        });
+
+        document.getElementById('groupBtn').addEventListener('click', () => {
+            this.createGroup();
         });
 
         document.getElementById('powerControlBtn').addEventListener('click', () => {
@@ -65,6 +126,21 @@ class ClassroomManager {
             this.showFileManagerModal();
         });
 
+        // Large programs are shared between the students instead of sent to each
+        document.getElementById('deployBtn').addEventListener('click', () => {
+            this.executeProgram('all');
+        });
+
+        // The same folder from every student in the selected group, all at once
+        document.getElementById('collectBtn').addEventListener('click', () => {
+            const path = prompt('Folder to collect from each client (e.g. C:\\Users\\Student\\Documents\\Project):');
+            if (path) this.collectFolder(this.commandTarget(), path);
+        });
+
+        document.getElementById('sortSelect').addEventListener('change', (e) => {
+            this.setSortMode(e.target.value);
+        });
+
         // Modal event listeners
         this.setupModalListeners();
     }
@@ -92,12 +168,38 @@ class ClassroomManager {
             this.stopRemoteControl();
         });
 
-        remoteScreen.addEventListener('click', (e) => {
-            this.handleRemoteClick(e);
+        remoteScreen.addEventListener('pointerdown', (e) => {
+            remoteScreen.focus();
+            remoteScreen.setPointerCapture(e.pointerId);
+            this.handleRemotePointer(e, 'd');
+        });
+
+        remoteScreen.addEventListener('pointerup', (e) => {
+            this.handleRemotePointer(e, 'u');
+        });
+
+        remoteScreen.addEventListener('pointermove', (e) => {
+            this.handleRemoteMove(e);
+        });
+
+        remoteScreen.addEventListener('wheel', (e) => {
+            this.handleRemoteWheel(e);
+        }, { passive: false });
+
+        remoteScreen.addEventListener('contextmenu', (e) => {
+            e.preventDefault();
         });
 
         remoteScreen.addEventListener('keydown', (e) => {
-            this.handleRemoteKeyboard(e);
+            this.handleRemoteKeyboard(e, true);
+        });
+
+        remoteScreen.addEventListener('keyup', (e) => {
+            this.handleRemoteKeyboard(e, false);
+        });
+
+        remoteScreen.addEventListener('blur', () => {
+            this.releaseRemoteInput();
         });
 
         // File manager modal
@@ -110,10 +212,37 @@ class ClassroomManager {
             this.navigateToPath();
         });
 
+        document.getElementById('fileSortSelect').addEventListener('change', (e) => {
+            this.fileSort = e.target.value;
+            this.navigateToPath();
+        });
+
+        document.getElementById('searchBtn').addEventListener('click', () => {
+            this.startSearch();
+        });
+
+        document.getElementById('cancelSearchBtn').addEventListener('click', () => {
+            this.cancelSearch();
+        });
+
+        document.querySelector("#fileManagerModal .close").addEventListener("click", () => {
+            this.cancelSearch();
+            this.fileManagerActive = false;
+            this.socket.emit('file_manager_closed', { client_id: this.selectedClient });
+        });
+
         uploadFileBtn.addEventListener('click', () => {
             this.uploadFile();
         });
 
+        document.getElementById('uploadFolderBtn').addEventListener('click', () => {
+            this.uploadFolder();
+        });
+
+        document.getElementById('downloadFolderBtn').addEventListener('click', () => {
+            this.collectFolder(this.selectedClient, document.getElementById('currentPath').value);
+        });
+
         createFolderBtn.addEventListener('click', () => {
             this.createFolder();
         });
@@ -126,6 +255,36 @@ class ClassroomManager {
             this.stopRemoteControl();
         });
 
+        document.querySelector("#screenViewModal .close").addEventListener("click", () => {
+            this.closeScreenView();
+        });
+
+        // Zooming into a monitor or rectangle; the client captures only that area
+        const screenView = document.getElementById('screenView');
+        screenView.addEventListener('mousedown', (e) => {
+            this.startZoomSelection(e);
+        });
+
+        window.addEventListener('mousemove', (e) => {
+            this.moveZoomSelection(e);
+        });
+
+        window.addEventListener('mouseup', (e) => {
+            this.endZoomSelection(e);
+        });
+
+        document.getElementById('screenMonitorSelect').addEventListener('change', (e) => {
+            this.setMonitor(this.viewedClient, e.target.value);
+        });
+
+        document.getElementById('remoteMonitorSelect').addEventListener('change', (e) => {
+            this.setMonitor(this.selectedClient, e.target.value);
+        });
+
+        document.getElementById('resetZoomBtn').addEventListener('click', () => {
+            this.setViewRegion(this.viewedClient, null);
+        });
+
         // Close modal listeners
         document.querySelectorAll('.close').forEach(closeBtn => {
             closeBtn.addEventListener('click', (e) => {
@@ -138,6 +297,9 @@ class ClassroomManager {
         window.addEventListener('click', (e) => {
             if (e.target.classList.contains('modal')) {
                 e.target.style.display = 'none';
+                if (e.target.id === 'screenViewModal') {
+                    this.closeScreenView();
+                }
             }
         });
     }
@@ -146,34 +308,276 @@ class ClassroomManager {
         this.clients.clear();
         clients.forEach(client => {
             if (client.id && client.info) {
-                this.addClient(client.id, client.info);
+                this.setClient(client);
             }
         });
+        this.renderClients();
     }
 
-    addClient(clientId, clientInfo) {
-        this.clients.set(clientId, {
-            id: clientId,
-            info: clientInfo,
-            status: 'online',
-            screenshot: null
+    setClient(record) {
+        this.clients.set(record.id, {
+            id: record.id,
+            info: record.info,
+            status: record.status || 'online',
+            screenshot: null,
+            activity: null,
+            transfer: null
         });
-        this.renderClients();
     }
 
-    updateClientStatus(clientId, status) {
-        if (this.clients.has(clientId)) {
-            this.clients.get(clientId).status = status;
+    // The server numbers every registry change; after the first full list
+    // only the records changed since our version are sent.
+    syncClients(full = false) {
+        this.socket.emit('sync_clients', full ? {} : this.registry);
+    }
+
+    applyClientSync(sync) {
+        if (sync.full) {
+            this.registry = { epoch: sync.epoch, version: sync.version };
+            this.renderClientList(sync.clients);
+            return;
+        }
+        if (sync.epoch !== this.registry.epoch || sync.version <= this.registry.version) return;
+        if (sync.since > this.registry.version) {
+            // Missed a change, start over from the full list
+            this.syncClients(true);
+            return;
+        }
+        this.registry.version = sync.version;
+
+        let added = false;
+        sync.clients.forEach(record => {
+            const client = this.clients.get(record.id);
+            if (!client) {
+                this.setClient(record);
+                added = true;
+            } else if (JSON.stringify(client.info) !== JSON.stringify(record.info)) {
+                // Re-registered, possibly with a different machine description
+                client.info = record.info;
+                client.status = record.status;
+                added = true;
+            } else {
+                this.updateClientStatus(record.id, record.status);
+            }
+        });
+        if (added) this.renderClients();
+    }
+
+    // Activity scores are computed by the server from client change reports
+    setSortMode(mode) {
+        this.sortMode = mode;
+        clearInterval(this.activityTimer);
+        if (mode === 'name') {
             this.renderClients();
+            return;
         }
+        this.refreshActivity();
+        this.activityTimer = setInterval(() => this.refreshActivity(), 5000);
+    }
+
+    refreshActivity() {
+        fetch('/api/clients?include=activity')
+            .then(response => response.json())
+            .then(clients => {
+                clients.forEach(entry => {
+                    if (this.clients.has(entry.id)) {
+                        this.clients.get(entry.id).activity = entry.activity;
+                    }
+                });
+                this.renderClients();
+            });
+    }
+
+    sortedClients() {
+        const clients = Array.from(this.clients.entries());
+        const activity = (client, key, fallback) =>
+            client.activity && client.activity[key] !== null ? client.activity[key] : fallback;
+
+        if (this.sortMode === 'activity') {
+            clients.sort(([, a], [, b]) => activity(b, 'score', -1) - activity(a, 'score', -1));
+        } else if (this.sortMode === 'idle') {
+            clients.sort(([, a], [, b]) => activity(b, 'idle_seconds', -1) - activity(a, 'idle_seconds', -1));
+        } else {
+            clients.sort(([, a], [, b]) => a.info.hostname.localeCompare(b.info.hostname));
+        }
+        return clients;
+    }
+
+    // Cards are patched in place; the grid is not rebuilt for a batch
+    applyGridUpdate(batch) {
+        if (batch.clients) {
+            this.applyClientSync(batch.clients);
+        }
+        batch.thumbnails.forEach(({ client_id, thumbnail }) => {
+            this.updateScreenshot(client_id, thumbnail);
+        });
+    }
+
+    updateClientStatus(clientId, status) {
+        const client = this.clients.get(clientId);
+        if (!client || client.status === status) return;
+        client.status = status;
+
+        const card = document.querySelector(`.client-card[data-client-id="${clientId}"]`);
+        if (!card) return;
+        card.className = `client-card ${status}`;
+        const label = card.querySelector('.client-status');
+        label.className = `client-status ${status}`;
+        label.textContent = status;
+    }
+
+    // Images arrive as binary (ArrayBuffer) from the server, base64 strings are
+    // still accepted for compatibility.
+    imageSource(image) {
+        if (typeof image === 'string') {
+            return `data:image/jpeg;base64,${image}`;
+        }
+        return URL.createObjectURL(new Blob([image], { type: 'image/jpeg' }));
+    }
+
+    imageBlob(image) {
+        if (typeof image === 'string') {
+            image = Uint8Array.from(atob(image), c => c.charCodeAt(0));
+        }
+        return new Blob([image], { type: 'image/jpeg' });
     }
 
     // <<< UPDATE SCREENSHOT >>>
     updateScreenshot(clientId, thumbnail) {
+        const client = this.clients.get(clientId);
+        if (!client) return;
+
+        if (client.screenshot && client.screenshot.startsWith('blob:')) {
+            URL.revokeObjectURL(client.screenshot);
+        }
+        client.screenshot = this.imageSource(thumbnail);
+
         const screenshotElement = document.getElementById(`screenshot-${clientId}`);
         if (screenshotElement) {
-            screenshotElement.src = `data:image/jpeg;base64,${thumbnail}`;
+            screenshotElement.src = client.screenshot;
+        }
+        // Until large frames arrive the view shows the grid thumbnail
+        if (this.viewedClient === clientId && !this.viewFrame) {
+            document.getElementById('screenViewImg').src = client.screenshot;
+        }
+    }
+
+    // Large frames come only to dashboards that have the view open
+    updateScreenView(data) {
+        if (this.viewedClient !== data.client_id) return;
+        if (this.viewFrame) URL.revokeObjectURL(this.viewFrame);
+        this.viewFrame = URL.createObjectURL(this.imageBlob(data.image));
+        document.getElementById('screenViewImg').src = this.viewFrame;
+    }
+
+    // The server asks the client for larger frames while this view is open
+    openScreenView(clientId) {
+        if (!this.clients.has(clientId)) return;
+        this.closeScreenView();
+
+        this.viewedClient = clientId;
+        const client = this.clients.get(clientId);
+        document.getElementById('screenViewClientName').textContent = client.info.hostname;
+        document.getElementById('screenViewImg').src = client.screenshot || '';
+        document.getElementById('screenViewModal').style.display = 'block';
+        this.viewRegion = null;
+        this.fillMonitorSelect('screenMonitorSelect', clientId);
+
+        this.socket.emit('view_client', { client_id: clientId, action: 'open' });
+    }
+
+    fillMonitorSelect(selectId, clientId) {
+        const select = document.getElementById(selectId);
+        const monitors = this.clients.get(clientId).info.monitors || [];
+        select.innerHTML = '<option value="">Primary screen</option>';
+        if (monitors.length > 1) {
+            select.innerHTML += '<option value="0">All screens</option>';
+            monitors.forEach((monitor, i) => {
+                const [left, top, right, bottom] = monitor;
+                select.innerHTML += `<option value="${i + 1}">Monitor ${i + 1} (${right - left}×${bottom - top})</option>`;
+            });
+        }
+        select.style.display = monitors.length > 1 ? '' : 'none';
+        select.value = '';
+    }
+
+    setMonitor(clientId, value) {
+        this.setViewRegion(clientId, value === '' ? null : { monitor: parseInt(value, 10) });
+    }
+
+    setViewRegion(clientId, region) {
+        if (!clientId) return;
+        this.viewRegion = region;
+        if (!region) {
+            document.getElementById('screenMonitorSelect').value = '';
+            document.getElementById('remoteMonitorSelect').value = '';
         }
+        this.socket.emit('view_region', { client_id: clientId, region: region });
+    }
+
+    zoomPoint(e) {
+        const rect = document.getElementById('screenViewImg').getBoundingClientRect();
+        return {
+            x: Math.min(1, Math.max(0, (e.clientX - rect.left) / rect.width)),
+            y: Math.min(1, Math.max(0, (e.clientY - rect.top) / rect.height)),
+            rect: rect
+        };
+    }
+
+    startZoomSelection(e) {
+        if (!this.viewedClient || e.button !== 0) return;
+        e.preventDefault();
+        this.zoomStart = this.zoomPoint(e);
+    }
+
+    moveZoomSelection(e) {
+        if (!this.zoomStart) return;
+        const end = this.zoomPoint(e);
+        const image = end.rect;
+        const view = document.getElementById('screenView').getBoundingClientRect();
+        const selection = document.getElementById('zoomSelection');
+        selection.style.display = 'block';
+        selection.style.left = `${image.left - view.left + Math.min(this.zoomStart.x, end.x) * image.width}px`;
+        selection.style.top = `${image.top - view.top + Math.min(this.zoomStart.y, end.y) * image.height}px`;
+        selection.style.width = `${Math.abs(end.x - this.zoomStart.x) * image.width}px`;
+        selection.style.height = `${Math.abs(end.y - this.zoomStart.y) * image.height}px`;
+    }
+
+    endZoomSelection(e) {
+        if (!this.zoomStart) return;
+        const start = this.zoomStart;
+        const end = this.zoomPoint(e);
+        this.zoomStart = null;
+        document.getElementById('zoomSelection').style.display = 'none';
+
+        const width = Math.abs(end.x - start.x);
+        const height = Math.abs(end.y - start.y);
+        if (width < 0.02 || height < 0.02) return;
+
+        // The selection is relative to what is shown, which may already be zoomed
+        const region = this.viewRegion || { monitor: 1 };
+        const [baseX, baseY, baseW, baseH] = region.rect || [0, 0, 1, 1];
+        this.setViewRegion(this.viewedClient, {
+            monitor: region.monitor,
+            rect: [
+                baseX + Math.min(start.x, end.x) * baseW,
+                baseY + Math.min(start.y, end.y) * baseH,
+                width * baseW,
+                height * baseH
+            ]
+        });
+    }
+
+    closeScreenView() {
+        if (!this.viewedClient) return;
+
+        this.socket.emit('view_client', { client_id: this.viewedClient, action: 'close' });
+        this.viewedClient = null;
+        if (this.viewFrame) {
+            URL.revokeObjectURL(this.viewFrame);
+            this.viewFrame = null;
+        }
+        this.hideModal('screenViewModal');
     }
 
     renderClients() {
@@ -183,17 +587,30 @@ class ClassroomManager {
         clientGrid.innerHTML = '';
         clientCount.textContent = `${this.clients.size} clients connected`;
 
-        this.clients.forEach((client, clientId) => {
+        this.visibilityObserver.disconnect();
+        this.visibleClients.clear();
+        this.sortedClients().forEach(([clientId, client]) => {
             const clientCard = this.createClientCard(clientId, client);
             clientGrid.appendChild(clientCard);
+            this.visibilityObserver.observe(clientCard);
         });
     }
 
+    reportVisibleClients() {
+        // Debounced so scrolling the grid sends one update
+        clearTimeout(this.visibilityTimer);
+        this.visibilityTimer = setTimeout(() => {
+            const clientIds = document.hidden ? [] : Array.from(this.visibleClients);
+            this.socket.emit('visible_clients', { client_ids: clientIds });
+        }, 200);
+    }
+
     createClientCard(clientId, client) {
         const card = document.createElement('div');
         card.className = `client-card ${client.status}`;
+        card.dataset.clientId = clientId;
 
-        const screenshotSrc = `data:image/jpeg;base64,${client.screenshot}`;
+        const screenshotSrc = client.screenshot || '';
 
         card.innerHTML = `
             <div class="client-header">
@@ -201,8 +618,10 @@ class ClassroomManager {
                 <div class="client-status ${client.status}">${client.status}</div>
             </div>
             <div class="client-screenshot">
-                <img id="screenshot-${clientId}" src="${screenshotSrc}" alt="Screen">
+                <img id="screenshot-${clientId}" src="${screenshotSrc}" alt="Screen"
+                     onclick="classroomManager.openScreenView('${clientId}')">
             </div>
+            <div class="client-transfer" id="transfer-${clientId}">${this.transferText(client.transfer)}</div>
             <div class="client-info">
                 <div>IP: ${client.info.ip_address}</div>
                 <div>OS: ${client.info.system} ${client.info.release}</div>
@@ -238,8 +657,6 @@ class ClassroomManager {
 
         this.hideModal('messageModal');
         document.getElementById('messageText').value = '';
-
-        this.showNotification('Message sent successfully');
     }
 
     startRemoteControl(clientId) {
@@ -250,11 +667,10 @@ class ClassroomManager {
 
         const modal = document.getElementById('remoteControlModal');
         const clientName = document.getElementById('remoteClientName');
-        const remoteScreenImg = document.getElementById('remoteScreenImg');
 
         clientName.textContent = this.clients.get(clientId).info.hostname;
-        // Tampilkan placeholder atau gambar loading awal
-        remoteScreenImg.src = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"; // Gambar transparan
+        // Kosongkan kanvas sampai keyframe pertama tiba
+        this.clearRemoteScreen();
         modal.style.display = 'block';
 
         // Beritahu server untuk memulai stream remote control
@@ -263,6 +679,9 @@ class ClassroomManager {
             action: 'start'
         });
 
+        this.viewRegion = null;
+        this.fillMonitorSelect('remoteMonitorSelect', clientId);
+
         // Fokuskan elemen agar bisa menerima input keyboard
         const remoteScreen = document.getElementById('remoteScreen');
         remoteScreen.setAttribute('tabindex', '0');
@@ -271,6 +690,7 @@ class ClassroomManager {
 
     stopRemoteControl() {
         if (!this.remoteControlActive) return;
+        this.releaseRemoteInput();
 
         // Beritahu server untuk menghentikan stream
         this.socket.emit('remote_control', {
@@ -282,51 +702,167 @@ class ClassroomManager {
         this.selectedClient = null;
         this.hideModal('remoteControlModal');
         // Kosongkan gambar saat modal ditutup
-        document.getElementById('remoteScreenImg').src = '';
+        this.clearRemoteScreen();
+    }
+
+    updateRemoteStats(clientId, stats) {
+        if (!this.remoteControlActive || this.selectedClient !== clientId) return;
+
+        const fps = (1 / stats.interval).toFixed(1);
+        const queuedKb = (stats.queued_bytes / 1024).toFixed(0);
+        document.getElementById('remoteStats').textContent =
+            `Quality ${stats.quality} · Scale ${Math.round(stats.scale * 100)}% · ${fps} fps · ` +
+            `RTT ${stats.rtt_ms} ms (target ${stats.target_ms} ms) · Queue ${queuedKb} KB`;
     }
 
-    updateRemoteScreen(clientId, image) {
+    clearRemoteScreen() {
+        document.getElementById('remoteStats').textContent = '';
+        const canvas = document.getElementById('remoteScreenCanvas');
+        canvas.getContext('2d').clearRect(0, 0, canvas.width, canvas.height);
+        this.remoteDrawChain = Promise.resolve();
+    }
+
+    updateRemoteScreen(data) {
         // Hanya perbarui gambar jika modal remote control aktif untuk klien yang sesuai
-        if (this.remoteControlActive && this.selectedClient === clientId) {
-            const remoteScreenImg = document.getElementById('remoteScreenImg');
-            remoteScreenImg.src = `data:image/jpeg;base64,${image}`;
-        }
+        if (!this.remoteControlActive || this.selectedClient !== data.client_id) return;
+
+        // Frames are drawn strictly in arrival order so deltas land on the right base
+        this.remoteDrawChain = this.remoteDrawChain
+            .then(() => this.drawRemoteFrame(data))
+            .catch(error => console.error('Remote frame error:', error));
     }
 
-    handleRemoteClick(e) {
-        if (!this.remoteControlActive) return;
+    async drawRemoteFrame(data) {
+        const canvas = document.getElementById('remoteScreenCanvas');
+        const ctx = canvas.getContext('2d');
 
-        const rect = e.target.getBoundingClientRect();
-        const x = e.clientX - rect.left;
-        const y = e.clientY - rect.top;
+        // Full-frame update from clients without delta encoding
+        if (!data.tiles) {
+            const bitmap = await createImageBitmap(this.imageBlob(data.image));
+            if (canvas.width !== bitmap.width || canvas.height !== bitmap.height) {
+                canvas.width = bitmap.width;
+                canvas.height = bitmap.height;
+            }
+            ctx.drawImage(bitmap, 0, 0);
+            bitmap.close();
+            return;
+        }
 
-        // Calculate relative coordinates
-        const relativeX = x / rect.width;
-        const relativeY = y / rect.height;
+        if (data.keyframe && (canvas.width !== data.width || canvas.height !== data.height)) {
+            canvas.width = data.width;
+            canvas.height = data.height;
+        }
 
-        this.socket.emit('remote_input', {
-            client_id: this.selectedClient,
-            type: 'click',
-            x: relativeX,
-            y: relativeY,
-            button: e.button
+        // Each tile is [x, y, width, height, length] into the concatenated payload
+        let offset = 0;
+        const bitmaps = await Promise.all(data.tiles.map(([x, y, w, h, length]) => {
+            const blob = new Blob([data.image.slice(offset, offset + length)], { type: 'image/jpeg' });
+            offset += length;
+            return createImageBitmap(blob);
+        }));
+
+        bitmaps.forEach((bitmap, i) => {
+            const [x, y] = data.tiles[i];
+            ctx.drawImage(bitmap, x, y);
+            bitmap.close();
         });
     }
 
-    handleRemoteKeyboard(e) {
+    remotePosition(e) {
+        const rect = document.getElementById('remoteScreenCanvas').getBoundingClientRect();
+        const clamp = (value) => Math.min(1, Math.max(0, value));
+        return [
+            +clamp((e.clientX - rect.left) / rect.width).toFixed(4),
+            +clamp((e.clientY - rect.top) / rect.height).toFixed(4)
+        ];
+    }
+
+    handleRemoteMove(e) {
+        if (!this.remoteControlActive) return;
+        this.remoteMove = ['m', ...this.remotePosition(e)];
+        this.scheduleRemoteFlush();
+    }
+
+    handleRemotePointer(e, kind) {
+        if (!this.remoteControlActive) return;
+        e.preventDefault();
+        const event = [kind, e.button, ...this.remotePosition(e)];
+        if (kind === 'd') {
+            this.remoteHeld.set(`b${e.button}`, ['u', ...event.slice(1)]);
+        } else {
+            this.remoteHeld.delete(`b${e.button}`);
+        }
+        this.queueRemoteInput(event);
+    }
+
+    handleRemoteWheel(e) {
         if (!this.remoteControlActive) return;
+        e.preventDefault();
+        // Line and page deltas are converted to pixels
+        const scale = e.deltaMode === 1 ? 40 : e.deltaMode === 2 ? 800 : 1;
+        const [, dx, dy] = this.remoteWheel || ['w', 0, 0];
+        this.remoteWheel = ['w', dx + e.deltaX * scale, dy + e.deltaY * scale];
+        this.scheduleRemoteFlush();
+    }
 
+    handleRemoteKeyboard(e, down) {
+        if (!this.remoteControlActive) return;
         e.preventDefault();
+        // Tracked by physical key: Shift changes e.key between keydown ('A') and keyup ('a'),
+        // so the key goes up under the name it went down with
+        const id = `k${e.code || e.key}`;
+        const held = this.remoteHeld.get(id);
+        const key = held ? held[1] : e.key;
+        if (down) {
+            this.remoteHeld.set(id, ['k', key, false]);
+        } else {
+            this.remoteHeld.delete(id);
+        }
+        this.queueRemoteInput(['k', key, down]);
+    }
+
+    // Clicks and keys keep their place after any pending move or scroll
+    queueRemoteInput(event) {
+        this.takePendingMotion();
+        this.remoteEvents.push(event);
+        this.scheduleRemoteFlush();
+    }
 
+    takePendingMotion() {
+        if (this.remoteMove) this.remoteEvents.push(this.remoteMove);
+        if (this.remoteWheel) {
+            this.remoteEvents.push(['w', Math.round(this.remoteWheel[1]), Math.round(this.remoteWheel[2])]);
+        }
+        this.remoteMove = null;
+        this.remoteWheel = null;
+    }
+
+    scheduleRemoteFlush() {
+        if (this.remoteFlushPending) return;
+        this.remoteFlushPending = true;
+        requestAnimationFrame(() => this.flushRemoteInput());
+    }
+
+    flushRemoteInput() {
+        this.remoteFlushPending = false;
+        this.takePendingMotion();
+        if (!this.remoteEvents.length || !this.remoteControlActive) {
+            this.remoteEvents = [];
+            return;
+        }
         this.socket.emit('remote_input', {
             client_id: this.selectedClient,
-            type: 'key',
-            key: e.key,
-            keyCode: e.keyCode,
-            ctrlKey: e.ctrlKey,
-            altKey: e.altKey,
-            shiftKey: e.shiftKey
+            events: this.remoteEvents
         });
+        this.remoteEvents = [];
+    }
+
+    // Nothing stays pressed on the student's machine when focus leaves
+    releaseRemoteInput() {
+        if (!this.remoteHeld.size) return;
+        this.remoteHeld.forEach(event => this.remoteEvents.push(event));
+        this.remoteHeld.clear();
+        this.flushRemoteInput();
     }
 
     showClientFileManager(clientId) {
@@ -343,16 +879,168 @@ class ClassroomManager {
         this.loadDirectory('C:\\');
     }
 
+    // Listings arrive a page at a time, already sorted by the client
     loadDirectory(path) {
         document.getElementById('currentPath').value = path;
+        this.cancelSearch();
+        document.getElementById('fileList').innerHTML = '';
+        document.getElementById('fileStatus').textContent = 'Loading...';
 
         this.socket.emit('file_operation', {
             client_id: this.selectedClient,
             operation: 'list',
-            path: path
+            path: path,
+            sort: this.fileSort,
+            reverse: this.fileSort !== 'name'
         });
     }
 
+    navigateToPath() {
+        this.loadDirectory(document.getElementById('currentPath').value);
+    }
+
+    joinPath(directory, name) {
+        const separator = directory.includes('/') && !directory.includes('\\') ? '/' : '\\';
+        return directory.endsWith(separator) ? directory + name : directory + separator + name;
+    }
+
+    parentPath(path) {
+        const trimmed = path.replace(/[\\/]+$/, '');
+        const index = Math.max(trimmed.lastIndexOf('\\'), trimmed.lastIndexOf('/'));
+        if (index < 0) return path;
+        const parent = trimmed.slice(0, index + 1);
+        return /^[A-Za-z]:\\$/.test(parent) || parent === '/' ? parent : parent.replace(/[\\/]$/, '') || parent;
+    }
+
+    formatSize(size) {
+        if (size === null || size === undefined) return '';
+        const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+        let unit = 0;
+        while (size >= 1024 && unit < units.length - 1) {
+            size /= 1024;
+            unit++;
+        }
+        return `${size.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+    }
+
+    handleFileManager(data) {
+        if (!this.fileManagerActive || data.client_id !== this.selectedClient) return;
+
+        if (data.error) {
+            document.getElementById('fileStatus').textContent = `Error: ${data.error}`;
+        } else if (data.operation === 'list') {
+            this.renderFilePage(data);
+        } else if (data.operation === 'search') {
+            this.renderSearchResults(data);
+        }
+    }
+
+    createFileItem(entry, path, label = entry.name) {
+        const item = document.createElement('div');
+        item.className = 'file-item';
+        item.innerHTML = `
+            <span class="file-icon">${entry.is_dir ? '📁' : '📄'}</span>
+            <span class="file-name"></span>
+            <span class="file-size">${entry.is_dir ? '' : this.formatSize(entry.size)}</span>
+        `;
+        item.querySelector('.file-name').textContent = label;
+        item.dataset.path = path;
+        item.addEventListener('click', () => {
+            if (entry.is_dir) {
+                this.loadDirectory(path);
+            } else {
+                item.classList.toggle('selected');
+            }
+        });
+        return item;
+    }
+
+    renderFilePage(data) {
+        const fileList = document.getElementById('fileList');
+        const directory = document.getElementById('currentPath').value;
+
+        if (data.offset === 0) {
+            fileList.innerHTML = '';
+            const parent = this.parentPath(directory);
+            if (parent !== directory) {
+                fileList.appendChild(this.createFileItem({ name: '..', is_dir: true }, parent));
+            }
+        }
+        fileList.querySelectorAll('.load-more').forEach(button => button.remove());
+
+        data.entries.forEach(entry => {
+            fileList.appendChild(this.createFileItem(entry, this.joinPath(directory, entry.name)));
+        });
+
+        const shown = data.offset + data.entries.length;
+        document.getElementById('fileStatus').textContent = `${shown} of ${data.total} items`;
+        if (!data.done) {
+            const more = document.createElement('button');
+            more.className = 'load-more';
+            more.textContent = `Load more (${data.total - shown} remaining)`;
+            more.addEventListener('click', () => {
+                more.disabled = true;
+                this.socket.emit('file_operation', {
+                    client_id: this.selectedClient,
+                    operation: 'list_more',
+                    cursor: data.cursor,
+                    offset: shown
+                });
+            });
+            fileList.appendChild(more);
+        }
+    }
+
+    // Matches stream in while the client walks the tree
+    startSearch() {
+        const pattern = document.getElementById('searchPattern').value.trim();
+        if (!pattern) return;
+        this.cancelSearch();
+
+        this.searchId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        this.searchMatches = 0;
+        document.getElementById('fileList').innerHTML = '';
+        document.getElementById('fileStatus').textContent = 'Searching...';
+
+        this.socket.emit('file_operation', {
+            client_id: this.selectedClient,
+            operation: 'search',
+            path: document.getElementById('currentPath').value,
+            pattern: pattern,
+            search_id: this.searchId
+        });
+    }
+
+    cancelSearch() {
+        if (!this.searchId) return;
+        this.socket.emit('file_operation', {
+            client_id: this.selectedClient,
+            operation: 'cancel_search',
+            search_id: this.searchId
+        });
+        this.searchId = null;
+        document.getElementById('fileStatus').textContent += ' (stopped)';
+    }
+
+    renderSearchResults(data) {
+        if (data.search_id !== this.searchId) return;
+
+        const fileList = document.getElementById('fileList');
+        data.matches.forEach(entry => {
+            fileList.appendChild(this.createFileItem(entry, entry.path, entry.path));
+        });
+        this.searchMatches += data.matches.length;
+
+        let status = `${this.searchMatches} matches, ${data.scanned} items scanned`;
+        if (data.done) {
+            this.searchId = null;
+            if (data.truncated) status += ' (result limit reached)';
+        } else {
+            status = `Searching... ${status}`;
+        }
+        document.getElementById('fileStatus').textContent = status;
+    }
+
     showPowerMenu(clientId) {
         const actions = ['shutdown', 'restart', 'logoff', 'hibernate'];
         const action = prompt('Select power action:\n' + actions.join(', '));
@@ -365,39 +1053,276 @@ class ClassroomManager {
         }
     }
 
-    executeProgram(clientId) {
+    // Files go to the server over HTTP once and are streamed from there to
+    // each client in chunks
+    chooseFile(accept, onUploaded) {
         const input = document.createElement('input');
         input.type = 'file';
-        input.accept = '.exe';
+        if (accept) input.accept = accept;
 
         input.onchange = (e) => {
             const file = e.target.files[0];
-            if (file) {
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    const base64Data = e.target.result.split(',')[1];
+            if (!file) return;
+
+            const form = new FormData();
+            form.append('file', file);
+            fetch('/api/upload', { method: 'POST', body: form })
+                .then(response => response.json())
+                .then(upload => {
+                    if (upload.error) throw new Error(upload.error);
+                    onUploaded(upload);
+                })
+                .catch(error => this.showNotification(`Upload failed: ${error.message}`));
+        };
+
+        input.click();
+    }
 
-                    this.socket.emit('execute_program', {
+    executeProgram(clientId) {
+        this.chooseFile('.exe', (upload) => {
+            this.socket.emit('execute_program', {
+                client_id: clientId,
+                program_data: {
+                    filename: upload.filename,
+                    upload_id: upload.upload_id,
+                    silent: confirm('Run silently?')
+                }
+            });
+        });
+    }
+
+    uploadFile() {
+        const clientId = this.selectedClient;
+        const path = document.getElementById('currentPath').value;
+        this.chooseFile(null, (upload) => {
+            this.socket.emit('upload_file', {
+                client_id: clientId,
+                upload_id: upload.upload_id,
+                path: path
+            });
+        });
+    }
+
+    // A folder is sent as a tar built from the selected files; the Blob only
+    // references them, so the browser does not load the folder into memory
+    uploadFolder() {
+        const clientId = this.selectedClient;
+        const path = document.getElementById('currentPath').value;
+        const input = document.createElement('input');
+        input.type = 'file';
+        input.webkitdirectory = true;
+
+        input.onchange = (e) => {
+            const files = Array.from(e.target.files);
+            if (!files.length) return;
+            const folder = files[0].webkitRelativePath.split('/')[0];
+
+            const form = new FormData();
+            form.append('file', this.buildTar(files), `${folder}.tar`);
+            fetch('/api/upload', { method: 'POST', body: form })
+                .then(response => response.json())
+                .then(upload => {
+                    if (upload.error) throw new Error(upload.error);
+                    // The client unpacks the tar while it is still arriving
+                    this.socket.emit('upload_file', {
                         client_id: clientId,
-                        program_data: {
-                            filename: file.name,
-                            data: base64Data,
-                            silent: confirm('Run silently?')
-                        }
+                        upload_id: upload.upload_id,
+                        path: path,
+                        extract: true
                     });
-                };
-                reader.readAsDataURL(file);
-            }
+                })
+                .catch(error => this.showNotification(`Upload failed: ${error.message}`));
         };
 
         input.click();
     }
 
+    buildTar(files) {
+        const parts = [];
+        files.forEach(file => {
+            parts.push(this.tarHeader(file.webkitRelativePath, file.size, file.lastModified));
+            parts.push(file);
+            const padding = (512 - file.size % 512) % 512;
+            if (padding) parts.push(new Uint8Array(padding));
+        });
+        parts.push(new Uint8Array(1024));
+        return new Blob(parts, { type: 'application/x-tar' });
+    }
+
+    tarHeader(path, size, modified) {
+        const header = new Uint8Array(512);
+        const encoder = new TextEncoder();
+        const write = (text, offset, length) => header.set(encoder.encode(text).slice(0, length), offset);
+        const octal = (value, length) => Math.floor(value).toString(8).padStart(length - 1, '0');
+
+        // ustar keeps up to 155 characters of the directory in a separate prefix
+        let name = path;
+        let prefix = '';
+        for (let i = path.indexOf('/'); name.length > 100 && i >= 0; i = path.indexOf('/', i + 1)) {
+            if (i <= 155 && path.length - i - 1 <= 100) {
+                prefix = path.slice(0, i);
+                name = path.slice(i + 1);
+            }
+        }
+
+        write(name, 0, 100);
+        write('0000644', 100, 8);
+        write('0000000', 108, 8);
+        write('0000000', 116, 8);
+        write(octal(size, 12), 124, 12);
+        write(octal(modified / 1000, 12), 136, 12);
+        write('        ', 148, 8);
+        write('0', 156, 1);
+        write('ustar', 257, 6);
+        write('00', 263, 2);
+        write(prefix, 345, 155);
+
+        const checksum = header.reduce((sum, byte) => sum + byte, 0);
+        write(octal(checksum, 7) + '\0 ', 148, 8);
+        return header;
+    }
+
+    // Each client zips the folder while sending it; the server stores one
+    // archive per client and offers them singly or all together
+    collectFolder(target, path) {
+        if (!target || !path) return;
+        this.socket.emit('collect_folder', { target: target, path: path });
+    }
+
+    startCollection(data) {
+        if (data.error) {
+            this.showNotification(`Collect failed: ${data.error}`);
+            return;
+        }
+        this.collections.set(data.collection_id, {
+            path: data.path,
+            single: !(data.target === 'all' || data.target.startsWith('group:')),
+            clients: data.clients
+        });
+        const count = Object.keys(data.clients).length;
+        this.showNotification(`Collecting ${data.path} from ${count} client${count === 1 ? '' : 's'}...`);
+    }
+
+    updateCollection(progress) {
+        const collection = this.collections.get(progress.collection_id);
+        if (!collection) return;
+        collection.clients[progress.client_id] = progress;
+
+        const client = this.clients.get(progress.client_id);
+        const element = document.getElementById(`transfer-${progress.client_id}`);
+        if (element) {
+            const status = progress.status === 'error' ? 'failed' :
+                progress.status === 'complete' ? 'collected' : this.formatSize(progress.bytes);
+            element.textContent = `Folder: ${status}`;
+        }
+        if (progress.status === 'error' && client) {
+            this.showNotification(`${client.info.hostname}: ${progress.error}`);
+        }
+        if (!progress.finished) return;
+
+        this.collections.delete(progress.collection_id);
+        const states = Object.entries(collection.clients);
+        const complete = states.filter(([, state]) => state.status === 'complete');
+        if (!complete.length) return;
+        if (collection.single) {
+            window.location.href = `/api/collections/${progress.collection_id}/${complete[0][0]}`;
+        } else {
+            this.showNotification(`${collection.path}: collected from ${complete.length} of ${states.length} clients`);
+            window.location.href = `/api/collections/${progress.collection_id}/all`;
+        }
+    }
+
+    transferText(transfer) {
+        if (!transfer) return '';
+        if (transfer.status === 'complete') {
+            return `${transfer.filename}: done${transfer.cached ? ' (cached)' : ''}`;
+        }
+        if (transfer.status === 'error') return `${transfer.filename || 'Transfer'}: failed`;
+        const percent = transfer.size ? Math.floor(transfer.acked * 100 / transfer.size) : 0;
+        const paused = transfer.status === 'interrupted' ? ' (paused)' : '';
+        return `${transfer.filename}: ${percent}%${paused}`;
+    }
+
+    updateTransferProgress(transfer) {
+        const client = this.clients.get(transfer.client_id);
+        if (!client) return;
+
+        client.transfer = transfer;
+        const element = document.getElementById(`transfer-${transfer.client_id}`);
+        if (element) {
+            element.textContent = this.transferText(transfer);
+        }
+        if (transfer.status === 'complete') {
+            this.showNotification(`${transfer.filename} delivered to ${client.info.hostname}`);
+        }
+    }
+
+    // Toolbar commands go to everyone or to a named group of clients
+    commandTarget() {
+        return document.getElementById('targetSelect').value;
+    }
+
+    loadGroups() {
+        fetch('/api/groups')
+            .then(response => response.json())
+            .then(groups => this.renderGroups(groups));
+    }
+
+    renderGroups(groups) {
+        const select = document.getElementById('targetSelect');
+        const current = select.value;
+        select.innerHTML = '<option value="all">All clients</option>';
+        Object.entries(groups).forEach(([name, members]) => {
+            const option = document.createElement('option');
+            option.value = `group:${name}`;
+            option.textContent = `${name} (${members.length})`;
+            select.appendChild(option);
+        });
+        select.value = Array.from(select.options).some(o => o.value === current) ? current : 'all';
+    }
+
+    createGroup() {
+        const name = prompt('Group name (e.g. Row 1, Lab B):');
+        if (!name) return;
+        const hostnames = prompt('Hostnames in this group, separated by commas (empty deletes the group):');
+        if (hostnames === null) return;
+
+        const wanted = hostnames.split(',').map(h => h.trim().toLowerCase()).filter(h => h);
+        const matched = Array.from(this.clients.values())
+            .filter(client => wanted.includes(client.info.hostname.toLowerCase()));
+        const clientIds = matched.map(client => client.id);
+
+        // A typo must not wipe the group; only an empty list deletes it
+        const known = new Set(matched.map(client => client.info.hostname.toLowerCase()));
+        const unknown = wanted.filter(hostname => !known.has(hostname));
+        if (unknown.length) {
+            alert(`Unknown hostnames, group "${name}" was not changed: ${unknown.join(', ')}`);
+            return;
+        }
+
+        fetch(`/api/groups/${encodeURIComponent(name)}`, {
+            method: wanted.length ? 'PUT' : 'DELETE',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ client_ids: clientIds })
+        })
+            .then(response => response.json())
+            .then(groups => this.renderGroups(groups));
+    }
+
+    showCommandResult(result) {
+        const failed = Object.keys(result.failed).length;
+        const command = result.command.replace(/_/g, ' ');
+        let text = `${command}: ${result.delivered.length} delivered`;
+        if (failed) text += `, ${failed} failed`;
+        if (result.timed_out.length) text += `, ${result.timed_out.length} timed out`;
+        this.showNotification(`${text} (${result.elapsed_ms} ms)`);
+    }
+
     showPowerControlModal() {
         const action = prompt('Enter power action (shutdown/restart/logoff/hibernate):');
         if (action) {
             this.socket.emit('power_control', {
-                client_id: 'all',
+                client_id: this.commandTarget(),
                 action: action
             });
         }
@@ -408,7 +1333,7 @@ class ClassroomManager {
     }
 
     refreshClients() {
-        this.socket.emit('refresh_clients');
+        this.syncClients(true);
     }
 
     hideModal(modalId) {
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from shared.config import Config
+from shared.protocol import Message, MessageType
+from shared.transfer import read_chunk
+
+def chunk_hashes(path: str, chunk_size: int) -> List[str]:
+    """SHA-256 of every chunk of a file"""
+    hashes = []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hashes.append(hashlib.sha256(chunk).hexdigest())
+    return hashes
+
+class Swarm:
+    """One file being distributed to a group of clients"""
+
+    def __init__(self, path: str, info: dict, sha256: str, targets: Set[str]):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.info = info
+        self.sha256 = sha256
+        self.size = os.path.getsize(path)
+        self.chunk_size = Config.SWARM_CHUNK_SIZE
+        self.hashes: List[str] = []
+        self.targets = set(targets)
+        self.have: Dict[str, Set[int]] = {client_id: set() for client_id in targets}
+        self.status: Dict[str, str] = {client_id: 'pending' for client_id in targets}
+        self.cached: Set[str] = set()
+        self.last_progress: Dict[str, float] = {}
+        self.deadline = time.monotonic() + Config.SWARM_DEADLINE
+
+    def manifest(self) -> dict:
+        return dict(self.info, swarm_id=self.id, size=self.size, sha256=self.sha256,
+                    chunk_size=self.chunk_size, hashes=self.hashes)
+
+    def progress(self, client_id: str) -> dict:
+        return {
+            'transfer_id': self.id,
+            'client_id': client_id,
+            'filename': self.info.get('filename'),
+            'purpose': self.info.get('purpose'),
+            'size': self.size,
+            'acked': min(self.size, len(self.have[client_id]) * self.chunk_size),
+            'status': self.status[client_id],
+            'cached': client_id in self.cached
+        }
+
+    @property
+    def finished(self) -> bool:
+        return all(status in ('complete', 'error') for status in self.status.values())
+
+class SwarmCoordinator:
+    """
+    Distributes one file to many clients with the clients' help.
+
+    The server sends every chunk to only Config.SWARM_SEEDS students;
+    students fetch the rest from each other over the LAN and verify each
+    chunk against the hash list in the manifest. A student that makes no
+    progress from its peers asks the server for the chunks it misses, so
+    the swarm still completes when peers cannot reach each other.
+
+    Peers learn about each other through the discovery service, which asks
+    peers() for the addresses of a swarm's members. All other methods run
+    on the WebSocket event loop.
+    """
+
+    def __init__(self, send: Callable[[str, Message], Awaitable],
+                 address: Callable[[str], Optional[Tuple[str, int]]],
+                 on_progress: Callable[[dict], None] = None):
+        self.send = send
+        self.address = address
+        self.on_progress = on_progress
+        self.swarms: Dict[str, Swarm] = {}
+        self.online: Set[str] = set()
+
+    async def start(self, client_ids, path: str, info: dict, sha256: str) -> Swarm:
+        swarm = Swarm(path, info, sha256, client_ids)
+        loop = asyncio.get_running_loop()
+        swarm.hashes = await loop.run_in_executor(None, chunk_hashes, path, swarm.chunk_size)
+        self.swarms[swarm.id] = swarm
+        loop.call_later(Config.SWARM_DEADLINE, self._expire, swarm)
+
+        for client_id in swarm.targets:
+            await self._offer(swarm, client_id)
+        await self._seed(swarm)
+        return swarm
+
+    def peers(self, swarm_id: str) -> List[dict]:
+        """Connected members of a swarm and where they serve chunks"""
+        swarm = self.swarms.get(swarm_id)
+        if not swarm:
+            return []
+        peers = []
+        for client_id in list(swarm.targets):
+            address = self.address(client_id) if client_id in self.online else None
+            if address and swarm.status.get(client_id) != 'error':
+                peers.append({'client_id': client_id, 'host': address[0], 'port': address[1]})
+        return peers
+
+    def peer_connected(self, client_id: str):
+        self.online.add(client_id)
+        for swarm in list(self.swarms.values()):
+            if client_id in swarm.targets and swarm.status[client_id] not in ('complete', 'error'):
+                asyncio.create_task(self._offer(swarm, client_id))
+
+    def peer_disconnected(self, client_id: str):
+        self.online.discard(client_id)
+        for swarm in list(self.swarms.values()):
+            if client_id in swarm.targets and swarm.status[client_id] not in ('complete', 'error'):
+                if time.monotonic() < swarm.deadline:
+                    swarm.status[client_id] = 'interrupted'
+                    self._progress(swarm, client_id, force=True)
+                else:
+                    self._fail(swarm, client_id, 'Disconnected after the swarm deadline')
+                self._drop_if_finished(swarm)
+
+    def handle_have(self, client_id: str, data: dict):
+        swarm = self.swarms.get(data.get('swarm_id'))
+        if not swarm or client_id not in swarm.targets:
+            return
+        swarm.have[client_id].add(data.get('index'))
+        swarm.status[client_id] = 'sending'
+        self._progress(swarm, client_id)
+
+    def handle_request(self, client_id: str, data: dict):
+        """A student could not get these chunks from its peers"""
+        swarm = self.swarms.get(data.get('swarm_id'))
+        if not swarm or client_id not in swarm.targets:
+            return
+        for index in data.get('indexes', []):
+            if 0 <= index < len(swarm.hashes):
+                asyncio.create_task(self._send_chunk(swarm, client_id, index))
+
+    def handle_complete(self, client_id: str, data: dict):
+        swarm = self.swarms.get(data.get('swarm_id'))
+        if not swarm or client_id not in swarm.targets:
+            return
+        if data.get('status') == 'success':
+            swarm.status[client_id] = 'complete'
+            swarm.have[client_id] = set(range(len(swarm.hashes)))
+            if data.get('cached'):
+                swarm.cached.add(client_id)
+            self._progress(swarm, client_id, force=True)
+        else:
+            self._fail(swarm, client_id, data.get('message'))
+        self._drop_if_finished(swarm)
+
+    def _expire(self, swarm: Swarm):
+        """Deadline passed: members still away will not get the file from this swarm"""
+        if swarm.id not in self.swarms:
+            return
+        for client_id, status in list(swarm.status.items()):
+            if status == 'interrupted':
+                self._fail(swarm, client_id, 'Not back before the swarm deadline')
+        self._drop_if_finished(swarm)
+
+    def _fail(self, swarm: Swarm, client_id: str, reason: str):
+        swarm.status[client_id] = 'error'
+        print(f"Swarm {swarm.id} failed on {client_id}: {reason}")
+        self._progress(swarm, client_id, force=True)
+
+    def _drop_if_finished(self, swarm: Swarm):
+        if swarm.finished and swarm.id in self.swarms:
+            # Students keep serving for a while; nobody needs them any more
+            del self.swarms[swarm.id]
+
+    async def _offer(self, swarm: Swarm, client_id: str):
+        swarm.status[client_id] = 'offered'
+        try:
+            await self.send(client_id, Message(MessageType.SWARM_START, swarm.manifest()))
+        except Exception as e:
+            print(f"Swarm {swarm.id} offer to {client_id} failed: {e}")
+        self._progress(swarm, client_id, force=True)
+
+    async def _seed(self, swarm: Swarm):
+        """Send every chunk to a few students, rotating who gets which"""
+        for index in range(len(swarm.hashes)):
+            if swarm.id not in self.swarms:
+                return
+            candidates = sorted(client_id for client_id in swarm.targets
+                                if client_id in self.online
+                                and swarm.status[client_id] not in ('complete', 'error'))
+            holders = sum(1 for have in swarm.have.values() if index in have)
+            missing = [client_id for client_id in candidates if index not in swarm.have[client_id]]
+            if not missing or holders >= Config.SWARM_SEEDS:
+                continue
+
+            start = index * Config.SWARM_SEEDS % len(missing)
+            rotation = missing[start:] + missing[:start]
+            for client_id in rotation[:Config.SWARM_SEEDS - holders]:
+                await self._send_chunk(swarm, client_id, index)
+
+    async def _send_chunk(self, swarm: Swarm, client_id: str, index: int):
+        loop = asyncio.get_running_loop()
+        chunk = await loop.run_in_executor(None, read_chunk, swarm.path,
+                                           index * swarm.chunk_size, swarm.chunk_size)
+        message = Message(MessageType.SWARM_CHUNK, {'swarm_id': swarm.id, 'index': index},
+                          payload=chunk)
+        try:
+            await self.send(client_id, message)
+        except Exception as e:
+            print(f"Swarm {swarm.id} chunk {index} to {client_id} failed: {e}")
+
+    def _progress(self, swarm: Swarm, client_id: str, force: bool = False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - swarm.last_progress.get(client_id, 0) < Config.TRANSFER_PROGRESS_INTERVAL:
+            return
+        swarm.last_progress[client_id] = now
+        self.on_progress(swarm.progress(client_id))
@@ -0,0 +1,81 @@
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict
+
+from PIL import Image
+
+from shared.config import Config
+
+def make_thumbnail(image_data: bytes, size: tuple, quality: int) -> bytes:
+    """Decode a screenshot, shrink it and re-encode it as JPEG"""
+    image = Image.open(io.BytesIO(image_data))
+    # Let the JPEG decoder downscale in DCT space before the real resize
+    image.draft('RGB', size)
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+class Thumbnailer:
+    """
+    Generates dashboard thumbnails on a process pool.
+
+    Each client has at most one frame being processed and one waiting slot.
+    A frame arriving while the slot is taken replaces the waiting frame, so
+    slow workers drop stale frames instead of building a backlog.
+    """
+
+    def __init__(self, on_thumbnail: Callable[[str, bytes], None], workers: int = None):
+        self.on_thumbnail = on_thumbnail
+        self.size = tuple(Config.THUMBNAIL_SIZE)
+        self.executor = ProcessPoolExecutor(max_workers=workers or Config.THUMBNAIL_WORKERS)
+        self.lock = threading.Lock()
+        self.busy = set()
+        self.pending: Dict[str, bytes] = {}
+        self.dropped = 0
+        self.stopped = False
+
+    def submit(self, client_id: str, image_data: bytes):
+        """Queue a frame for thumbnailing, replacing any frame still waiting"""
+        with self.lock:
+            if self.stopped:
+                return
+            if client_id in self.busy:
+                if client_id in self.pending:
+                    self.dropped += 1
+                self.pending[client_id] = image_data
+                return
+            self.busy.add(client_id)
+        self._start(client_id, image_data)
+
+    def _start(self, client_id: str, image_data: bytes):
+        future = self.executor.submit(make_thumbnail, image_data, self.size,
+                                      Config.SCREENSHOT_QUALITY)
+        future.add_done_callback(lambda f: self._done(client_id, f))
+
+    def _done(self, client_id: str, future):
+        try:
+            self.on_thumbnail(client_id, future.result())
+        except Exception as e:
+            print(f"Thumbnail error for {client_id}: {e}")
+
+        with self.lock:
+            image_data = self.pending.pop(client_id, None)
+            if image_data is None:
+                self.busy.discard(client_id)
+                return
+        self._start(client_id, image_data)
+
+    def discard(self, client_id: str):
+        """Drop any waiting frame for a client"""
+        with self.lock:
+            self.pending.pop(client_id, None)
+
+    def shutdown(self):
+        """Stop the workers, frames still waiting are dropped"""
+        with self.lock:
+            self.stopped = True
+            self.pending.clear()
+        self.executor.shutdown(wait=False)
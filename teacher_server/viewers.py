@@ -0,0 +1,114 @@
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from shared.protocol import CAPTURE_PAUSED, CAPTURE_THUMBNAIL, CAPTURE_FULL
+
+def room(kind: str, client_id: str) -> str:
+    """Socket.IO room of the dashboards subscribed to one kind of stream from a client"""
+    return f"{kind}:{client_id}"
+
+def capture_region(region) -> Optional[dict]:
+    """Validated {'monitor': n, 'rect': [x, y, w, h]} from a dashboard, None for the whole screen"""
+    if not isinstance(region, dict):
+        return None
+    try:
+        result = {'monitor': max(0, int(region.get('monitor', 0)))}
+        rect = region.get('rect')
+        if rect:
+            x, y, w, h = (min(max(float(v), 0.0), 1.0) for v in rect)
+            w, h = min(w, 1.0 - x), min(h, 1.0 - y)
+            if w > 0.01 and h > 0.01:
+                result['rect'] = [round(v, 4) for v in (x, y, w, h)]
+    except (TypeError, ValueError):
+        return None
+    return result
+
+class ViewerRegistry:
+    """
+    Tracks which dashboards are connected and which clients they show.
+
+    A dashboard that has not reported its visible clients yet is assumed to
+    show all of them, so dashboards that never report still get thumbnails.
+    Dashboards with a large view or a remote-control session open are also
+    in the matching Socket.IO room, so full-size frames only go to them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.visible: Dict[str, Optional[Set[str]]] = {}  # sid -> client ids, None = all
+        self.views: Dict[str, Set[str]] = {}  # sid -> clients shown in the large view
+        self.regions: Dict[str, dict] = {}  # client id -> monitor or rectangle zoomed into
+        self.controllers: Dict[str, Set[str]] = {}  # client id -> sids in remote control
+
+    def add(self, sid: str):
+        with self.lock:
+            self.visible[sid] = None
+            self.views[sid] = set()
+
+    def remove(self, sid: str) -> Tuple[Set[str], Set[str]]:
+        """Forget a dashboard, returns the clients it viewed and the ones it controlled"""
+        with self.lock:
+            self.visible.pop(sid, None)
+            controlled = {client_id for client_id, sids in self.controllers.items() if sid in sids}
+            return self.views.pop(sid, None) or set(), controlled
+
+    def start_control(self, sid: str, client_id: str):
+        with self.lock:
+            self.controllers.setdefault(client_id, set()).add(sid)
+
+    def stop_control(self, sid: str, client_id: str) -> bool:
+        """End one dashboard's session, True when nobody controls the client any more"""
+        with self.lock:
+            sids = self.controllers.get(client_id, set())
+            sids.discard(sid)
+            if sids:
+                return False
+            self.controllers.pop(client_id, None)
+            return True
+
+    def connected(self, sid: str) -> bool:
+        with self.lock:
+            return sid in self.visible
+
+    def dashboards(self) -> Dict[str, Optional[Set[str]]]:
+        """Connected dashboards and the clients in their grid, None for all"""
+        with self.lock:
+            return {sid: None if visible is None else set(visible)
+                    for sid, visible in self.visible.items()}
+
+    def set_visible(self, sid: str, client_ids: Iterable[str]):
+        with self.lock:
+            if sid in self.visible:
+                self.visible[sid] = set(client_ids)
+
+    def open_view(self, sid: str, client_id: str):
+        with self.lock:
+            self.views.setdefault(sid, set()).add(client_id)
+
+    def close_view(self, sid: str, client_id: str):
+        with self.lock:
+            self.views.get(sid, set()).discard(client_id)
+
+    def set_region(self, client_id: str, region: Optional[dict]):
+        with self.lock:
+            if region:
+                self.regions[client_id] = region
+            else:
+                self.regions.pop(client_id, None)
+
+    def region(self, client_id: str) -> Optional[dict]:
+        with self.lock:
+            return self.regions.get(client_id)
+
+    def is_viewed(self, client_id: str) -> bool:
+        with self.lock:
+            return any(client_id in views for views in self.views.values())
+
+    def capture_mode(self, client_id: str) -> str:
+        """How much capturing the dashboards currently need from a client"""
+        with self.lock:
+            if any(client_id in views for views in self.views.values()):
+                return CAPTURE_FULL
+            if any(visible is None or client_id in visible for visible in self.visible.values()):
+                return CAPTURE_THUMBNAIL
+            return CAPTURE_PAUSED
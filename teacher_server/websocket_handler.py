@@ -5,16 +5,33 @@ import websockets
 import json
 import threading
 import traceback # Import traceback for detailed error logging
-from typing import Dict
+from typing import Dict, Set
 
 from shared.config import Config
-from shared.protocol import Message, MessageType
+from shared.protocol import (Message, MessageType, CAPABILITY_BINARY,
+                             CAPABILITY_TRANSFER, CAPABILITY_SWARM, FLAG_REMOTE_CONTROL, FLAG_DELTA,
+                             FLAG_THUMBNAIL, FragmentAssembler)
+from shared.scheduler import SendScheduler, priority_for
+from shared.transfer import TransferSender
 from shared.utils import get_local_ip
+from teacher_server.swarm import SwarmCoordinator
+from teacher_server.broadcast import Broadcaster
+from teacher_server.collector import FolderCollector
+from teacher_server.ingest import IngestPool, accept_registration, receive_registration
 
 class WebSocketHandler:
     def __init__(self, teacher_server):
         self.teacher_server = teacher_server
-        self.clients: Dict[str, websockets.WebSocketServerProtocol] = {}
+        # client_id -> its connection, a websocket or a connection held by an ingest worker
+        self.clients: Dict[str, object] = {}
+        self.capabilities: Dict[str, Set[str]] = {}
+        self.schedulers: Dict[str, SendScheduler] = {}
+        self.transfers = TransferSender(self.send_message, teacher_server.transfer_progress)
+        self.swarms = SwarmCoordinator(self.send_message, teacher_server.swarm_address,
+                                       teacher_server.transfer_progress)
+        self.broadcaster = Broadcaster(self)
+        self.collector = FolderCollector(teacher_server.collection_progress)
+        self.ingest = None
         self.loop = None
 
     def start_in_thread(self):
@@ -34,8 +51,20 @@ class WebSocketHandler:
             self.loop.close()
             print("WebSocket server loop closed.")
 
+    async def serve(self):
+        """Accept clients on the running loop, which the dashboards may share in async mode"""
+        self.loop = asyncio.get_running_loop()
+        await self._start_server()
+
     async def _start_server(self):
         """The main async method that starts the websockets server."""
+        if Config.INGEST_WORKERS:
+            if IngestPool.supported():
+                self.ingest = IngestPool(self, Config.INGEST_WORKERS)
+                await self.ingest.run()
+                return
+            print("SO_REUSEPORT is not available here, accepting clients in this process")
+
         async with websockets.serve(
             self.handle_client,
             Config.SERVER_HOST,
@@ -48,26 +77,30 @@ class WebSocketHandler:
     async def handle_client(self, websocket):
         """Handles an individual client connection."""
         client_id = None
+        scheduler = None
         try:
-            message_json = await websocket.recv()
-            msg = Message.from_json(message_json)
+            msg = await receive_registration(websocket)
 
-            if msg.type == MessageType.CLIENT_REGISTER:
+            if msg is not None:
                 client_id = msg.client_id
-                self.clients[client_id] = websocket
-                self.loop.call_soon_threadsafe(
-                    self.teacher_server.register_client, client_id, msg.data
-                )
-                response = Message(MessageType.SUCCESS, {'message': 'Registration successful'})
-                await websocket.send(response.to_json())
-                print(f"Client registered: {client_id}")
+                capabilities, scheduler = accept_registration(websocket, msg)
+                self.client_connected(client_id, msg.data, capabilities, scheduler, websocket)
             else:
                 print("Connection closed: First message was not a registration.")
                 return
 
+            assembler = FragmentAssembler()
             async for message in websocket:
-                msg = Message.from_json(message)
-                self.loop.call_soon_threadsafe(self.handle_message, msg)
+                message = assembler.feed(message)
+                if message is None:
+                    continue
+                try:
+                    msg = Message.decode(message)
+                except ValueError as e:
+                    print(f"Dropping malformed message from {client_id}: {e}")
+                    continue
+                # Already on the loop, no need to go through call_soon
+                self.handle_message(msg)
 
         except websockets.exceptions.ConnectionClosed:
             if client_id:
@@ -75,12 +108,41 @@ class WebSocketHandler:
         except Exception as e:
             print(f"Error in handle_client for {client_id}: {e}")
         finally:
-            if client_id and client_id in self.clients:
-                del self.clients[client_id]
-                self.loop.call_soon_threadsafe(
-                    self.teacher_server.update_client_status, client_id, 'offline'
-                )
-                print(f"Client {client_id} unregistered.")
+            if scheduler:
+                scheduler.stop()
+            if client_id:
+                self.client_disconnected(client_id, websocket)
+
+    def client_connected(self, client_id: str, data: dict, capabilities: Set[str],
+                         scheduler, connection):
+        """A client registered, on this loop or in an ingest worker"""
+        self.clients[client_id] = connection
+        self.capabilities[client_id] = capabilities
+        self.schedulers[client_id] = scheduler
+        self.loop.call_soon(
+            self.teacher_server.register_client, client_id, data
+        )
+        if CAPABILITY_TRANSFER in capabilities:
+            self.transfers.peer_connected(client_id)
+        if CAPABILITY_SWARM in capabilities:
+            self.swarms.peer_connected(client_id)
+        print(f"Client registered: {client_id} (capabilities: {sorted(capabilities)})")
+
+    def client_disconnected(self, client_id: str, connection):
+        # A reconnect may already have replaced this connection
+        if self.clients.get(client_id) is not connection:
+            return
+        del self.clients[client_id]
+        self.capabilities.pop(client_id, None)
+        self.schedulers.pop(client_id, None)
+        self.transfers.peer_disconnected(client_id)
+        self.swarms.peer_disconnected(client_id)
+        self.collector.peer_disconnected(client_id)
+        self.teacher_server.cluster.relay_failed(client_id, 'Client disconnected')
+        self.loop.call_soon(
+            self.teacher_server.update_client_status, client_id, 'offline'
+        )
+        print(f"Client {client_id} unregistered.")
 
     def handle_message(self, msg: Message):
         """
@@ -89,22 +151,59 @@ class WebSocketHandler:
         try:
             if msg.type == MessageType.CLIENT_HEARTBEAT:
                 self.teacher_server.update_client_status(msg.client_id, 'online')
+                if 'capture_stats' in msg.data:
+                    self.teacher_server.update_capture_stats(msg.client_id, msg.data['capture_stats'])
 
             elif msg.type == MessageType.SCREENSHOT_RESPONSE:
-                # SALAH: self.teacher_server.handle_screenshot(msg.client_id, msg.data['screenshot'])
-                # BENAR: Teruskan seluruh objek data
-                self.teacher_server.handle_screenshot(msg.client_id, msg.data)
+                is_remote_control = bool(msg.flags & FLAG_REMOTE_CONTROL) or \
+                    msg.data.get('is_remote_control', False)
+                is_thumbnail = bool(msg.flags & FLAG_THUMBNAIL) or \
+                    msg.data.get('is_thumbnail', False)
+                frame_info = msg.data if msg.flags & FLAG_DELTA else None
+                self.teacher_server.handle_screenshot(msg.client_id, msg.payload,
+                                                      is_remote_control, frame_info,
+                                                      is_thumbnail, msg.data.get('changed', True))
+
+            elif msg.type == MessageType.REMOTE_SESSION_STATS:
+                self.teacher_server.update_remote_session(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.SCREEN_UNCHANGED:
+                self.teacher_server.handle_screen_unchanged(msg.client_id)
+
+            elif msg.type == MessageType.COMMAND_ACK:
+                self.broadcaster.handle_ack(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.TRANSFER_ACK:
+                self.transfers.handle_ack(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.TRANSFER_COMPLETE:
+                self.transfers.handle_complete(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.SWARM_HAVE:
+                self.swarms.handle_have(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.SWARM_REQUEST:
+                self.swarms.handle_request(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.SWARM_COMPLETE:
+                self.swarms.handle_complete(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.FILE_MANAGER:
+                self.teacher_server.file_manager_response(msg.client_id, msg.data)
+
+            elif msg.type == MessageType.FILE_DOWNLOAD:
+                # Folders asked for by another node go back there
+                if not self.teacher_server.cluster.relay_chunk(msg.client_id, msg.data, msg.payload):
+                    self.collector.handle_chunk(msg.client_id, msg.data, msg.payload)
 
             elif msg.type == MessageType.MESSAGE_REPLY:
-                from teacher_server.app import socketio
-                socketio.emit('message_reply', {
+                self.teacher_server.emit_dashboard('message_reply', {
                     'client_id': msg.client_id,
                     'message': msg.data['message']
                 })
 
             elif msg.type == MessageType.PROGRAM_RESULT:
-                from teacher_server.app import socketio
-                socketio.emit('program_result', {
+                self.teacher_server.emit_dashboard('program_result', {
                     'client_id': msg.client_id,
                     'result': msg.data
                 })
@@ -120,22 +219,100 @@ class WebSocketHandler:
             traceback.print_exc() # This provides a full, detailed traceback
             print(f"-------------------------------------------\n")
 
-    def send_to_client(self, client_id: str, message_type: MessageType, data: dict):
+    def on_loop(self) -> bool:
+        """Whether the caller runs on this handler's loop, as dashboards do in async mode"""
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def call(self, callback, *args):
+        """Run a callback on the loop, right away when already there"""
+        if self.on_loop():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def run(self, coroutine):
+        """Schedule a coroutine on the loop, returns a future of its result"""
+        if self.on_loop():
+            return asyncio.ensure_future(coroutine)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def has_capability(self, client_id: str, capability: str) -> bool:
+        return capability in self.capabilities.get(client_id, ())
+
+    def encode_for_client(self, client_id: str, message: Message):
+        """Encodes a message in the framing negotiated with the client."""
+        if self.has_capability(client_id, CAPABILITY_BINARY):
+            return message.to_binary()
+        return message.to_json()
+
+    async def send_message(self, client_id: str, message: Message):
+        """Sends a message from the server loop and waits until it is written."""
+        scheduler = self.schedulers.get(client_id)
+        if not scheduler:
+            raise ConnectionError(f"Client {client_id} is not connected")
+        message.client_id = client_id
+        await scheduler.put(self.encode_for_client(client_id, message), priority_for(message.type))
+
+    def start_transfer(self, client_id: str, path: str, info: dict, sha256: str = None):
+        """Starts streaming a file to a client in a thread-safe manner."""
+        if self.loop:
+            self.call(self.transfers.start, client_id, path, info, sha256)
+
+    def start_swarm(self, client_ids, path: str, info: dict, sha256: str):
+        """Starts distributing a file to many clients with their help."""
+        if self.loop:
+            self.run(self.swarms.start(client_ids, path, info, sha256))
+
+    def collect_folder(self, client_ids, path: str):
+        """
+        Asks clients to stream a folder back as a zip in a thread-safe manner.
+
+        Returns the collection and the future of the request's delivery.
+        """
+        collection = self.collector.start(path, client_ids)
+        # Clients on other nodes are asked by their node, which relays the chunks here
+        future = self.teacher_server.cluster.command(client_ids, MessageType.FILE_DOWNLOAD,
+                                                     {'download_id': collection.id, 'path': path})
+
+        def delivered(future):
+            try:
+                result = future.result()
+                failed = dict(result['failed'], **{client_id: 'No response'
+                                                    for client_id in result['timed_out']})
+            except Exception as e:
+                failed = {client_id: str(e) for client_id in collection.clients}
+            self.call(self.collector.fail_clients, collection.id, failed)
+
+        future.add_done_callback(delivered)
+        return collection, future
+
+    def send_to_client(self, client_id: str, message_type: MessageType, data: dict,
+                       payload: bytes = None) -> bool:
         """Sends a message to a specific client in a thread-safe manner."""
-        if client_id in self.clients and self.loop:
-            message = Message(message_type, data, client_id=client_id)
-            asyncio.run_coroutine_threadsafe(
-                self.clients[client_id].send(message.to_json()),
-                self.loop
-            )
-
-    def broadcast_message(self, message_type: MessageType, data: dict):
+        scheduler = self.schedulers.get(client_id)
+        if not scheduler or not self.loop:
+            print(f"Dropping {message_type.value} for {client_id}: client not connected")
+            return False
+        message = Message(message_type, data, client_id=client_id, payload=payload)
+        self.call(scheduler.put, self.encode_for_client(client_id, message), priority_for(message_type))
+        return True
+
+    def send_command(self, client_ids, message_type: MessageType, data: dict,
+                     payload: bytes = None, timeout: float = None):
+        """
+        Sends a command to several clients at once in a thread-safe manner.
+
+        Returns a concurrent future resolving to the delivered, failed and
+        timed out clients.
+        """
+        return self.run(self.broadcaster.send(client_ids, message_type, data, payload, timeout))
+
+    def broadcast_message(self, message_type: MessageType, data: dict,
+                          payload: bytes = None):
         """Broadcasts a message to all clients."""
         if not self.loop:
-            return
-        message = Message(message_type, data)
-        for websocket in self.clients.values():
-            asyncio.run_coroutine_threadsafe(
-                websocket.send(message.to_json()),
-                self.loop
-            )
\ No newline at end of file
+            return None
+        return self.send_command(list(self.schedulers), message_type, data, payload)